@@ -0,0 +1,135 @@
+"""
+Materialized ancestor closure table (dog_ancestry) for PedigreeDatabase
+
+Every dog gets one row per Ahnentafel position up to ANCESTRY_MAX_DEPTH, so
+ancestor, common-ancestor and descendant lookups become indexed range scans
+instead of recursive walks.
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import DogAncestry
+from pedigree_graph import ParentGraph, load_parent_graph
+
+ANCESTRY_MAX_DEPTH = int(os.getenv("ANCESTRY_MAX_DEPTH", "9"))
+INSERT_BATCH_SIZE = 5000
+
+
+def _ancestry_rows(graph: ParentGraph, dog_id: int, max_depth: int) -> List[dict]:
+    """Closure rows for one dog: itself at position 1, then every ancestor by Ahnentafel position"""
+    rows = [{"dog_id": dog_id, "position": 1, "ancestor_id": dog_id, "depth": 0}]
+    level = [(1, dog_id)]
+
+    for depth in range(1, max_depth + 1):
+        next_level = []
+        for position, current_id in level:
+            sire_id, dam_id = graph.parents(current_id)
+            if sire_id:
+                next_level.append((2 * position, sire_id))
+            if dam_id:
+                next_level.append((2 * position + 1, dam_id))
+        if not next_level:
+            break
+        rows.extend(
+            {"dog_id": dog_id, "position": position, "ancestor_id": ancestor_id, "depth": depth}
+            for position, ancestor_id in next_level
+        )
+        level = next_level
+
+    return rows
+
+
+def _write_ancestry(db: Session, graph: ParentGraph, dog_ids, max_depth: int) -> int:
+    """Insert closure rows for the given dogs in batches, committing each batch"""
+    batch = []
+    total = 0
+    for dog_id in dog_ids:
+        batch.extend(_ancestry_rows(graph, dog_id, max_depth))
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.execute(DogAncestry.__table__.insert(), batch)
+            db.commit()
+            total += len(batch)
+            batch = []
+    if batch:
+        db.execute(DogAncestry.__table__.insert(), batch)
+        total += len(batch)
+    db.commit()
+    return total
+
+
+def rebuild_ancestry(db: Session, max_depth: int = ANCESTRY_MAX_DEPTH) -> int:
+    """Rebuild the whole closure table from the dogs table; returns the number of rows written"""
+    graph = load_parent_graph(db)
+    db.query(DogAncestry).delete(synchronize_session=False)
+    db.commit()
+    return _write_ancestry(db, graph, list(graph.index), max_depth)
+
+
+def refresh_ancestry(db: Session, graph: ParentGraph, dog_ids: Iterable[int],
+                     max_depth: int = ANCESTRY_MAX_DEPTH) -> int:
+    """
+    Re-derive the rows of created dogs, or of dogs whose sire/dam changed, together
+    with every descendant close enough to see the change (within max_depth - 1
+    generations, found through the parent graph's offspring edges). Expects the graph
+    to already reflect the change. Returns the number of dogs refreshed.
+    """
+    affected = {dog_id for dog_id in dog_ids if dog_id in graph}
+    frontier = set(affected)
+    for _ in range(max_depth - 1):
+        frontier = {child_id for dog_id in frontier for child_id in graph.offspring(dog_id)} - affected
+        if not frontier:
+            break
+        affected |= frontier
+
+    affected = sorted(affected)
+    for start in range(0, len(affected), INSERT_BATCH_SIZE):
+        chunk = affected[start:start + INSERT_BATCH_SIZE]
+        db.query(DogAncestry).filter(DogAncestry.dog_id.in_(chunk)).delete(synchronize_session=False)
+    _write_ancestry(db, graph, affected, max_depth)
+    return len(affected)
+
+
+def remove_ancestry(db: Session, dog_id: int) -> None:
+    """
+    Delete the rows of a dog that is being deleted and every row that lists it as an
+    ancestor (caller commits). The descendants' rows are rewritten by the
+    propagate-parent-change job queued for the dog's offspring (see propagation.py).
+    """
+    db.query(DogAncestry).filter(
+        (DogAncestry.dog_id == dog_id) | (DogAncestry.ancestor_id == dog_id)
+    ).delete(synchronize_session=False)
+
+
+def get_ancestors_with_paths(db: Session, dog_id: int, max_generations: int) -> Optional[Dict[int, Dict[int, int]]]:
+    """
+    Ancestors of a dog with a histogram of path counts by path length, read from the
+    closure table (each Ahnentafel position is one path).
+    Returns dict: {ancestor_id: {path_length: number_of_paths}}, or None when the table
+    cannot answer (depth beyond ANCESTRY_MAX_DEPTH or the dog is not materialized yet).
+    """
+    if max_generations > ANCESTRY_MAX_DEPTH:
+        return None
+
+    rows = db.query(DogAncestry.ancestor_id, DogAncestry.depth, func.count()).filter(
+        DogAncestry.dog_id == dog_id,
+        DogAncestry.depth <= max_generations
+    ).group_by(DogAncestry.ancestor_id, DogAncestry.depth).all()
+    if not rows:
+        return None
+
+    ancestors = {}
+    for ancestor_id, depth, paths in rows:
+        ancestors.setdefault(ancestor_id, {})[depth] = paths
+    return ancestors
+
+
+def get_descendant_ids(db: Session, dog_id: int, max_depth: Optional[int] = None) -> Set[int]:
+    """Ids of all dogs that have this dog as an ancestor (optionally within max_depth generations)"""
+    query = db.query(DogAncestry.dog_id).filter(
+        DogAncestry.ancestor_id == dog_id,
+        DogAncestry.depth > 0
+    )
+    if max_depth is not None:
+        query = query.filter(DogAncestry.depth <= max_depth)
+    return {row.dog_id for row in query.distinct()}
@@ -0,0 +1,179 @@
+"""
+Typeahead prefix index for PedigreeDatabase
+
+Backs /api/dogs/autocomplete, used by the search boxes and the sire/dam pickers of
+the add-dog form (which used to ship the first 1000 dogs as <option>s). Three sorted
+arrays of (key, dog_id) are searched with bisect:
+
+    names          the whole normalized name ("joy of life star")
+    words          every later word start of the name ("of life star", "life star", "star")
+    registrations  the normalized registration number (identifiers.normalize_identifier)
+
+Whole-name prefix matches come first, then word matches, then registration numbers.
+Names are normalized as in fuzzy_index (transliterated, apostrophes and dashes folded),
+so "o'ne" finds "O'NEIL". Each result carries the few fields a suggestion shows, so a
+lookup never reaches the database. crud write functions keep the arrays current and
+the rebuild-search-index job reloads them.
+"""
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from fuzzy_index import normalize_name
+from identifiers import normalize_identifier
+from models import Dog
+
+AUTOCOMPLETE_MAX_SCAN = int(os.getenv("AUTOCOMPLETE_MAX_SCAN", "5000"))  # Entries examined per array and query
+SUGGESTION_FIELDS = ("name", "registration_number", "sex", "breed", "kennel_name", "date_of_birth")
+
+Key = Tuple[str, int]
+
+
+def _name_keys(name: Optional[str]) -> Tuple[List[str], List[str]]:
+    words = normalize_name(name).split()
+    if not words:
+        return [], []
+    return [" ".join(words)], [" ".join(words[i:]) for i in range(1, len(words))]
+
+
+class AutocompleteIndex:
+    """Sorted (key, dog_id) arrays for prefix lookups, plus suggestion fields per dog"""
+
+    ARRAYS = ("names", "words", "registrations")
+
+    def __init__(self):
+        self.names: List[Key] = []
+        self.words: List[Key] = []
+        self.registrations: List[Key] = []
+        self.dogs: Dict[int, Dict[str, Any]] = {}
+        self._keys: Dict[int, Dict[str, List[Key]]] = {}
+        self.version = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_db(cls, db: Session) -> "AutocompleteIndex":
+        index = cls()
+        columns = [getattr(Dog, field) for field in SUGGESTION_FIELDS]
+        for row in db.query(Dog.id, *columns).yield_per(5000):
+            index._add(row.id, {field: getattr(row, field) for field in SUGGESTION_FIELDS}, bulk=True)
+        for array in cls.ARRAYS:
+            getattr(index, array).sort()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.dogs)
+
+    def _add(self, dog_id: int, fields: Dict[str, Any], bulk: bool = False):
+        names, words = _name_keys(fields.get("name"))
+        registration = normalize_identifier(fields.get("registration_number"))
+        keys = {
+            "names": [(key, dog_id) for key in names],
+            "words": [(key, dog_id) for key in words],
+            "registrations": [(registration, dog_id)] if registration else []
+        }
+        for array, entries in keys.items():
+            target = getattr(self, array)
+            for entry in entries:
+                if bulk:
+                    target.append(entry)
+                else:
+                    insort(target, entry)
+        self._keys[dog_id] = keys
+        date_of_birth = fields.get("date_of_birth")
+        self.dogs[dog_id] = {
+            "id": dog_id,
+            **{field: fields.get(field) for field in SUGGESTION_FIELDS if field != "date_of_birth"},
+            "year_of_birth": date_of_birth.year if date_of_birth else None
+        }
+
+    def _remove(self, dog_id: int):
+        keys = self._keys.pop(dog_id, None)
+        if keys is None:
+            return
+        for array, entries in keys.items():
+            target = getattr(self, array)
+            for entry in entries:
+                i = bisect_left(target, entry)
+                if i < len(target) and target[i] == entry:
+                    del target[i]
+        self.dogs.pop(dog_id, None)
+
+    def set_dog(self, dog_id: int, fields: Dict[str, Any]):
+        with self._lock:
+            self._remove(dog_id)
+            self._add(dog_id, fields)
+            self.version += 1
+
+    def remove(self, dog_id: int):
+        with self._lock:
+            self._remove(dog_id)
+            self.version += 1
+
+    def suggest(self, query: str, limit: int = 10, sex: Optional[str] = None,
+                breed: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Dogs whose name (or a word of it) or registration number starts with the query"""
+        registration = normalize_identifier(query)
+        if registration and re.match(r"^N\d", registration):
+            # A partial "N17385" has no "/" yet for normalize_identifier's N -> NO rule
+            registration = "NO" + registration[1:]
+        prefixes = {"names": normalize_name(query), "words": normalize_name(query), "registrations": registration}
+        breed = breed.casefold() if breed else None
+        seen = set()
+        suggestions = []
+        with self._lock:
+            for array in self.ARRAYS:
+                prefix = prefixes[array]
+                if not prefix:
+                    continue
+                target = getattr(self, array)
+                i = bisect_left(target, (prefix, -1))
+                end = min(len(target), i + AUTOCOMPLETE_MAX_SCAN)
+                while i < end and len(suggestions) < limit:
+                    key, dog_id = target[i]
+                    if not key.startswith(prefix):
+                        break
+                    i += 1
+                    dog = self.dogs[dog_id]
+                    if dog_id in seen or (sex and dog["sex"] != sex) or \
+                            (breed and (dog["breed"] or "").casefold() != breed):
+                        continue
+                    seen.add(dog_id)
+                    suggestions.append(dict(dog))
+        return suggestions
+
+
+_index: Optional[AutocompleteIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_autocomplete_index(db: Session) -> AutocompleteIndex:
+    """(Re)build the process-wide autocomplete index from the database"""
+    global _index
+    index = AutocompleteIndex.from_db(db)
+    with _index_lock:
+        _index = index
+    return index
+
+
+def get_autocomplete_index(db: Session) -> AutocompleteIndex:
+    """Return the process-wide autocomplete index, building it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AutocompleteIndex.from_db(db)
+    return _index
+
+
+def autocomplete_index_dog(dog: Dog):
+    """Apply a created or updated dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.set_dog(dog.id, {field: getattr(dog, field) for field in SUGGESTION_FIELDS})
+
+
+def autocomplete_unindex_dog(dog_id: int):
+    """Apply a deleted dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.remove(dog_id)
@@ -0,0 +1,150 @@
+"""
+Process pool for CPU-bound pedigree work in PedigreeDatabase
+
+The COI of every dog of a deep pedigree (one Meuwissen & Luo pass over each dog's cut
+pedigree) is pure Python arithmetic and holds the GIL, so run inline it stalls every
+other request served by the same worker. The async pedigree handlers hand it to a small
+process pool instead.
+
+Each task gets a snapshot of just the parent links it needs (the requested dogs and
+their ancestors, as a plain dict), so worker processes need no database access
+and never see a half-applied parent change. COI_MAX_CONCURRENT bounds the tasks in
+flight and COI_TIMEOUT_SECONDS bounds how long a request waits for its result.
+Results are put in ancestor_coi_cache, so repeated requests do not go to the pool.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set
+from inbreeding import ancestor_closure, compute_coi
+from pedigree_cache import ancestor_coi_cache
+from pedigree_graph import ParentGraph
+
+COI_PROCESS_WORKERS = int(os.getenv("COI_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 computes inline
+COI_MAX_CONCURRENT = int(os.getenv("COI_MAX_CONCURRENT", str(max(1, 2 * COI_PROCESS_WORKERS))))
+COI_TIMEOUT_SECONDS = float(os.getenv("COI_TIMEOUT_SECONDS", "10"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending: Set[Future] = set()  # Submitted and not finished, cancelled on shutdown
+_slots = threading.BoundedSemaphore(COI_MAX_CONCURRENT)
+
+
+class ComputeTimeout(TimeoutError):
+    """The pool was busy or the computation did not finish within COI_TIMEOUT_SECONDS"""
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=COI_PROCESS_WORKERS)
+    return _executor
+
+
+def shutdown_compute_pool():
+    """Stop the worker processes (they are started again on next use)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            # Executor.shutdown(cancel_futures=True) needs Python 3.9
+            for future in list(_pending):
+                future.cancel()
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def parents_snapshot(graph: ParentGraph, dog_ids: List[int], generations: Optional[int] = None) -> Dict[int, tuple]:
+    """
+    {dog_id: (sire_id, dam_id)} for the given dogs and their ancestors: all of them, or
+    those up to ``generations`` generations above the dogs' parents
+    """
+    if generations is None:
+        ancestor_ids = {graph.ids[i] for i in ancestor_closure(graph, dog_ids)}
+    else:
+        ancestor_ids = set()
+        for dog_id in dog_ids:
+            ancestor_ids |= graph.ancestor_ids(dog_id, generations + 1)
+    return {dog_id: graph.parents(dog_id) for dog_id in ancestor_ids}
+
+
+def offload_coi_percentages(graph: ParentGraph, dog_ids: List[int], generations: int = 5,
+                            timeout: float = COI_TIMEOUT_SECONDS) -> Dict[int, float]:
+    """
+    utils.coi_percentages over the live parent graph, with the uncached part computed in
+    the process pool. Raises ComputeTimeout when no result is available within ``timeout``.
+    """
+    from utils import coi_fractions
+
+    version = graph.lineage_version
+    fractions = {}
+    missing = []
+    for dog_id in set(dog_ids):
+        if dog_id not in graph:
+            continue
+        cached = ancestor_coi_cache.get(graph, dog_id, generations)
+        if cached is None:
+            missing.append(dog_id)
+        else:
+            fractions[dog_id] = cached
+
+    if missing:
+        snapshot = parents_snapshot(graph, missing, generations)
+        if COI_PROCESS_WORKERS <= 0:
+            computed = coi_fractions(snapshot, missing, generations)
+        else:
+            computed = _run_in_pool(coi_fractions, snapshot, missing, generations, timeout=timeout)
+        for dog_id, coi in computed.items():
+            ancestor_coi_cache.put(graph, version, dog_id, generations, coi)
+        fractions.update(computed)
+
+    return {dog_id: round(coi * 100, 4) for dog_id, coi in fractions.items()}
+
+
+def offload_population_coi(graph: ParentGraph, dog_ids: List[int], known: Dict[int, float],
+                           timeout: float = COI_TIMEOUT_SECONDS) -> Dict[int, float]:
+    """
+    inbreeding.compute_coi of the given dogs, with the ancestor COIs in ``known`` taken as
+    given, computed in the process pool. Raises ComputeTimeout like offload_coi_percentages.
+    """
+    snapshot = parents_snapshot(graph, dog_ids)
+    if COI_PROCESS_WORKERS <= 0:
+        return population_coi(snapshot, dog_ids, known)
+    return _run_in_pool(population_coi, snapshot, dog_ids, known, timeout=timeout)
+
+
+def population_coi(parents: Dict[int, tuple], dog_ids: List[int], known: Dict[int, float]) -> Dict[int, float]:
+    """Worker side of offload_population_coi"""
+    coefficients = compute_coi(ParentGraph.from_parents(parents), dog_ids, known)
+    return {dog_id: coefficients[dog_id] for dog_id in dog_ids}
+
+
+def _task_done(future: Future):
+    _pending.discard(future)
+    _slots.release()
+
+
+def _run_in_pool(fn, *args, timeout: float):
+    deadline = time.monotonic() + timeout
+    if not _slots.acquire(timeout=timeout):
+        raise ComputeTimeout(f"COI computation pool busy ({COI_MAX_CONCURRENT} tasks in flight)")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    _pending.add(future)
+    # The slot is freed when the task really ends, so abandoned tasks still count against the limit
+    future.add_done_callback(_task_done)
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        future.cancel()
+        raise ComputeTimeout(f"COI computation took longer than {timeout:g}s")
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool for the next request
+        shutdown_compute_pool()
+        raise
@@ -1,80 +1,307 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload
+from typing import Optional, List, Dict, Any
 import json
-from models import Dog, HealthTest, HealthTestType
+from bisect import bisect_left, bisect_right
+from models import Dog, DogAncestry, DogPedigreeStats, HealthTest, HealthTestType
 import schemas
+from pedigree_graph import get_parent_graph, refresh_dog, remove_dog
+from pedigree_cache import pedigree_cache
+from ancestry import remove_ancestry
+from inbreeding import remove_coi
+from pedigree_stats import remove_pedigree_stats
+from jobs import enqueue_parent_change
+from search_index import RANK_TYPES, SEARCH_FIELDS, get_search_index, index_dog, unindex_dog
+from fuzzy_index import FUZZY_FIELDS, fuzzy_index_dog, fuzzy_unindex_dog, get_fuzzy_index
+from autocomplete import SUGGESTION_FIELDS, autocomplete_index_dog, autocomplete_unindex_dog, get_autocomplete_index
+from facets import FACET_FIELDS, bitmap_ids, facet_add_health_test, facet_index_dog, facet_unindex_dog, \
+    get_facet_index, ids_bitmap
+from identifiers import normalize_identifier
+from pagination import Page, count_cache, decode_cursor, encode_cursor
+
+# Columns needed to render a pedigree cell, plus the parent links used to walk up a level
+PEDIGREE_COLUMNS = (
+    Dog.id, Dog.name, Dog.registration_number, Dog.date_of_birth, Dog.sex,
+    Dog.breed, Dog.kennel_name, Dog.sire_id, Dog.dam_id
+)
+PEDIGREE_FIELDS = {column.key for column in PEDIGREE_COLUMNS}
+# Stored pedigree metrics that dog lists can be sorted by (highest first)
+PEDIGREE_STATS_ORDERING = ("completeness_3", "completeness_5", "completeness_10", "max_depth", "equivalent_generations")
+
 
 def get_dog(db: Session, dog_id: int) -> Optional[Dog]:
     return db.query(Dog).filter(Dog.id == dog_id).first()
 
 def get_dog_by_registration(db: Session, registration_number: str) -> Optional[Dog]:
-    return db.query(Dog).filter(Dog.registration_number == registration_number).first()
+    key = normalize_identifier(registration_number)
+    if key is None:
+        return None
+    return db.query(Dog).filter(Dog.registration_key == key).order_by(Dog.id).first()
+
+def _known_generations_clause(min_known_generations: int):
+    """
+    min_known_generations filter: at least that many equivalent complete generations
+    (sum of (1/2)^depth over known ancestors), not max_depth, which one deep line satisfies
+    """
+    return DogPedigreeStats.equivalent_generations >= min_known_generations
+
+def get_dogs(db: Session, skip: int = 0, limit: int = 100, min_known_generations: Optional[int] = None,
+             order_by: Optional[str] = None) -> List[Dog]:
+    """List dogs, optionally filtered/sorted by the stored pedigree metrics (see PEDIGREE_STATS_ORDERING)"""
+    query = db.query(Dog)
+    if min_known_generations is not None or order_by:
+        query = query.outerjoin(DogPedigreeStats, DogPedigreeStats.dog_id == Dog.id)
+    if min_known_generations is not None:
+        query = query.filter(_known_generations_clause(min_known_generations))
+    if order_by:
+        query = query.order_by(getattr(DogPedigreeStats, order_by).desc(), Dog.id)
+    return query.offset(skip).limit(limit).all()
+
+def _dog_list_statement(min_known_generations: Optional[int] = None, order_by: Optional[str] = None,
+                        after: Optional[tuple] = None, before: Optional[tuple] = None):
+    """
+    select(Dog, <sort value>) for a keyset page of a dog list: by id, or by a stored pedigree
+    metric (highest first, dogs without stored metrics last) and then id. ``after``/``before``
+    are decoded cursor keys; for ``before`` the order is reversed and the caller flips the rows.
+    """
+    sort_column = getattr(DogPedigreeStats, order_by) if order_by else Dog.id
+    statement = select(Dog, sort_column)
+    if min_known_generations is not None or order_by:
+        statement = statement.outerjoin(DogPedigreeStats, DogPedigreeStats.dog_id == Dog.id)
+    if min_known_generations is not None:
+        statement = statement.where(_known_generations_clause(min_known_generations))
+
+    if not order_by:
+        if after is not None:
+            statement = statement.where(Dog.id > after[0])
+        if before is not None:
+            return statement.where(Dog.id < before[0]).order_by(Dog.id.desc())
+        return statement.order_by(Dog.id)
+
+    # NULL sorts lowest on MariaDB and SQLite, so dogs without a stats row come last
+    if after is not None:
+        value, dog_id = after
+        if value is None:
+            statement = statement.where(sort_column.is_(None), Dog.id > dog_id)
+        else:
+            statement = statement.where(or_(
+                sort_column < value, and_(sort_column == value, Dog.id > dog_id), sort_column.is_(None)
+            ))
+    if before is not None:
+        value, dog_id = before
+        if value is None:
+            statement = statement.where(or_(sort_column.isnot(None), Dog.id < dog_id))
+        else:
+            statement = statement.where(or_(sort_column > value, and_(sort_column == value, Dog.id < dog_id)))
+        return statement.order_by(sort_column.asc(), Dog.id.desc())
+    return statement.order_by(sort_column.desc(), Dog.id)
+
+def _dog_list_cursor_types(order_by: Optional[str]) -> tuple:
+    return ((int, float, type(None)), (int,)) if order_by else ((int,),)
 
-def get_dogs(db: Session, skip: int = 0, limit: int = 100) -> List[Dog]:
-    return db.query(Dog).offset(skip).limit(limit).all()
+def _dog_list_page(rows: list, limit: int, order_by: Optional[str], skip: int, after: Optional[tuple],
+                   before: Optional[tuple], total: int) -> Page:
+    """Turn limit + 1 rows of _dog_list_statement into a Page"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    key = (lambda row: (row[1], row[0].id)) if order_by else (lambda row: (row[0].id,))
+    more_before = has_more if before is not None else (after is not None or skip > 0)
+    more_after = has_more if before is None else True
+    prev_cursor = encode_cursor(key(rows[0])) if rows and more_before else None
+    next_cursor = encode_cursor(key(rows[-1])) if rows and more_after else None
+    offset = skip if after is None and before is None else None
+    return Page([row[0] for row in rows], total, offset, prev_cursor, next_cursor)
+
+def _index_dog(db_dog: Dog, changed_fields=None):
+    """Apply a written dog to the in-memory indexes that cover any of changed_fields (all if None)"""
+    for fields, apply in ((SEARCH_FIELDS, index_dog), (FUZZY_FIELDS, fuzzy_index_dog),
+                          (SUGGESTION_FIELDS, autocomplete_index_dog), (FACET_FIELDS, facet_index_dog)):
+        if changed_fields is None or any(field in fields for field in changed_fields):
+            apply(db_dog)
+
+def _unindex_dog(dog_id: int):
+    unindex_dog(dog_id)
+    fuzzy_unindex_dog(dog_id)
+    autocomplete_unindex_dog(dog_id)
+    facet_unindex_dog(dog_id)
 
 def create_dog(db: Session, dog: schemas.DogCreate) -> Dog:
     db_dog = Dog(**dog.dict())
     db.add(db_dog)
     db.commit()
     db.refresh(db_dog)
+    refresh_dog(db_dog.id, db_dog.sire_id, db_dog.dam_id)
+    _index_dog(db_dog)
+    count_cache.clear()
+    enqueue_parent_change(db, [db_dog.id])
     return db_dog
 
 def update_dog(db: Session, dog_id: int, dog_update: schemas.DogUpdate) -> Optional[Dog]:
     db_dog = db.query(Dog).filter(Dog.id == dog_id).first()
     if db_dog:
         update_data = dog_update.dict(exclude_unset=True)
+        # Cached pedigrees only need dropping if a field they display (or a parent link) changes
+        pedigree_changed = any(
+            getattr(db_dog, field) != value for field, value in update_data.items()
+            if field in PEDIGREE_FIELDS
+        )
+        parents_changed = any(
+            getattr(db_dog, field) != value for field, value in update_data.items()
+            if field in ("sire_id", "dam_id")
+        )
         for field, value in update_data.items():
             setattr(db_dog, field, value)
         db.commit()
         db.refresh(db_dog)
+        refresh_dog(db_dog.id, db_dog.sire_id, db_dog.dam_id)
+        _index_dog(db_dog, update_data)
+        if parents_changed:
+            # Closure rows, stored COI and completeness of the dog and its descendants are
+            # redone in the background
+            enqueue_parent_change(db, [db_dog.id])
+        if pedigree_changed:
+            pedigree_cache.invalidate_dog(dog_id)
     return db_dog
 
 def delete_dog(db: Session, dog_id: int) -> bool:
     db_dog = db.query(Dog).filter(Dog.id == dog_id).first()
     if db_dog:
+        offspring_ids = get_parent_graph(db).offspring(dog_id)
+        remove_ancestry(db, dog_id)
+        remove_coi(db, dog_id)
+        remove_pedigree_stats(db, dog_id)
         db.delete(db_dog)
         db.commit()
+        remove_dog(dog_id)
+        _unindex_dog(dog_id)
+        count_cache.clear()
+        pedigree_cache.invalidate_dog(dog_id)
+        # Offspring lost a parent: their descendants' closure rows, stored COI and
+        # completeness are redone in the background
+        enqueue_parent_change(db, offspring_ids)
         return True
     return False
 
-def get_parents_recursively(db: Session, dog_id: int, generation: int = 0, max_generation: int = 9) -> Optional[dict]:
-    """Recursively get parents of a dog up to max_generation levels
+def load_ancestor_rows(db: Session, dog_id: int, max_generation: int = 9) -> Dict[int, Any]:
+    """Load a dog and all of its ancestors up to max_generation levels
     
-    Args:
-        generation: Current generation level (0 = main dog, 1 = parents, 2 = grandparents, etc.)
-        max_generation: Maximum generation to fetch (9 = up to 9th generation)
+    The ancestor ids are taken from the in-memory parent graph and fetched with a
+    single ``IN`` query. Anything the graph does not know about yet (e.g. rows written
+    by another process) is picked up level by level with one ``IN`` query per
+    generation, so a full 9-generation pedigree never costs more than 10 queries.
+    
+    Returns: {dog_id: row} where each row has the PEDIGREE_COLUMNS attributes
     """
-    # Stop recursion if we've exceeded the maximum generation or no dog_id
-    if generation > max_generation or not dog_id:
-        return None
+    if not dog_id:
+        return {}
     
-    # Load the current dog individually (no JOINs)
-    dog = db.query(Dog).get(dog_id)
-    if not dog:
-        return None
-      # Create result dictionary with basic dog info
-    result = {
-        "id": dog.id,
-        "name": dog.name,
-        "registration_number": dog.registration_number,
-        "date_of_birth": dog.date_of_birth,
-        "sex": dog.sex,
-        "breed": dog.breed,
-        "kennel_name": dog.kennel_name,
+    queries = _ancestor_row_queries(get_parent_graph(db), dog_id, max_generation)
+    try:
+        statement = next(queries)
+        while True:
+            statement = queries.send(db.execute(statement).all())
+    except StopIteration as done:
+        return done.value
+
+def _ancestor_row_queries(graph, dog_id: int, max_generation: int):
+    """
+    The queries of load_ancestor_rows, shared by the sync and async loaders: yields each
+    SELECT, takes its rows back through send() and returns {dog_id: row} when done.
+    """
+    rows = {}
+    ancestor_ids = graph.ancestor_ids(dog_id, max_generation)
+    if ancestor_ids:
+        for row in (yield select(*PEDIGREE_COLUMNS).where(Dog.id.in_(ancestor_ids))):
+            rows[row.id] = row
+    
+    frontier = {dog_id}
+    for generation in range(max_generation + 1):
+        missing = frontier - rows.keys()
+        if missing:
+            for row in (yield select(*PEDIGREE_COLUMNS).where(Dog.id.in_(missing))):
+                rows[row.id] = row
+        
+        next_frontier = set()
+        for current_id in frontier:
+            row = rows.get(current_id)
+            if row:
+                for parent_id in (row.sire_id, row.dam_id):
+                    if parent_id:
+                        next_frontier.add(parent_id)
+        
+        if not next_frontier:
+            break
+        frontier = next_frontier
+    
+    return rows
+
+def _pedigree_node(row) -> dict:
+    """Pedigree cell dictionary for one ancestor row"""
+    return {
+        "id": row.id,
+        "name": row.name,
+        "registration_number": row.registration_number,
+        "date_of_birth": row.date_of_birth,
+        "sex": row.sex,
+        "breed": row.breed,
+        "kennel_name": row.kennel_name,
         "sire": None,
         "dam": None
     }
+
+def build_ahnentafel(rows: Dict[int, Any], dog_id: int, generations: int) -> List[Optional[dict]]:
+    """Lay out a pedigree as a flat Ahnentafel array in one breadth-first pass
     
-    # Recursively get sire (father) if exists
-    if dog.sire_id:
-        result["sire"] = get_parents_recursively(db, dog.sire_id, generation + 1, max_generation)
+    Slot 1 is the dog itself and slots 2k / 2k+1 are the sire / dam of slot k, so
+    generation g occupies slots 2^g .. 2^(g+1)-1 (slot 0 is unused). Each node's
+    "sire"/"dam" keys point at its parents' slots, so slot 1 is also the nested tree.
+    """
+    slots = [None] * (2 ** (generations + 1))
+    root = rows.get(dog_id) if dog_id else None
+    if not root:
+        return slots
+    
+    slots[1] = _pedigree_node(root)
+    for k in range(1, 2 ** generations):
+        node = slots[k]
+        if node is None:
+            continue
+        
+        row = rows[node["id"]]
+        sire_row = rows.get(row.sire_id) if row.sire_id else None
+        dam_row = rows.get(row.dam_id) if row.dam_id else None
+        if sire_row:
+            node["sire"] = slots[2 * k] = _pedigree_node(sire_row)
+        if dam_row:
+            node["dam"] = slots[2 * k + 1] = _pedigree_node(dam_row)
     
-    # Recursively get dam (mother) if exists  
-    if dog.dam_id:
-        result["dam"] = get_parents_recursively(db, dog.dam_id, generation + 1, max_generation)
+    return slots
+
+def ancestor_matrix_from_ahnentafel(slots: List[Optional[dict]], generations: int) -> Dict[int, Dict[int, Optional[dict]]]:
+    """Derive the {generation: {position: ancestor}} view used by the templates"""
+    return {
+        gen: {pos: slots[2 ** gen + pos] for pos in range(2 ** gen)}
+        for gen in range(1, generations + 1)
+    }
+
+def get_parents_recursively(db: Session, dog_id: int, generation: int = 0, max_generation: int = 9) -> Optional[dict]:
+    """Get parents of a dog up to max_generation levels as a nested dictionary
+    
+    Args:
+        generation: Current generation level (0 = main dog, 1 = parents, 2 = grandparents, etc.)
+        max_generation: Maximum generation to fetch (9 = up to 9th generation)
+    """
+    # Stop if we've exceeded the maximum generation or no dog_id
+    if generation > max_generation or not dog_id:
+        return None
     
-    return result
+    # Load the whole ancestor set in one batch, then assemble the tree in memory
+    rows = load_ancestor_rows(db, dog_id, max_generation - generation)
+    return build_ahnentafel(rows, dog_id, max_generation - generation)[1]
 
 def get_ancestor_at_position(pedigree_data: dict, generation: int, position: int) -> Optional[dict]:
     """Get ancestor at specific generation and position using binary path navigation"""
@@ -106,25 +333,46 @@ def get_dog_pedigree(db: Session, dog_id: int, generations: int = 3) -> Optional
     dog = db.query(Dog).get(dog_id)
     if not dog:
         return None
-      # Get the recursive pedigree data and attach it to the dog object
-    # Start with generation 0 for the main dog, so parents are generation 1
-    pedigree_data = get_parents_recursively(db, dog_id, 0, generations)
+    
+    # Lay out the pedigree as an Ahnentafel array; slot 1 (the main dog) is the nested tree
+    ahnentafel = pedigree_cache.get(dog_id, generations)
+    if ahnentafel is None:
+        rows = load_ancestor_rows(db, dog_id, generations)
+        ahnentafel = build_ahnentafel(rows, dog_id, generations)
+        if ahnentafel[1]:
+            pedigree_cache.put(dog_id, generations, ahnentafel)
+    pedigree_data = ahnentafel[1]
     
     # Create ancestor matrix for easier template access
     if pedigree_data:
         dog.pedigree_data = pedigree_data
-        
-        # Create a pre-computed ancestor matrix for all positions
-        dog.ancestor_matrix = {}
-        for gen in range(1, generations + 1):
-            dog.ancestor_matrix[gen] = {}
-            total_positions = 2 ** gen
-            for pos in range(total_positions):
-                ancestor = get_ancestor_at_position(pedigree_data, gen, pos)
-                dog.ancestor_matrix[gen][pos] = ancestor
+        dog.ahnentafel = ahnentafel
+        dog.ancestor_matrix = ancestor_matrix_from_ahnentafel(ahnentafel, generations)
     
     return dog
 
+def get_descendants(db: Session, dog_id: int, generations: int = 3) -> List[dict]:
+    """Get descendants of a dog up to the given number of generations from the closure table"""
+    rows = db.query(Dog, func.min(DogAncestry.depth).label("depth")).join(
+        DogAncestry, DogAncestry.dog_id == Dog.id
+    ).filter(
+        DogAncestry.ancestor_id == dog_id,
+        DogAncestry.depth > 0,
+        DogAncestry.depth <= generations
+    ).group_by(Dog.id).order_by("depth", Dog.id).all()
+    
+    return [
+        {
+            "id": descendant.id,
+            "name": descendant.name,
+            "registration_number": descendant.registration_number,
+            "sex": descendant.sex,
+            "date_of_birth": descendant.date_of_birth,
+            "generation": depth
+        }
+        for descendant, depth in rows
+    ]
+
 def get_health_test_types(db: Session) -> List[HealthTestType]:
     return db.query(HealthTestType).all()
 
@@ -150,29 +398,249 @@ def create_health_test(db: Session, dog_id: int, health_test: schemas.HealthTest
     db.add(db_health_test)
     db.commit()
     db.refresh(db_health_test)
+    facet_add_health_test(dog_id)
     return db_health_test
 
 def get_dog_health_tests(db: Session, dog_id: int) -> List[HealthTest]:
     return db.query(HealthTest).filter(HealthTest.dog_id == dog_id).all()
 
+def _in_order(dogs: List[Dog], dog_ids: List[int]) -> List[Dog]:
+    by_id = {dog.id: dog for dog in dogs}
+    return [by_id[dog_id] for dog_id in dog_ids if dog_id in by_id]
+
 def search_dogs(db: Session, query: str, skip: int = 0, limit: int = 100) -> List[Dog]:
-    """Search dogs by name, registration_number, tatoo_no, microchip, kennel_name, or breed"""
-    return db.query(Dog).filter(
-        Dog.name.contains(query) | 
-        Dog.registration_number.contains(query) |
-        Dog.tatoo_no.contains(query) |
-        Dog.microchip.contains(query) |
-        Dog.kennel_name.contains(query) |
-        Dog.breed.contains(query)
-    ).offset(skip).limit(limit).all()
+    """Search dogs by name, registration_number, tatoo_no, microchip, kennel_name, or breed
+    
+    Matches and ranks through the in-memory search index (exact registration number or
+    microchip first, then by relevance) and loads only the requested page.
+    """
+    dog_ids, _ = get_search_index(db).search(query, skip=skip, limit=limit)
+    if not dog_ids:
+        return []
+    return _in_order(db.query(Dog).filter(Dog.id.in_(dog_ids)).all(), dog_ids)
 
 def count_search_dogs(db: Session, query: str) -> int:
     """Count total search results for pagination"""
-    return db.query(Dog).filter(
-        Dog.name.contains(query) | 
-        Dog.registration_number.contains(query) |
-        Dog.tatoo_no.contains(query) |
-        Dog.microchip.contains(query) |
-        Dog.kennel_name.contains(query) |
-        Dog.breed.contains(query)
-    ).count()
+    return get_search_index(db).search(query, limit=0)[1]
+
+
+# Async variants of the hot read paths, for handlers using database.get_async_db.
+# Relationships are loaded eagerly since lazy loading is not available on an AsyncSession.
+DOG_DETAIL_OPTIONS = (
+    selectinload(Dog.sire), selectinload(Dog.dam),
+    selectinload(Dog.health_tests).selectinload(HealthTest.test_type)
+)
+
+async def get_dog_async(db: AsyncSession, dog_id: int) -> Optional[Dog]:
+    result = await db.execute(select(Dog).options(*DOG_DETAIL_OPTIONS).where(Dog.id == dog_id))
+    return result.scalars().first()
+
+async def count_dogs_async(db: AsyncSession, min_known_generations: Optional[int] = None) -> int:
+    """Number of dogs in a list, from the short-lived count cache"""
+    key = ("dogs", min_known_generations)
+    count = count_cache.get(key)
+    if count is None:
+        statement = select(func.count()).select_from(Dog)
+        if min_known_generations is not None:
+            statement = statement.join(DogPedigreeStats, DogPedigreeStats.dog_id == Dog.id).where(
+                _known_generations_clause(min_known_generations)
+            )
+        count = await db.scalar(statement)
+        count_cache.put(key, count)
+    return count
+
+async def get_dogs_page_async(db: AsyncSession, limit: int = 100, after: Optional[str] = None,
+                              before: Optional[str] = None, skip: int = 0,
+                              min_known_generations: Optional[int] = None, order_by: Optional[str] = None,
+                              facets: Optional[Dict[str, Any]] = None) -> Page:
+    """
+    A page of get_dogs_async continuing from a cursor of a previous page (``after`` for the
+    next page, ``before`` for the previous one), or at ``skip`` without one. ``facets``
+    (see facets.parse_facet_filters) narrows the id-ordered list through the facet index.
+    Raises ValueError for a cursor that was not made for this ordering.
+    """
+    types = _dog_list_cursor_types(order_by)
+    after_key = decode_cursor(after, types) if after else None
+    before_key = decode_cursor(before, types) if before and after_key is None else None
+    if facets:
+        if min_known_generations is not None or order_by:
+            raise ValueError("Facet filters cannot be combined with min_known_generations or order_by")
+        index = await db.run_sync(get_facet_index)
+        return await _dog_ids_page_async(db, bitmap_ids(index.match(facets)), limit, after_key, before_key, skip)
+    statement = _dog_list_statement(min_known_generations, order_by, after_key, before_key)
+    statement = statement.options(*DOG_DETAIL_OPTIONS).limit(limit + 1)
+    if after_key is None and before_key is None:
+        statement = statement.offset(skip)
+    rows = list((await db.execute(statement)).all())
+    total = await count_dogs_async(db, min_known_generations)
+    return _dog_list_page(rows, limit, order_by, skip, after_key, before_key, total)
+
+async def _dog_ids_page_async(db: AsyncSession, dog_ids: List[int], limit: int, after: Optional[tuple],
+                              before: Optional[tuple], skip: int) -> Page:
+    """A page of an ascending list of dog ids, with the cursors of the id-ordered dog list"""
+    if before is not None:
+        end = bisect_left(dog_ids, before[0])
+        start = max(0, end - limit)
+    else:
+        start = bisect_right(dog_ids, after[0]) if after is not None else max(0, skip)
+        end = start + limit
+    page_ids = dog_ids[start:end]
+    dogs = []
+    if page_ids:
+        statement = select(Dog).options(*DOG_DETAIL_OPTIONS).where(Dog.id.in_(page_ids))
+        dogs = _in_order(list((await db.execute(statement)).scalars().all()), page_ids)
+    prev_cursor = encode_cursor((page_ids[0],)) if page_ids and start > 0 else None
+    next_cursor = encode_cursor((page_ids[-1],)) if page_ids and start + len(page_ids) < len(dog_ids) else None
+    return Page(dogs, len(dog_ids), start, prev_cursor, next_cursor)
+
+async def search_dogs_async(db: AsyncSession, query: str, skip: int = 0, limit: int = 100) -> List[Dog]:
+    index = await db.run_sync(get_search_index)
+    dog_ids, _ = index.search(query, skip=skip, limit=limit)
+    if not dog_ids:
+        return []
+    statement = select(Dog).options(selectinload(Dog.sire), selectinload(Dog.dam)).where(Dog.id.in_(dog_ids))
+    return _in_order(list((await db.execute(statement)).scalars().all()), dog_ids)
+
+async def count_search_dogs_async(db: AsyncSession, query: str) -> int:
+    index = await db.run_sync(get_search_index)
+    return index.search(query, limit=0)[1]
+
+async def search_dogs_page_async(db: AsyncSession, query: str, limit: int = 20, after: Optional[str] = None,
+                                 before: Optional[str] = None, skip: int = 0,
+                                 facets: Optional[Dict[str, Any]] = None) -> Page:
+    """
+    A page of search results continuing from a cursor of a previous page, or at ``skip``.
+    Totals and pages come from the ranked result the search index keeps for the query,
+    narrowed to the dogs matching ``facets`` when given.
+    Raises ValueError for a malformed cursor.
+    """
+    after_key = decode_cursor(after, RANK_TYPES) if after else None
+    before_key = decode_cursor(before, RANK_TYPES) if before and after_key is None else None
+    index = await db.run_sync(get_search_index)
+    only = None
+    if facets:
+        facet_index = await db.run_sync(get_facet_index)
+        only = set(bitmap_ids(facet_index.match(facets, _search_bitmap(index, query))))
+    ranks, offset, total = index.search_page(query, limit, after=after_key, before=before_key, skip=skip, only=only)
+    dog_ids = [rank[-1] for rank in ranks]
+    dogs = []
+    if dog_ids:
+        statement = select(Dog).options(selectinload(Dog.sire), selectinload(Dog.dam)).where(Dog.id.in_(dog_ids))
+        dogs = _in_order(list((await db.execute(statement)).scalars().all()), dog_ids)
+    prev_cursor = encode_cursor(ranks[0]) if ranks and offset > 0 else None
+    next_cursor = encode_cursor(ranks[-1]) if ranks and offset + len(ranks) < total else None
+    return Page(dogs, total, offset, prev_cursor, next_cursor)
+
+def _search_bitmap(index, query: str) -> int:
+    return ids_bitmap(rank[-1] for rank in index.ranked(query))
+
+async def facet_counts_async(db: AsyncSession, facets: Dict[str, Any],
+                             query: Optional[str] = None) -> Dict[str, List[tuple]]:
+    """
+    (value, count) pairs per facet for the dog list, or for the results of a search query,
+    each facet counted under the other active filters (see FacetIndex.counts)
+    """
+    index = await db.run_sync(get_facet_index)
+    search_index = await db.run_sync(get_search_index) if query else None
+    # Counting is CPU-bound bitmap work; keep it off the event loop
+    return await run_in_threadpool(_facet_counts, index, facets, search_index, query)
+
+def _facet_counts(index, facets: Dict[str, Any], search_index, query: Optional[str]) -> Dict[str, List[tuple]]:
+    base = _search_bitmap(search_index, query) if query else None
+    return index.counts(facets, base)
+
+async def fuzzy_search_dogs_async(db: AsyncSession, query: str, limit: int = 20,
+                                  fields: tuple = FUZZY_FIELDS) -> List[Dict[str, Any]]:
+    """Dogs whose name or kennel name is most similar to the query (see fuzzy_index.py)"""
+    index = await db.run_sync(get_fuzzy_index)
+    matches = index.search(query, limit=limit, fields=fields)
+    if not matches:
+        return []
+    result = await db.execute(select(Dog).where(Dog.id.in_([dog_id for dog_id, _, _ in matches])))
+    dogs = {dog.id: dog for dog in result.scalars().all()}
+    return [
+        {
+            "id": dog_id,
+            "name": dogs[dog_id].name,
+            "registration_number": dogs[dog_id].registration_number,
+            "kennel_name": dogs[dog_id].kennel_name,
+            "breed": dogs[dog_id].breed,
+            "matched_field": field,
+            "similarity": similarity
+        }
+        for dog_id, field, similarity in matches if dog_id in dogs
+    ]
+
+async def autocomplete_dogs_async(db: AsyncSession, query: str, limit: int = 10, sex: Optional[str] = None,
+                                  breed: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Typeahead suggestions from the in-memory prefix index (see autocomplete.py)"""
+    index = await db.run_sync(get_autocomplete_index)
+    return index.suggest(query, limit=limit, sex=sex, breed=breed)
+
+async def lookup_dog_ids_async(db: AsyncSession, identifiers: List[str]) -> Dict[str, List[int]]:
+    """
+    Dog ids for each identifier (registration number, microchip or tattoo number),
+    matched on the normalized key columns in one query. Identifiers without a match are omitted.
+    """
+    by_key: Dict[str, List[str]] = {}
+    for identifier in identifiers:
+        key = normalize_identifier(identifier)
+        if key:
+            by_key.setdefault(key, []).append(identifier)
+    if not by_key:
+        return {}
+
+    keys = list(by_key)
+    statement = select(Dog.id, Dog.registration_key, Dog.microchip_key, Dog.tatoo_key).where(or_(
+        Dog.registration_key.in_(keys), Dog.microchip_key.in_(keys), Dog.tatoo_key.in_(keys)
+    ))
+    matches: Dict[str, List[int]] = {}
+    for row in (await db.execute(statement.order_by(Dog.id))).all():
+        for key in {row.registration_key, row.microchip_key, row.tatoo_key}:
+            for identifier in by_key.get(key, ()):
+                dog_ids = matches.setdefault(identifier, [])
+                if row.id not in dog_ids:
+                    dog_ids.append(row.id)
+    return matches
+
+async def get_health_test_types_async(db: AsyncSession) -> List[HealthTestType]:
+    return list((await db.execute(select(HealthTestType))).scalars().all())
+
+async def get_dog_health_tests_async(db: AsyncSession, dog_id: int) -> List[HealthTest]:
+    statement = select(HealthTest).options(selectinload(HealthTest.test_type)).where(HealthTest.dog_id == dog_id)
+    return list((await db.execute(statement)).scalars().all())
+
+async def load_ancestor_rows_async(db: AsyncSession, dog_id: int, max_generation: int = 9) -> Dict[int, Any]:
+    """load_ancestor_rows on an async session (same queries, see _ancestor_row_queries)"""
+    if not dog_id:
+        return {}
+    
+    graph = await db.run_sync(get_parent_graph)
+    queries = _ancestor_row_queries(graph, dog_id, max_generation)
+    try:
+        statement = next(queries)
+        while True:
+            statement = queries.send((await db.execute(statement)).all())
+    except StopIteration as done:
+        return done.value
+
+async def get_dog_pedigree_async(db: AsyncSession, dog_id: int, generations: int = 3) -> Optional[Dog]:
+    """get_dog_pedigree on an async session (only column attributes of the dog are loaded)"""
+    dog = await db.get(Dog, dog_id)
+    if not dog:
+        return None
+    
+    ahnentafel = pedigree_cache.get(dog_id, generations)
+    if ahnentafel is None:
+        rows = await load_ancestor_rows_async(db, dog_id, generations)
+        ahnentafel = build_ahnentafel(rows, dog_id, generations)
+        if ahnentafel[1]:
+            pedigree_cache.put(dog_id, generations, ahnentafel)
+    pedigree_data = ahnentafel[1]
+    
+    if pedigree_data:
+        dog.pedigree_data = pedigree_data
+        dog.ahnentafel = ahnentafel
+        dog.ancestor_matrix = ancestor_matrix_from_ahnentafel(ahnentafel, generations)
+    
+    return dog
@@ -23,6 +23,7 @@ sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from database import get_db
 from models import Dog
+from identifiers import normalize_identifier
 from sqlalchemy.orm import Session
 
 
@@ -112,25 +113,6 @@ def normalize_registration_number(reg_code: Optional[str]) -> Optional[str]:
     return cleaned
 
 
-def normalize_for_comparison(reg_code: Optional[str]) -> Optional[str]:
-    """Normalize registration number for duplicate detection"""
-    if not reg_code:
-        return None
-    
-    # Remove all spaces and convert to uppercase
-    normalized = re.sub(r'\s+', '', reg_code.strip().upper())
-    
-    # Handle common patterns
-    # "N17385/06" should match "NO 17385/06" -> both become "NO17385/06"
-    if re.match(r'^N\d+/', normalized):
-        normalized = 'NO' + normalized[1:]
-    
-    # "PK04704/05" should match "PK 04704/05" -> both become "PK04704/05"
-    # This is already handled by removing spaces
-    
-    return normalized
-
-
 def normalize_dog_name_for_comparison(name: Optional[str]) -> Optional[str]:
     """Normalize dog name for duplicate detection"""
     if not name:
@@ -159,43 +141,56 @@ def normalize_dog_name_for_storage(name: Optional[str]) -> Optional[str]:
     return normalized
 
 
-def check_for_duplicates(record: Dict, existing_dogs: List[Dog], logger) -> Optional[Dog]:
+def load_name_index(db: Session) -> Dict[str, List[int]]:
+    """Ids of the existing dogs by comparison-normalized name, from one id/name query"""
+    dogs_by_name: Dict[str, List[int]] = {}
+    for dog_id, name in db.query(Dog.id, Dog.name).order_by(Dog.id):
+        norm_name = normalize_dog_name_for_comparison(name)
+        if norm_name:
+            dogs_by_name.setdefault(norm_name, []).append(dog_id)
+    return dogs_by_name
+
+
+def check_for_duplicates(record: Dict, db: Session, dogs_by_name: Dict[str, List[int]], logger) -> Optional[Dog]:
     """
     Check if a record is a duplicate of existing dogs
     Returns the existing dog if duplicate is found, None otherwise
+    
+    Registration numbers and microchips are matched with indexed lookups on the
+    normalized key columns, names through the name index built once per run.
     """
     name = record.get('name', '').strip()
     reg_code = record.get('regCode', '').strip()
     microchip = record.get('microchip', '').strip()
     date_of_birth = parse_bulgarian_date(record.get('dateOfBirth'))
     
-    # Normalize values for comparison
-    norm_name = normalize_dog_name_for_comparison(name)
-    norm_reg = normalize_for_comparison(reg_code)
-    
-    for existing_dog in existing_dogs:
-        # Check 1: Registration number match (strongest identifier)
-        if norm_reg and existing_dog.registration_number:
-            existing_norm_reg = normalize_for_comparison(existing_dog.registration_number)
-            if norm_reg == existing_norm_reg:
-                logger.warning(f"DUPLICATE by reg number: '{reg_code}' matches existing '{existing_dog.registration_number}' for dog {existing_dog.name} (ID: {existing_dog.id})")
-                return existing_dog
-        
-        # Check 2: Microchip match (very strong identifier)
-        if microchip and existing_dog.microchip and microchip == existing_dog.microchip:
+    # Check 1: Registration number match (strongest identifier)
+    reg_key = normalize_identifier(reg_code)
+    if reg_key:
+        existing_dog = db.query(Dog).filter(Dog.registration_key == reg_key).order_by(Dog.id).first()
+        if existing_dog:
+            logger.warning(f"DUPLICATE by reg number: '{reg_code}' matches existing '{existing_dog.registration_number}' for dog {existing_dog.name} (ID: {existing_dog.id})")
+            return existing_dog
+    
+    # Check 2: Microchip match (very strong identifier)
+    microchip_key = normalize_identifier(microchip)
+    if microchip_key:
+        existing_dog = db.query(Dog).filter(Dog.microchip_key == microchip_key).order_by(Dog.id).first()
+        if existing_dog:
             logger.warning(f"DUPLICATE by microchip: '{microchip}' for dog {existing_dog.name} (ID: {existing_dog.id})")
             return existing_dog
-        
-        # Check 3: Name + date of birth match (strong identifier)
-        if norm_name and date_of_birth and existing_dog.name and existing_dog.date_of_birth:
-            existing_norm_name = normalize_dog_name_for_comparison(existing_dog.name)
-            if norm_name == existing_norm_name and str(date_of_birth) == str(existing_dog.date_of_birth):
+    
+    # Check 3: Name + date of birth match (strong identifier)
+    norm_name = normalize_dog_name_for_comparison(name)
+    if norm_name and date_of_birth:
+        for dog_id in dogs_by_name.get(norm_name, ()):
+            existing_dog = db.get(Dog, dog_id)
+            if existing_dog is not None and existing_dog.date_of_birth and str(date_of_birth) == str(existing_dog.date_of_birth):
                 logger.warning(f"DUPLICATE by name+date: '{name}' ({date_of_birth}) matches existing '{existing_dog.name}' (ID: {existing_dog.id})")
                 return existing_dog
     
     return None
 
-
 def import_dogs_only(records: List[Dict], db: Session, logger) -> Dict:
     """Import dogs without parent relationships"""
     
@@ -209,9 +204,9 @@ def import_dogs_only(records: List[Dict], db: Session, logger) -> Dict:
     
     logger.info(f"Starting import of {len(records)} records...")
     
-    # Get all existing dogs once for duplicate checking
-    existing_dogs = db.query(Dog).all()
-    logger.info(f"Loaded {len(existing_dogs)} existing dogs for duplicate checking")
+    # Index existing dog names once for duplicate checking (identifiers are looked up by key)
+    dogs_by_name = load_name_index(db)
+    logger.info(f"Loaded {sum(len(ids) for ids in dogs_by_name.values())} existing dog names for duplicate checking")
     
     for i, record in enumerate(records, 1):
         try:
@@ -235,7 +230,7 @@ def import_dogs_only(records: List[Dict], db: Session, logger) -> Dict:
                 continue
             
             # Check for duplicates
-            duplicate_dog = check_for_duplicates(record, existing_dogs, logger)
+            duplicate_dog = check_for_duplicates(record, db, dogs_by_name, logger)
             if duplicate_dog:
                 logger.info(f"Record {i}: Skipping duplicate - {name} already exists as {duplicate_dog.name} (ID: {duplicate_dog.id})")
                 stats['skipped_duplicates'] += 1
@@ -264,8 +259,8 @@ def import_dogs_only(records: List[Dict], db: Session, logger) -> Dict:
             db.add(new_dog)
             db.flush()  # Get ID without committing
             
-            # Add to existing dogs list for future duplicate checking
-            existing_dogs.append(new_dog)
+            # Add to the name index for future duplicate checking
+            dogs_by_name.setdefault(normalize_dog_name_for_comparison(name), []).append(new_dog.id)
             
             logger.info(f"Record {i}: Imported {normalized_name} (ID: {new_dog.id}) - {normalized_reg}")
             stats['imported'] += 1
@@ -19,6 +19,7 @@ sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from database import get_db
 from models import Dog
+from identifiers import normalize_identifier
 from sqlalchemy.orm import Session
 
 
@@ -82,22 +83,6 @@ def normalize_registration_number(reg_code: Optional[str]) -> Optional[str]:
     return cleaned
 
 
-def normalize_for_comparison(reg_code: Optional[str]) -> Optional[str]:
-    """Normalize registration number for duplicate detection"""
-    if not reg_code:
-        return None
-    
-    # Remove all spaces and convert to uppercase
-    normalized = re.sub(r'\s+', '', reg_code.strip().upper())
-    
-    # Handle common patterns
-    # "N17385/06" should match "NO 17385/06" -> both become "NO17385/06"
-    if re.match(r'^N\d+/', normalized):
-        normalized = 'NO' + normalized[1:]
-    
-    return normalized
-
-
 def normalize_dog_name_for_comparison(name: Optional[str]) -> Optional[str]:
     """Normalize dog name for duplicate detection"""
     if not name:
@@ -126,34 +111,35 @@ def normalize_dog_name_for_storage(name: Optional[str]) -> Optional[str]:
     return normalized
 
 
-def find_dog_by_name_and_reg(name: str, reg_number: str, existing_dogs: List[Dog]) -> Optional[Dog]:
-    """Find dog by name and registration number"""
-    norm_name = normalize_dog_name_for_comparison(name)
-    norm_reg = normalize_for_comparison(reg_number)
-    
-    for dog in existing_dogs:
-        # Check by registration number first (stronger identifier)
-        if norm_reg and dog.registration_number:
-            existing_norm_reg = normalize_for_comparison(dog.registration_number)
-            if norm_reg == existing_norm_reg:
-                return dog
-        
-        # Check by name
-        if norm_name and dog.name:
-            existing_norm_name = normalize_dog_name_for_comparison(dog.name)
-            if norm_name == existing_norm_name:
-                return dog
-    
-    return None
+def load_name_index(db: Session) -> Dict[str, List[int]]:
+    """Ids of the existing dogs by comparison-normalized name, from one id/name query"""
+    dogs_by_name: Dict[str, List[int]] = {}
+    for dog_id, name in db.query(Dog.id, Dog.name).order_by(Dog.id):
+        norm_name = normalize_dog_name_for_comparison(name)
+        if norm_name:
+            dogs_by_name.setdefault(norm_name, []).append(dog_id)
+    return dogs_by_name
+
 
+def find_dog_by_name_and_reg(name: str, reg_number: str, db: Session, dogs_by_name: Dict[str, List[int]]) -> Optional[Dog]:
+    """Find dog by registration number (indexed registration_key lookup), then by name"""
+    reg_key = normalize_identifier(reg_number)
+    if reg_key:
+        dog = db.query(Dog).filter(Dog.registration_key == reg_key).order_by(Dog.id).first()
+        if dog:
+            return dog
+    
+    dog_ids = dogs_by_name.get(normalize_dog_name_for_comparison(name))
+    return db.get(Dog, dog_ids[0]) if dog_ids else None
 
-def collect_missing_parents(records: List[Dict], existing_dogs: List[Dog], logger) -> Dict:
+def collect_missing_parents(records: List[Dict], db: Session, logger) -> Dict:
     """Collect all missing parents from the records"""
     
     missing_fathers = {}  # reg_number -> parent_info
     missing_mothers = {}  # reg_number -> parent_info
     
     logger.info("Collecting missing parents from records...")
+    dogs_by_name = load_name_index(db)
     
     for i, record in enumerate(records, 1):
         father_name = clean_field_value(record.get('fatherName'))
@@ -163,10 +149,10 @@ def collect_missing_parents(records: List[Dict], existing_dogs: List[Dog], logge
         
         # Check father
         if father_name and father_reg:
-            existing_father = find_dog_by_name_and_reg(father_name, father_reg, existing_dogs)
+            existing_father = find_dog_by_name_and_reg(father_name, father_reg, db, dogs_by_name)
             if not existing_father:
                 # Use registration number as key for deduplication
-                norm_father_reg = normalize_for_comparison(father_reg)
+                norm_father_reg = normalize_identifier(father_reg)
                 if norm_father_reg not in missing_fathers:
                     missing_fathers[norm_father_reg] = {
                         'name': father_name,
@@ -177,10 +163,10 @@ def collect_missing_parents(records: List[Dict], existing_dogs: List[Dog], logge
         
         # Check mother
         if mother_name and mother_reg:
-            existing_mother = find_dog_by_name_and_reg(mother_name, mother_reg, existing_dogs)
+            existing_mother = find_dog_by_name_and_reg(mother_name, mother_reg, db, dogs_by_name)
             if not existing_mother:
                 # Use registration number as key for deduplication
-                norm_mother_reg = normalize_for_comparison(mother_reg)
+                norm_mother_reg = normalize_identifier(mother_reg)
                 if norm_mother_reg not in missing_mothers:
                     missing_mothers[norm_mother_reg] = {
                         'name': mother_name,
@@ -287,12 +273,8 @@ def main():
         # Import to database
         db = next(get_db())
         try:
-            # Get all existing dogs
-            existing_dogs = db.query(Dog).all()
-            logger.info(f"Loaded {len(existing_dogs)} existing dogs")
-            
             # Collect missing parents
-            missing_parents = collect_missing_parents(records, existing_dogs, logger)
+            missing_parents = collect_missing_parents(records, db, logger)
             
             # Import missing parents
             stats = import_missing_parents(missing_parents, db, logger)
@@ -19,6 +19,8 @@ sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from database import get_db
 from models import Dog
+from identifiers import normalize_identifier
+from jobs import enqueue_job, enqueue_parent_change
 from sqlalchemy.orm import Session
 
 
@@ -68,22 +70,6 @@ def clean_field_value(value: Optional[str]) -> Optional[str]:
     return value.strip()
 
 
-def normalize_for_comparison(reg_code: Optional[str]) -> Optional[str]:
-    """Normalize registration number for duplicate detection"""
-    if not reg_code:
-        return None
-    
-    # Remove all spaces and convert to uppercase
-    normalized = re.sub(r'\s+', '', reg_code.strip().upper())
-    
-    # Handle common patterns
-    # "N17385/06" should match "NO 17385/06" -> both become "NO17385/06"
-    if re.match(r'^N\d+/', normalized):
-        normalized = 'NO' + normalized[1:]
-    
-    return normalized
-
-
 def normalize_dog_name_for_comparison(name: Optional[str]) -> Optional[str]:
     """Normalize dog name for duplicate detection"""
     if not name:
@@ -100,28 +86,28 @@ def normalize_dog_name_for_comparison(name: Optional[str]) -> Optional[str]:
     return normalized
 
 
-def find_dog_by_name_and_reg(name: str, reg_number: str, existing_dogs: List[Dog]) -> Optional[Dog]:
-    """Find dog by name and registration number"""
-    norm_name = normalize_dog_name_for_comparison(name)
-    norm_reg = normalize_for_comparison(reg_number)
-    
-    for dog in existing_dogs:
-        # Check by registration number first (stronger identifier)
-        if norm_reg and dog.registration_number:
-            existing_norm_reg = normalize_for_comparison(dog.registration_number)
-            if norm_reg == existing_norm_reg:
-                return dog
-        
-        # Check by name
-        if norm_name and dog.name:
-            existing_norm_name = normalize_dog_name_for_comparison(dog.name)
-            if norm_name == existing_norm_name:
-                return dog
-    
-    return None
+def load_name_index(db: Session) -> Dict[str, List[int]]:
+    """Ids of the existing dogs by comparison-normalized name, from one id/name query"""
+    dogs_by_name: Dict[str, List[int]] = {}
+    for dog_id, name in db.query(Dog.id, Dog.name).order_by(Dog.id):
+        norm_name = normalize_dog_name_for_comparison(name)
+        if norm_name:
+            dogs_by_name.setdefault(norm_name, []).append(dog_id)
+    return dogs_by_name
+
 
+def find_dog_by_name_and_reg(name: str, reg_number: str, db: Session, dogs_by_name: Dict[str, List[int]]) -> Optional[Dog]:
+    """Find dog by registration number (indexed registration_key lookup), then by name"""
+    reg_key = normalize_identifier(reg_number)
+    if reg_key:
+        dog = db.query(Dog).filter(Dog.registration_key == reg_key).order_by(Dog.id).first()
+        if dog:
+            return dog
+    
+    dog_ids = dogs_by_name.get(normalize_dog_name_for_comparison(name))
+    return db.get(Dog, dog_ids[0]) if dog_ids else None
 
-def find_offspring_dog(record: Dict, existing_dogs: List[Dog]) -> Optional[Dog]:
+def find_offspring_dog(record: Dict, db: Session, dogs_by_name: Dict[str, List[int]]) -> Optional[Dog]:
     """Find the offspring dog from the record"""
     offspring_name = clean_field_value(record.get('name'))
     offspring_reg = clean_field_value(record.get('regCode'))
@@ -130,20 +116,13 @@ def find_offspring_dog(record: Dict, existing_dogs: List[Dog]) -> Optional[Dog]:
         return None
     
     if offspring_reg:
-        return find_dog_by_name_and_reg(offspring_name, offspring_reg, existing_dogs)
+        return find_dog_by_name_and_reg(offspring_name, offspring_reg, db, dogs_by_name)
     else:
         # Find by name only
-        norm_name = normalize_dog_name_for_comparison(offspring_name)
-        for dog in existing_dogs:
-            if dog.name:
-                existing_norm_name = normalize_dog_name_for_comparison(dog.name)
-                if norm_name == existing_norm_name:
-                    return dog
-    
-    return None
+        dog_ids = dogs_by_name.get(normalize_dog_name_for_comparison(offspring_name))
+        return db.get(Dog, dog_ids[0]) if dog_ids else None
 
-
-def update_parent_relationships(records: List[Dict], existing_dogs: List[Dog], db: Session, logger) -> Dict:
+def update_parent_relationships(records: List[Dict], db: Session, logger) -> Dict:
     """Update parent relationships for all dogs"""
     
     stats = {
@@ -154,15 +133,17 @@ def update_parent_relationships(records: List[Dict], existing_dogs: List[Dog], d
         'missing_fathers': 0,
         'missing_mothers': 0,
         'missing_offspring': 0,
-        'errors': 0
+        'errors': 0,
+        'changed_dog_ids': set()
     }
     
     logger.info(f"Updating parent relationships for {len(records)} records...")
+    dogs_by_name = load_name_index(db)
     
     for i, record in enumerate(records, 1):
         try:
             # Find the offspring dog
-            offspring_dog = find_offspring_dog(record, existing_dogs)
+            offspring_dog = find_offspring_dog(record, db, dogs_by_name)
             if not offspring_dog:
                 logger.warning(f"Record {i}: Offspring dog not found: {record.get('name', 'UNKNOWN')}")
                 stats['missing_offspring'] += 1
@@ -178,8 +159,10 @@ def update_parent_relationships(records: List[Dict], existing_dogs: List[Dog], d
             
             # Find and link father
             if father_name and father_reg:
-                father_dog = find_dog_by_name_and_reg(father_name, father_reg, existing_dogs)
+                father_dog = find_dog_by_name_and_reg(father_name, father_reg, db, dogs_by_name)
                 if father_dog:
+                    if offspring_dog.sire_id != father_dog.id:
+                        stats['changed_dog_ids'].add(offspring_dog.id)
                     offspring_dog.sire_id = father_dog.id
                     stats['fathers_linked'] += 1
                     logger.info(f"Record {i}: Linked father {father_dog.name} (ID: {father_dog.id}) to {offspring_dog.name} (ID: {offspring_dog.id})")
@@ -189,8 +172,10 @@ def update_parent_relationships(records: List[Dict], existing_dogs: List[Dog], d
             
             # Find and link mother
             if mother_name and mother_reg:
-                mother_dog = find_dog_by_name_and_reg(mother_name, mother_reg, existing_dogs)
+                mother_dog = find_dog_by_name_and_reg(mother_name, mother_reg, db, dogs_by_name)
                 if mother_dog:
+                    if offspring_dog.dam_id != mother_dog.id:
+                        stats['changed_dog_ids'].add(offspring_dog.id)
                     offspring_dog.dam_id = mother_dog.id
                     stats['mothers_linked'] += 1
                     logger.info(f"Record {i}: Linked mother {mother_dog.name} (ID: {mother_dog.id}) to {offspring_dog.name} (ID: {offspring_dog.id})")
@@ -239,12 +224,20 @@ def main():
         # Import to database
         db = next(get_db())
         try:
-            # Get all existing dogs
-            existing_dogs = db.query(Dog).all()
-            logger.info(f"Loaded {len(existing_dogs)} existing dogs")
-            
             # Update parent relationships
-            stats = update_parent_relationships(records, existing_dogs, db, logger)
+            stats = update_parent_relationships(records, db, logger)
+            
+            # Phases 1-2 inserted dogs directly, so the app's search index is rebuilt
+            search_job = enqueue_job(db, "rebuild-search-index")
+            logger.info(f"Queued job {search_job.id} (rebuild-search-index)")
+            
+            # Queue the closure table rebuild and the stored COI/completeness of the relinked
+            # dogs and their descendants for the app's job worker
+            if stats['changed_dog_ids']:
+                ancestry_job = enqueue_job(db, "rebuild-ancestry")
+                propagation_job = enqueue_parent_change(db, stats['changed_dog_ids'], reload_graph=True)
+                logger.info(f"Queued jobs {ancestry_job.id} (rebuild-ancestry) and {propagation_job.id} "
+                            f"(propagate-parent-change, {len(stats['changed_dog_ids'])} dogs)")
             
             # Print summary
             logger.info("\n" + "=" * 60)
@@ -14,28 +14,7 @@ sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from database import get_db
 from models import Dog
-from sqlalchemy.orm import Session
-
-def normalize_for_comparison(text):
-    """Normalize text for comparison - same logic as import scripts"""
-    if not text or text.strip() == '':
-        return None
-    
-    # Convert to uppercase and remove extra spaces
-    normalized = text.strip().upper()
-    
-    # Handle registration number normalization
-    if any(char.isdigit() for char in normalized):
-        # This looks like a registration number
-        # Remove spaces and normalize common patterns
-        normalized = normalized.replace(' ', '')
-        
-        # Handle specific Norwegian patterns
-        if normalized.startswith('N') and '/' in normalized:
-            # Convert "N17385/06" to "NO17385/06"
-            normalized = normalized.replace('N', 'NO', 1)
-    
-    return normalized
+from identifiers import normalize_identifier
 
 def run_validation():
     """Run validation based on CSV data and registration numbers"""
@@ -56,27 +35,29 @@ def run_validation():
     try:
         # 1. Зареди CSV данните
         csv_dogs = []
-        bulgarian_reg_numbers = set()
+        bulgarian_reg_keys = set()
         
         with open(csv_file, 'r', encoding='utf-8') as file:
             csv_reader = csv.DictReader(file, delimiter=';')
             
             for row in csv_reader:
                 csv_dogs.append(row)
-                reg_code = row['regCode'].strip() if row['regCode'] else None
-                if reg_code:
-                    bulgarian_reg_numbers.add(reg_code)
+                reg_key = normalize_identifier(row['regCode'])
+                if reg_key:
+                    bulgarian_reg_keys.add(reg_key)
         
         print(f"📄 Записи в CSV файла: {len(csv_dogs)}")
-        print(f"📋 Уникални български регистрационни номера: {len(bulgarian_reg_numbers)}")
+        print(f"📋 Уникални български регистрационни номера: {len(bulgarian_reg_keys)}")
         print()
         
         # 2. Намери всички кучета с български регистрационни номера в базата данни
-        imported_dogs = []
-        for reg_num in bulgarian_reg_numbers:
-            dog = db.query(Dog).filter(Dog.registration_number == reg_num).first()
+        # By normalized registration key, as the importers match them (reused in 3. and 4.)
+        dogs_by_key = {}
+        for reg_key in bulgarian_reg_keys:
+            dog = db.query(Dog).filter(Dog.registration_key == reg_key).first()
             if dog:
-                imported_dogs.append(dog)
+                dogs_by_key[reg_key] = dog
+        imported_dogs = list(dogs_by_key.values())
         
         print(f"🐕 Импортирани кучета в базата данни: {len(imported_dogs)}")
         
@@ -86,12 +67,8 @@ def run_validation():
             reg_code = row['regCode'].strip() if row['regCode'] else None
             dog_name = row['name'].strip()
             
-            found = False
-            if reg_code:
-                # Search by registration number
-                dog = db.query(Dog).filter(Dog.registration_number == reg_code).first()
-                if dog:
-                    found = True
+            # Search by registration number
+            found = normalize_identifier(reg_code) in dogs_by_key
             
             if not found:
                 # Search by name if no reg number or not found
@@ -128,9 +105,7 @@ def run_validation():
             mother_name = row['motherName'].strip() if row['motherName'] else None
             
             # Find the dog in database
-            dog = None
-            if reg_code:
-                dog = db.query(Dog).filter(Dog.registration_number == reg_code).first()
+            dog = dogs_by_key.get(normalize_identifier(reg_code))
             if not dog:
                 dog = db.query(Dog).filter(Dog.name == dog_name).first()
             
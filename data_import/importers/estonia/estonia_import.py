@@ -20,6 +20,7 @@ from urllib.parse import urlparse
 sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from database import get_db
+from jobs import enqueue_job
 from models import Dog, HealthTest, HealthTestType
 from sqlalchemy.orm import Session
 
@@ -338,6 +339,10 @@ def comprehensive_import():
         logging.info(f"Dogs with both parents: {dogs_with_parents}")
         logging.info(f"Dogs with URLs: {dogs_with_urls}")
         
+        # Closure table, stored COI and pedigree stats are rebuilt by the app's job worker
+        job = enqueue_job(session, "refresh-registry")
+        logging.info(f"Queued job {job.id} (refresh-registry)")
+        
         return final_count
         
     except Exception as e:
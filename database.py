@@ -18,3 +18,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Async drivers for the same database, used by the async handlers (aiomysql / aiosqlite)
+ASYNC_DRIVERS = {"mysql+pymysql": "mysql+aiomysql", "mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for the matching async one"""
+    scheme, _, rest = url.partition("://")
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{scheme}'; set ASYNC_DATABASE_URL")
+    return f"{ASYNC_DRIVERS[scheme]}://{rest}"
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Created on first use, so scripts that only need the sync engine never load an async driver
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL or async_database_url(DATABASE_URL))
+        _AsyncSessionLocal = sessionmaker(bind=_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+# Dependency to get an async DB session (for handlers using the crud *_async functions)
+async def get_async_db():
+    get_async_engine()
+    async with _AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
@@ -0,0 +1,285 @@
+"""
+Facet index for PedigreeDatabase
+
+Search results and the /dogs list can be narrowed by breed, sex, birth year range,
+kennel, color, "has both parents" and "has health tests", and show how many dogs each
+value would leave. Counting that with GROUP BY per facet per request does not scale,
+so every facet value keeps a bitmap of its dogs (a Python int with bit n set for dog
+id n). A filter is an AND of bitmaps, a count is a popcount, and the counts of one
+facet are taken with every other active filter applied, so a value shows what picking
+it would give.
+
+Built from the dogs and health_tests tables at startup; crud write functions (dog
+create/update/delete and create_health_test) apply their change, and the
+rebuild-search-index job reloads it.
+"""
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Dog, HealthTest
+
+FACETS = ("breed", "sex", "year", "kennel", "color", "has_both_parents", "has_health_tests")
+FACET_LABELS = {
+    "breed": "Breed", "sex": "Sex", "year": "Year of birth", "kennel": "Kennel", "color": "Color",
+    "has_both_parents": "Both parents known", "has_health_tests": "Health tested"
+}
+# Dog columns the facet values are derived from
+FACET_FIELDS = ("breed", "sex", "date_of_birth", "kennel_name", "color", "sire_id", "dam_id")
+# Query parameters of parse_facet_filters
+FACET_PARAMS = ("breed", "sex", "kennel", "color", "year_from", "year_to", "has_both_parents", "has_health_tests")
+FACET_VALUE_LIMIT = int(os.getenv("FACET_VALUE_LIMIT", "20"))  # Values listed per facet, most common first
+
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def ids_bitmap(dog_ids: Iterable[int]) -> int:
+    """Bitmap with the bit of every given dog id set"""
+    dog_ids = list(dog_ids)
+    if not dog_ids:
+        return 0
+    data = bytearray(max(dog_ids) // 8 + 1)
+    for dog_id in dog_ids:
+        data[dog_id >> 3] |= 1 << (dog_id & 7)
+    return int.from_bytes(data, "little")
+
+
+def bitmap_ids(bitmap: int) -> List[int]:
+    """Dog ids of the set bits, ascending"""
+    dog_ids = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for position, byte in enumerate(data):
+        if byte:
+            base = position << 3
+            dog_ids.extend(base + bit for bit in _BYTE_BITS[byte])
+    return dog_ids
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bitmap: int) -> int:
+        """Number of set bits (int.bit_count needs Python 3.10)"""
+        return bin(bitmap).count("1")
+
+
+def facet_values(fields: Dict[str, Any], health_tests: int) -> Dict[str, Any]:
+    """Facet value of a dog for each facet (None where the dog has no value)"""
+    date_of_birth = fields.get("date_of_birth")
+    return {
+        "breed": fields.get("breed") or None,
+        "sex": fields.get("sex") or None,
+        "year": date_of_birth.year if date_of_birth else None,
+        "kennel": fields.get("kennel_name") or None,
+        "color": fields.get("color") or None,
+        "has_both_parents": bool(fields.get("sire_id") and fields.get("dam_id")),
+        "has_health_tests": health_tests > 0
+    }
+
+
+def parse_facet_filters(breed: Optional[str] = None, sex: Optional[str] = None, kennel: Optional[str] = None,
+                        color: Optional[str] = None, year_from: Optional[int] = None, year_to: Optional[int] = None,
+                        has_both_parents: Optional[bool] = None, has_health_tests: Optional[bool] = None) -> Dict[str, Any]:
+    """Active facet filters from request parameters; a year range is stored as "year": (from, to)"""
+    filters: Dict[str, Any] = {}
+    for facet, value in (("breed", breed), ("sex", sex), ("kennel", kennel), ("color", color)):
+        if value:
+            filters[facet] = value
+    if year_from is not None or year_to is not None:
+        filters["year"] = (year_from, year_to)
+    for facet, value in (("has_both_parents", has_both_parents), ("has_health_tests", has_health_tests)):
+        if value is not None:
+            filters[facet] = value
+    return filters
+
+
+class FacetIndex:
+    """Bitmap of dog ids per facet value, plus each dog's values for incremental updates"""
+
+    def __init__(self):
+        self.bitmaps: Dict[str, Dict[Any, int]] = {facet: {} for facet in FACETS}
+        self.all = 0
+        self.health_test_counts: Dict[int, int] = {}
+        self._values: Dict[int, Dict[str, Any]] = {}
+        self.version = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_db(cls, db: Session) -> "FacetIndex":
+        """Build every bitmap from one pass over dogs and one GROUP BY over health_tests"""
+        index = cls()
+        index.health_test_counts = dict(
+            db.query(HealthTest.dog_id, func.count(HealthTest.id)).group_by(HealthTest.dog_id).all()
+        )
+        members: Dict[str, Dict[Any, List[int]]] = {facet: {} for facet in FACETS}
+        columns = [getattr(Dog, field) for field in FACET_FIELDS]
+        for row in db.query(Dog.id, *columns).yield_per(5000):
+            values = facet_values({field: getattr(row, field) for field in FACET_FIELDS},
+                                  index.health_test_counts.get(row.id, 0))
+            index._values[row.id] = values
+            for facet, value in values.items():
+                if value is not None:
+                    members[facet].setdefault(value, []).append(row.id)
+        for facet, by_value in members.items():
+            index.bitmaps[facet] = {value: ids_bitmap(dog_ids) for value, dog_ids in by_value.items()}
+        index.all = ids_bitmap(index._values)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _clear(self, dog_id: int):
+        values = self._values.pop(dog_id, None)
+        if values is None:
+            return
+        mask = ~(1 << dog_id)
+        for facet, value in values.items():
+            bitmaps = self.bitmaps[facet]
+            if value in bitmaps:
+                bitmaps[value] &= mask
+                if not bitmaps[value]:
+                    del bitmaps[value]
+        self.all &= mask
+
+    def _set(self, dog_id: int, values: Dict[str, Any]):
+        bit = 1 << dog_id
+        for facet, value in values.items():
+            if value is not None:
+                bitmaps = self.bitmaps[facet]
+                bitmaps[value] = bitmaps.get(value, 0) | bit
+        self._values[dog_id] = values
+        self.all |= bit
+
+    def set_dog(self, dog_id: int, fields: Dict[str, Any]):
+        """Add a dog or re-derive its facet values"""
+        with self._lock:
+            self._clear(dog_id)
+            self._set(dog_id, facet_values(fields, self.health_test_counts.get(dog_id, 0)))
+            self.version += 1
+
+    def remove(self, dog_id: int):
+        with self._lock:
+            self._clear(dog_id)
+            self.health_test_counts.pop(dog_id, None)
+            self.version += 1
+
+    def add_health_test(self, dog_id: int):
+        with self._lock:
+            self.health_test_counts[dog_id] = self.health_test_counts.get(dog_id, 0) + 1
+            values = self._values.get(dog_id)
+            if values is not None and not values["has_health_tests"]:
+                self._clear(dog_id)
+                self._set(dog_id, {**values, "has_health_tests": True})
+            self.version += 1
+
+    def _facet_bitmap(self, facet: str, value: Any) -> int:
+        bitmaps = self.bitmaps[facet]
+        if facet == "year":
+            year_from, year_to = value
+            bitmap = 0
+            for year, year_bitmap in bitmaps.items():
+                if (year_from is None or year >= year_from) and (year_to is None or year <= year_to):
+                    bitmap |= year_bitmap
+            return bitmap
+        return bitmaps.get(value, 0)
+
+    def match(self, filters: Dict[str, Any], base: Optional[int] = None, ignore: Optional[str] = None) -> int:
+        """Bitmap of the dogs in ``base`` (default: all) passing every filter except ``ignore``"""
+        with self._lock:
+            bitmap = self.all if base is None else base
+            for facet, value in filters.items():
+                if facet != ignore:
+                    bitmap &= self._facet_bitmap(facet, value)
+            return bitmap
+
+    def _facet_scopes(self, filters: Dict[str, Any], base: Optional[int]) -> Dict[str, int]:
+        """
+        Bitmap each facet is counted over: ``base`` and every filter but the facet's own.
+        Each filter bitmap is built once and combined with prefix/suffix ANDs, so no
+        filter is re-applied per facet.
+        """
+        active = [facet for facet in FACETS if facet in filters]
+        bitmaps = [self._facet_bitmap(facet, filters[facet]) for facet in active]
+        prefix = [self.all if base is None else base]
+        for bitmap in bitmaps:
+            prefix.append(prefix[-1] & bitmap)
+        suffix = [-1] * (len(bitmaps) + 1)  # -1 has every bit set
+        for k in range(len(bitmaps) - 1, -1, -1):
+            suffix[k] = suffix[k + 1] & bitmaps[k]
+
+        scopes = {facet: prefix[-1] for facet in FACETS}
+        for k, facet in enumerate(active):
+            scopes[facet] = prefix[k] & suffix[k + 1]
+        return scopes
+
+    def counts(self, filters: Dict[str, Any], base: Optional[int] = None) -> Dict[str, List[Tuple[Any, int]]]:
+        """
+        (value, count) pairs per facet over ``base`` (default: all dogs), each facet
+        counted with the other facets' filters applied. Booleans list True first, years
+        newest first and other facets most common first, FACET_VALUE_LIMIT values each
+        (a selected value is always kept).
+        """
+        result = {}
+        with self._lock:
+            scopes = self._facet_scopes(filters, base)
+            for facet in FACETS:
+                scope = scopes[facet]
+                counts = []
+                for value, bitmap in self.bitmaps[facet].items():
+                    count = popcount(bitmap & scope)
+                    if count:
+                        counts.append((value, count))
+                if facet in ("has_both_parents", "has_health_tests"):
+                    counts.sort(key=lambda item: not item[0])
+                elif facet == "year":
+                    counts.sort(key=lambda item: -item[0])
+                else:
+                    counts.sort(key=lambda item: (-item[1], str(item[0])))
+                selected = filters.get(facet)
+                limited = counts[:FACET_VALUE_LIMIT]
+                if facet != "year" and selected is not None and all(value != selected for value, _ in limited):
+                    limited.extend(item for item in counts if item[0] == selected)
+                result[facet] = limited
+        return result
+
+
+_index: Optional[FacetIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_facet_index(db: Session) -> FacetIndex:
+    """(Re)build the process-wide facet index from the database"""
+    global _index
+    index = FacetIndex.from_db(db)
+    with _index_lock:
+        _index = index
+    return index
+
+
+def get_facet_index(db: Session) -> FacetIndex:
+    """Return the process-wide facet index, building it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FacetIndex.from_db(db)
+    return _index
+
+
+def facet_index_dog(dog: Dog):
+    """Apply a created or updated dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.set_dog(dog.id, {field: getattr(dog, field) for field in FACET_FIELDS})
+
+
+def facet_unindex_dog(dog_id: int):
+    """Apply a deleted dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.remove(dog_id)
+
+
+def facet_add_health_test(dog_id: int):
+    """Apply a new health test to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.add_health_test(dog_id)
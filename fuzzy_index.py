@@ -0,0 +1,186 @@
+"""
+Fuzzy name index for PedigreeDatabase
+
+Names come from Bulgarian (often transliterated from Cyrillic), Estonian and English
+sources, mostly uppercased, with apostrophes and dashes spelled every which way, so
+the same dog or kennel is rarely spelled identically twice. This index keeps the
+trigrams of every normalized dog name and kennel name and answers "names like this"
+by trigram similarity (shared trigrams / all trigrams, as PostgreSQL's pg_trgm does)
+without touching the dogs table.
+
+Normalization transliterates Cyrillic to Latin (Bulgarian streamlined system), drops
+diacritics (Estonian õ ä ö ü š ž), removes apostrophes and treats dashes as spaces,
+so "O'NEIL", "ONEIL" and "О'НИЙЛ" all meet.
+
+Candidates are found through the rarest trigrams of the query only: a name needs at
+least FUZZY_MIN_SIMILARITY of the query's trigrams in common, so it must share one of
+the rarest (n - needed + 1) of them. crud write functions keep the index current and
+the rebuild-search-index job reloads it together with the search index.
+"""
+import math
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from models import Dog
+
+FUZZY_FIELDS = ("name", "kennel_name")
+FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", "0.3"))
+
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sht",
+    "ъ": "a", "ь": "y", "ю": "yu", "я": "ya",
+    # Russian and Ukrainian letters seen in imported names
+    "ё": "e", "ы": "y", "э": "e", "є": "ye", "і": "i", "ї": "yi", "ґ": "g"
+}
+_TRANSLITERATION = str.maketrans(_CYRILLIC)
+_APOSTROPHES = re.compile(r"['`´‘’ʼʹ′]")
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lowercase ASCII words of a dog or kennel name, transliterated and folded"""
+    if not name:
+        return ""
+    text = name.casefold().translate(_TRANSLITERATION)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _APOSTROPHES.sub("", text)
+    # Dashes and any other punctuation separate words
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def trigrams(name: Optional[str]) -> FrozenSet[str]:
+    """Trigrams of the normalized words, each padded like pg_trgm ("  w", " wo", ..., "rd ")"""
+    grams = set()
+    for word in normalize_name(name).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class FuzzyIndex:
+    """Trigram -> dog ids postings for each of FUZZY_FIELDS, and each dog's trigram set"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FUZZY_FIELDS}
+        self.grams: Dict[str, Dict[int, FrozenSet[str]]] = {field: {} for field in FUZZY_FIELDS}
+        self.version = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_db(cls, db: Session) -> "FuzzyIndex":
+        index = cls()
+        for row in db.query(Dog.id, Dog.name, Dog.kennel_name).yield_per(5000):
+            index._add(row.id, {"name": row.name, "kennel_name": row.kennel_name})
+        return index
+
+    def __len__(self) -> int:
+        return len(self.grams["name"])
+
+    def _add(self, dog_id: int, fields: Dict[str, Optional[str]]):
+        for field in FUZZY_FIELDS:
+            grams = trigrams(fields.get(field))
+            if not grams:
+                continue
+            self.grams[field][dog_id] = grams
+            postings = self.postings[field]
+            for gram in grams:
+                postings.setdefault(gram, set()).add(dog_id)
+
+    def _remove(self, dog_id: int):
+        for field in FUZZY_FIELDS:
+            grams = self.grams[field].pop(dog_id, None)
+            if not grams:
+                continue
+            postings = self.postings[field]
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(dog_id)
+                    if not ids:
+                        del postings[gram]
+
+    def set_dog(self, dog_id: int, fields: Dict[str, Optional[str]]):
+        with self._lock:
+            self._remove(dog_id)
+            self._add(dog_id, fields)
+            self.version += 1
+
+    def remove(self, dog_id: int):
+        with self._lock:
+            self._remove(dog_id)
+            self.version += 1
+
+    def _field_matches(self, field: str, query_grams: FrozenSet[str], min_similarity: float) -> Dict[int, float]:
+        postings = self.postings[field]
+        dog_grams = self.grams[field]
+        # Prefix filter: only the rarest grams can seed candidates
+        needed = max(1, math.ceil(min_similarity * len(query_grams)))
+        rarest = sorted(query_grams, key=lambda gram: len(postings.get(gram, ())))
+        candidates: Set[int] = set()
+        for gram in rarest[:len(query_grams) - needed + 1]:
+            candidates.update(postings.get(gram, ()))
+
+        matches = {}
+        for dog_id in candidates:
+            grams = dog_grams[dog_id]
+            common = len(query_grams & grams)
+            similarity = common / (len(query_grams) + len(grams) - common)
+            if similarity >= min_similarity:
+                matches[dog_id] = similarity
+        return matches
+
+    def search(self, query: str, limit: int = 20, fields: Tuple[str, ...] = FUZZY_FIELDS,
+               min_similarity: float = FUZZY_MIN_SIMILARITY) -> List[Tuple[int, str, float]]:
+        """(dog_id, matched field, similarity) of the most similar names, best first"""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        best: Dict[int, Tuple[float, str]] = {}
+        with self._lock:
+            for field in fields:
+                for dog_id, similarity in self._field_matches(field, query_grams, min_similarity).items():
+                    if similarity > best.get(dog_id, (0.0, ""))[0]:
+                        best[dog_id] = (similarity, field)
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [(dog_id, field, round(similarity, 4)) for dog_id, (similarity, field) in ranked]
+
+
+_index: Optional[FuzzyIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_fuzzy_index(db: Session) -> FuzzyIndex:
+    """(Re)build the process-wide fuzzy name index from the database"""
+    global _index
+    index = FuzzyIndex.from_db(db)
+    with _index_lock:
+        _index = index
+    return index
+
+
+def get_fuzzy_index(db: Session) -> FuzzyIndex:
+    """Return the process-wide fuzzy name index, building it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FuzzyIndex.from_db(db)
+    return _index
+
+
+def fuzzy_index_dog(dog: Dog):
+    """Apply a created or updated dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.set_dog(dog.id, {field: getattr(dog, field) for field in FUZZY_FIELDS})
+
+
+def fuzzy_unindex_dog(dog_id: int):
+    """Apply a deleted dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.remove(dog_id)
@@ -0,0 +1,79 @@
+"""
+Normalized identifier keys for PedigreeDatabase
+
+Registration numbers, microchips and tattoo numbers arrive from each registry with
+its own spacing and prefixes ("N17385/06", "NO 17385/06"), and the importers used to
+normalize every stored row in Python for every lookup. Dog now carries the normalized
+form of each in an indexed *_key column (registration_key, microchip_key, tatoo_key),
+filled by a model event on every insert and update, so a lookup is an index seek.
+
+The Bulgarian importers match registration numbers and microchips through these
+columns as well. Existing databases get the columns and their values with
+`python maintenance.py backfill-identifier-keys`.
+"""
+import re
+from typing import Optional
+
+# Identifier column -> normalized key column on Dog
+IDENTIFIER_KEY_COLUMNS = {
+    "registration_number": "registration_key",
+    "microchip": "microchip_key",
+    "tatoo_no": "tatoo_key"
+}
+BACKFILL_BATCH_SIZE = 5000
+
+
+def normalize_identifier(value: Optional[str]) -> Optional[str]:
+    """Uppercase, no whitespace; "N17385/06" becomes "NO17385/06" to match "NO 17385/06" """
+    if not value:
+        return None
+    normalized = re.sub(r"\s+", "", value.strip().upper())
+    if re.match(r"^N\d+/", normalized):
+        normalized = "NO" + normalized[1:]
+    return normalized or None
+
+
+def fill_identifier_keys(dog) -> None:
+    """Set the *_key columns of a Dog from its identifier columns"""
+    for field, key_field in IDENTIFIER_KEY_COLUMNS.items():
+        setattr(dog, key_field, normalize_identifier(getattr(dog, field)))
+
+
+def add_identifier_key_columns(engine) -> list:
+    """Add the *_key columns and their indexes to an existing dogs table; returns the columns added"""
+    from sqlalchemy import inspect, text
+    from models import Dog
+
+    existing = {column["name"] for column in inspect(engine).get_columns(Dog.__tablename__)}
+    added = []
+    with engine.begin() as connection:
+        for key_field in IDENTIFIER_KEY_COLUMNS.values():
+            if key_field not in existing:
+                column_type = Dog.__table__.c[key_field].type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {Dog.__tablename__} ADD COLUMN {key_field} {column_type}"))
+                added.append(key_field)
+    for index in Dog.__table__.indexes:
+        if any(column.name in IDENTIFIER_KEY_COLUMNS.values() for column in index.columns):
+            index.create(bind=engine, checkfirst=True)
+    return added
+
+
+def backfill_identifier_keys(db) -> int:
+    """Recompute the *_key columns of every dog; returns the number of dogs whose keys changed"""
+    from models import Dog
+
+    columns = [getattr(Dog, field) for field in IDENTIFIER_KEY_COLUMNS]
+    key_columns = [getattr(Dog, key_field) for key_field in IDENTIFIER_KEY_COLUMNS.values()]
+    changed = []
+    for row in db.query(Dog.id, *columns, *key_columns).yield_per(BACKFILL_BATCH_SIZE):
+        values = {
+            key_field: normalize_identifier(getattr(row, field))
+            for field, key_field in IDENTIFIER_KEY_COLUMNS.items()
+        }
+        if any(getattr(row, key_field) != value for key_field, value in values.items()):
+            changed.append({"id": row.id, **values})
+
+    for start in range(0, len(changed), BACKFILL_BATCH_SIZE):
+        db.bulk_update_mappings(Dog, changed[start:start + BACKFILL_BATCH_SIZE])
+        db.commit()
+    return len(changed)
@@ -0,0 +1,225 @@
+"""
+Population-wide inbreeding coefficients for PedigreeDatabase
+
+Computes exact coefficients of inbreeding (all known generations, ancestor
+inbreeding included) for the whole registry in one topologically ordered pass
+using the Meuwissen & Luo (1992) algorithm, and stores them in dog_coi so
+request handlers can read a number instead of enumerating paths.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from models import DogCoi
+from pedigree_graph import NO_PARENT, ParentGraph, load_parent_graph
+
+INSERT_BATCH_SIZE = 5000
+
+# Bumped whenever this process rewrites dog_coi, so caches seeded from stored values
+# (kinship.get_registry_pedigree, utils.population_coi_fractions) know to reseed
+_stored_coi_version = 0
+
+
+def stored_coi_version() -> int:
+    """Version of the stored COIs as written by this process (see _stored_coi_changed)"""
+    return _stored_coi_version
+
+
+def _stored_coi_changed():
+    global _stored_coi_version
+    _stored_coi_version += 1
+
+
+def meuwissen_luo(sires: Sequence[int], dams: Sequence[int], known: Optional[Dict[int, float]] = None) -> List[float]:
+    """
+    Inbreeding coefficients for animals numbered 1..n.
+
+    sires[i] / dams[i] are the parent numbers of animal i (0 = unknown) and every
+    parent must be numbered before its offspring. Index 0 of both lists is unused.
+    ``known`` maps animal numbers to coefficients that are already known (e.g. stored
+    ones); those animals are taken as given instead of being recomputed.
+    Returns F as a list indexed the same way (F[0] is the -1 sentinel).
+    """
+    known = known or {}
+    n = len(sires) - 1
+    F = [0.0] * (n + 1)
+    F[0] = -1.0
+    D = [0.0] * (n + 1)  # Within-family variance of each animal's Mendelian sampling
+    L = [0.0] * (n + 1)  # Row of the L matrix (A = L D L') for the animal being processed
+    point = [0] * (n + 1)  # Linked list of pending ancestors, in descending order
+
+    for i in range(1, n + 1):
+        s, d = sires[i], dams[i]
+        D[i] = 0.5 - 0.25 * (F[s] + F[d])
+
+        if i in known:
+            F[i] = known[i]
+            continue
+        if s == 0 or d == 0:
+            F[i] = 0.0
+            continue
+        if s == sires[i - 1] and d == dams[i - 1]:
+            # Full sibling of the previous animal
+            F[i] = F[i - 1]
+            continue
+
+        fi = -1.0
+        L[i] = 1.0
+        j = i
+        while j:
+            r = 0.5 * L[j]
+            for parent in (sires[j], dams[j]):
+                if parent:
+                    k = j
+                    while point[k] > parent:
+                        k = point[k]
+                    L[parent] += r
+                    if point[k] != parent:
+                        point[parent] = point[k]
+                        point[k] = parent
+
+            fi += L[j] * L[j] * D[j]
+            L[j] = 0.0
+            k = j
+            j = point[j]
+            point[k] = 0
+
+        F[i] = fi
+
+    return F
+
+
+def topological_order(graph: ParentGraph, indexes: Optional[Iterable[int]] = None) -> List[int]:
+    """
+    Graph indexes ordered so parents come before offspring (Kahn's algorithm).
+    Restricted to ``indexes`` when given (the set must be closed under ancestry).
+    Dogs caught in a parent cycle (bad data) are appended at the end.
+    """
+    members = range(len(graph.ids)) if indexes is None else indexes
+    member_set = None if indexes is None else set(indexes)
+    pending = {}
+    order = []
+
+    for i in members:
+        if graph.ids[i] == 0:
+            continue
+        pending[i] = (graph.sires[i] != NO_PARENT) + (graph.dams[i] != NO_PARENT)
+        if pending[i] == 0:
+            order.append(i)
+
+    head = 0
+    while head < len(order):
+        i = order[head]
+        head += 1
+        for child in graph.children.get(i, ()):
+            if member_set is not None and child not in member_set:
+                continue
+            pending[child] -= 1
+            if pending[child] == 0:
+                order.append(child)
+
+    if len(order) < len(pending):
+        placed = set(order)
+        order.extend(i for i in pending if i not in placed)
+
+    return order
+
+
+def ancestor_closure(graph: ParentGraph, dog_ids: Iterable[int]) -> List[int]:
+    """Graph indexes of the given dogs plus all of their ancestors (all generations)"""
+    seen = set()
+    stack = [graph.index[dog_id] for dog_id in dog_ids if dog_id in graph.index]
+    while stack:
+        i = stack.pop()
+        if i in seen:
+            continue
+        seen.add(i)
+        for parent_index in (graph.sires[i], graph.dams[i]):
+            if parent_index != NO_PARENT and parent_index not in seen:
+                stack.append(parent_index)
+    return list(seen)
+
+
+def number_pedigree(graph: ParentGraph, order: List[int]) -> Tuple[List[int], List[int]]:
+    """Renumber ordered graph indexes 1..n as meuwissen_luo expects; returns (sires, dams)"""
+    number = {i: n for n, i in enumerate(order, start=1)}
+    sires = [0] * (len(order) + 1)
+    dams = [0] * (len(order) + 1)
+    for n, i in enumerate(order, start=1):
+        # A parent numbered after its offspring can only come from a cycle; treat it as unknown
+        s = number.get(graph.sires[i], 0) if graph.sires[i] != NO_PARENT else 0
+        d = number.get(graph.dams[i], 0) if graph.dams[i] != NO_PARENT else 0
+        sires[n] = s if s < n else 0
+        dams[n] = d if d < n else 0
+    return sires, dams
+
+
+def compute_coi(graph: ParentGraph, dog_ids: Optional[Iterable[int]] = None,
+                known: Optional[Dict[int, float]] = None) -> Dict[int, float]:
+    """
+    Exact inbreeding coefficients (as fractions) keyed by dog id.
+    Covers the whole registry, or only ``dog_ids`` and their ancestors when given.
+    Dogs in ``known`` ({dog_id: F}) are taken as given instead of being recomputed.
+    """
+    indexes = None if dog_ids is None else ancestor_closure(graph, dog_ids)
+    order = topological_order(graph, indexes)
+    sires, dams = number_pedigree(graph, order)
+    known_numbers = {n: known[graph.ids[i]] for n, i in enumerate(order, start=1) if graph.ids[i] in known} if known else None
+    F = meuwissen_luo(sires, dams, known_numbers)
+    return {graph.ids[i]: F[n] for n, i in enumerate(order, start=1)}
+
+
+def recompute_population_coi(db: Session) -> int:
+    """Recompute and store the COI of every dog; returns the number of dogs written"""
+    graph = load_parent_graph(db)
+    coefficients = compute_coi(graph)
+    db.query(DogCoi).delete(synchronize_session=False)
+    _write_coi(db, coefficients)
+    db.commit()
+    _stored_coi_changed()
+    return len(coefficients)
+
+
+def refresh_coi(db: Session, graph: ParentGraph, dog_ids: Iterable[int]) -> int:
+    """
+    Recompute the stored COI of exactly the given dogs, e.g. a dog whose parents changed
+    plus all of its descendants. Their other ancestors keep their stored values.
+    Returns the number of dogs written.
+    """
+    dog_ids = {dog_id for dog_id in dog_ids if dog_id in graph}
+    if not dog_ids:
+        return 0
+    ancestry = {graph.ids[i] for i in ancestor_closure(graph, dog_ids)} - dog_ids
+    coefficients = compute_coi(graph, dog_ids, get_stored_coi(db, ancestry))
+    db.query(DogCoi).filter(DogCoi.dog_id.in_(dog_ids)).delete(synchronize_session=False)
+    _write_coi(db, {dog_id: coefficients[dog_id] for dog_id in dog_ids})
+    db.commit()
+    _stored_coi_changed()
+    return len(dog_ids)
+
+
+def remove_coi(db: Session, dog_id: int):
+    """Delete the stored COI of a dog that is being deleted (caller commits)"""
+    db.query(DogCoi).filter(DogCoi.dog_id == dog_id).delete(synchronize_session=False)
+
+
+def _write_coi(db: Session, coefficients: Dict[int, float]):
+    computed_at = datetime.utcnow()
+    batch = []
+    for dog_id, coi in coefficients.items():
+        batch.append({"dog_id": dog_id, "coi": coi, "computed_at": computed_at})
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.execute(DogCoi.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.execute(DogCoi.__table__.insert(), batch)
+
+
+def get_stored_coi(db: Session, dog_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """Stored COI fractions for the given dogs (every stored dog when omitted); dogs without a stored value are omitted"""
+    query = db.query(DogCoi.dog_id, DogCoi.coi)
+    if dog_ids is not None:
+        dog_ids = list(set(dog_ids))
+        if not dog_ids:
+            return {}
+        query = query.filter(DogCoi.dog_id.in_(dog_ids))
+    return {dog_id: coi for dog_id, coi in query.all()}
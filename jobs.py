@@ -0,0 +1,265 @@
+"""
+Background recomputation jobs for PedigreeDatabase
+
+Heavy work (full COI recomputes, closure-table and search index rebuilds, pedigree
+statistics and change propagation after parent edits) is queued as rows of the jobs table instead
+of running inside a request. A worker thread started with the app claims queued jobs
+oldest first and records status, progress and a JSON result on the row, which
+/api/jobs/{id} reports.
+
+The table is the queue, so there is no broker to run: importers running as separate
+scripts enqueue jobs the same way and the app picks them up, and a job is claimed
+with a conditional UPDATE so several app processes can share the table.
+`python maintenance.py run-jobs` drains the queue without the app.
+
+A job whose worker died (process killed, server restarted) stays "running"; every
+worker pass first requeues jobs that have been running for longer than
+JOB_STALE_SECONDS, and fails them if that already happened once.
+"""
+import json
+import logging
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Job
+
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_WORKER_ENABLED = os.getenv("JOB_WORKER_ENABLED", "1") == "1"
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "21600"))  # Longest a job may run before it counts as abandoned
+STALE_JOB_ERROR = "Requeued: worker stopped while the job was running"
+
+logger = logging.getLogger(__name__)
+
+Progress = Callable[[float], None]
+
+
+def _rebuild_ancestry(db: Session, payload: dict, progress: Progress) -> Dict[str, Any]:
+    from ancestry import rebuild_ancestry
+    return {"rows": rebuild_ancestry(db)}
+
+
+def _recompute_coi(db: Session, payload: dict, progress: Progress) -> Dict[str, Any]:
+    from inbreeding import recompute_population_coi
+    return {"dogs": recompute_population_coi(db)}
+
+
+def _recompute_pedigree_stats(db: Session, payload: dict, progress: Progress) -> Dict[str, Any]:
+    from pedigree_stats import recompute_pedigree_stats
+    return {"dogs": recompute_pedigree_stats(db)}
+
+
+def _rebuild_search_index(db: Session, payload: dict, progress: Progress) -> Dict[str, Any]:
+    from autocomplete import load_autocomplete_index
+    from facets import load_facet_index
+    from fuzzy_index import load_fuzzy_index
+    from search_index import load_search_index
+    load_fuzzy_index(db)
+    load_autocomplete_index(db)
+    load_facet_index(db)
+    return {"dogs": len(load_search_index(db))}
+
+
+def _refresh_registry(db: Session, payload: dict, progress: Progress) -> Dict[str, Any]:
+    """Everything derived from the dogs table, e.g. after a bulk import"""
+    result = {"search_index_dogs": _rebuild_search_index(db, payload, progress)["dogs"]}
+    result["ancestry_rows"] = _rebuild_ancestry(db, payload, progress)["rows"]
+    progress(1 / 3)
+    result["coi_dogs"] = _recompute_coi(db, payload, progress)["dogs"]
+    progress(2 / 3)
+    result["pedigree_stats_dogs"] = _recompute_pedigree_stats(db, payload, progress)["dogs"]
+    return result
+
+
+def _propagate_parent_change(db: Session, payload: dict, progress: Progress) -> Dict[str, Any]:
+    from pedigree_graph import load_parent_graph
+    from propagation import propagate_parent_change
+    if payload.get("reload_graph"):
+        # Queued by a process that wrote the parent links directly (an importer)
+        load_parent_graph(db)
+    return propagate_parent_change(db, payload["dog_ids"])
+
+
+JOB_HANDLERS: Dict[str, Callable[[Session, dict, Progress], Dict[str, Any]]] = {
+    "rebuild-ancestry": _rebuild_ancestry,
+    "recompute-coi": _recompute_coi,
+    "recompute-pedigree-stats": _recompute_pedigree_stats,
+    "rebuild-search-index": _rebuild_search_index,
+    "refresh-registry": _refresh_registry,
+    "propagate-parent-change": _propagate_parent_change,
+}
+# Kinds that take no arguments and may be queued through the API
+REGISTRY_JOB_KINDS = ("rebuild-ancestry", "recompute-coi", "recompute-pedigree-stats", "rebuild-search-index",
+                      "refresh-registry")
+
+_wake = threading.Event()
+_stop = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def enqueue_job(db: Session, kind: str, payload: Optional[dict] = None) -> Job:
+    """
+    Queue a job and wake the worker. An identical job that has not started yet
+    already covers the request, so it is returned instead of queueing another.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    payload_json = json.dumps(payload, sort_keys=True) if payload else None
+
+    query = db.query(Job).filter(Job.kind == kind, Job.status == "queued")
+    query = query.filter(Job.payload.is_(None) if payload_json is None else Job.payload == payload_json)
+    job = query.first()
+    if job is None:
+        job = Job(kind=kind, payload=payload_json, status="queued", progress=0.0)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+    _wake.set()
+    return job
+
+
+def enqueue_parent_change(db: Session, dog_ids: Iterable[int], reload_graph: bool = False) -> Optional[Job]:
+    """Queue the closure rows and stored metrics of new dogs or dogs whose parents changed, and their descendants"""
+    dog_ids = sorted(set(dog_ids))
+    if not dog_ids:
+        return None
+    payload = {"dog_ids": dog_ids}
+    if reload_graph:
+        payload["reload_graph"] = True
+    return enqueue_job(db, "propagate-parent-change", payload)
+
+
+def claim_next_job(db: Session) -> Optional[Job]:
+    """Mark the oldest queued job as running and return it (None when the queue is empty)"""
+    while True:
+        row = db.query(Job.id).filter(Job.status == "queued").order_by(Job.id).first()
+        if row is None:
+            return None
+        claimed = db.query(Job).filter(Job.id == row.id, Job.status == "queued").update(
+            {"status": "running", "started_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        if claimed:
+            return db.get(Job, row.id)
+        # Another worker got there first; try the next one
+
+
+def requeue_stale_jobs(db: Session) -> int:
+    """
+    Requeue jobs that have been running for longer than JOB_STALE_SECONDS (their worker
+    died), or mark them failed if they were requeued before. Returns the number of jobs touched.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    touched = 0
+    for job in db.query(Job).filter(Job.status == "running", Job.started_at < cutoff).all():
+        if job.error == STALE_JOB_ERROR:
+            values = {"status": "failed", "finished_at": datetime.utcnow(),
+                      "error": "Worker stopped while the job was running (twice); not requeued again"}
+        else:
+            values = {"status": "queued", "started_at": None, "progress": 0.0, "error": STALE_JOB_ERROR}
+        # Conditional, so a job another process recovered or finished meanwhile is left alone
+        updated = db.query(Job).filter(
+            Job.id == job.id, Job.status == "running", Job.started_at == job.started_at
+        ).update(values, synchronize_session=False)
+        if updated:
+            touched += 1
+            logger.warning("Job %s (%s) was running since %s; %s", job.id, job.kind, job.started_at,
+                           "marked failed" if values["status"] == "failed" else "requeued")
+    db.commit()
+    return touched
+
+
+def run_job(db: Session, job: Job) -> Job:
+    """Run a claimed job and record its outcome on the row"""
+    def progress(fraction: float):
+        job.progress = round(fraction, 4)
+        db.commit()
+
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        result = handler(db, json.loads(job.payload) if job.payload else {}, progress)
+        job.status = "done"
+        job.progress = 1.0
+        job.result = json.dumps(result)
+    except Exception:
+        db.rollback()
+        job.status = "failed"
+        job.error = traceback.format_exc()
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    return job
+
+
+def run_pending_jobs(db: Session) -> int:
+    """Run queued jobs until the queue is empty (after requeueing stale ones); returns the number of jobs run"""
+    requeue_stale_jobs(db)
+    count = 0
+    while not _stop.is_set():
+        job = claim_next_job(db)
+        if job is None:
+            break
+        run_job(db, job)
+        count += 1
+    return count
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        _wake.clear()
+        db = SessionLocal()
+        try:
+            run_pending_jobs(db)
+        except Exception:
+            logger.exception("Job worker error")
+        finally:
+            db.close()
+        _wake.wait(JOB_POLL_SECONDS)
+
+
+def start_job_worker():
+    """Start the worker thread (once per process; disabled with JOB_WORKER_ENABLED=0)"""
+    global _worker
+    if not JOB_WORKER_ENABLED or (_worker is not None and _worker.is_alive()):
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_worker_loop, name="job-worker", daemon=True)
+    _worker.start()
+
+
+def stop_job_worker(timeout: float = 5.0):
+    """Ask the worker to stop after its current job"""
+    _stop.set()
+    _wake.set()
+    if _worker is not None:
+        _worker.join(timeout)
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "payload": json.loads(job.payload) if job.payload else None,
+        "status": job.status,
+        "progress": job.progress,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+
+
+def get_jobs(db: Session, kind: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> List[Job]:
+    """Most recent jobs first, optionally filtered by kind and status"""
+    query = db.query(Job)
+    if kind:
+        query = query.filter(Job.kind == kind)
+    if status:
+        query = query.filter(Job.status == status)
+    return query.order_by(Job.id.desc()).limit(limit).all()
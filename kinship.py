@@ -0,0 +1,307 @@
+"""
+Vectorized kinship for PedigreeDatabase
+
+Computes columns of the additive relationship matrix A for the joint ancestry of
+a set of dogs with Colleau's (2002) indirect method, A = T D T', where T is the
+inverse of (I - P) and P holds 1/2 for each known parent. Instead of walking the
+pedigree once per pair, both triangular solves run for all requested columns at once:
+one NumPy step per generation layer of the pedigree.
+
+The COI of a (possibly hypothetical) offspring of sire s and dam d is the kinship
+of its parents, A[s, d] / 2, over all known generations with ancestor inbreeding.
+"""
+import copy
+import os
+import threading
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from models import Dog
+from inbreeding import ancestor_closure, get_stored_coi, meuwissen_luo, number_pedigree, stored_coi_version, \
+    topological_order
+from pedigree_graph import ParentGraph, get_parent_graph
+
+MATING_MATRIX_MAX_DOGS = int(os.getenv("MATING_MATRIX_MAX_DOGS", "1000"))  # Per side, API requests only
+
+
+class KinshipPedigree:
+    """
+    The ancestry of a set of dogs (the whole registry by default), numbered 1..n parents-first and split into
+    generation layers (founders in layer 0, every other dog one layer below its deepest parent).
+
+    ``known_inbreeding`` ({dog_id: F}, e.g. the stored dog_coi values) spares the
+    Meuwissen & Luo pass for those dogs; only the rest of the ancestry is computed.
+    """
+
+    def __init__(self, graph: ParentGraph, dog_ids: Optional[Iterable[int]] = None,
+                 known_inbreeding: Optional[Dict[int, float]] = None):
+        order = topological_order(graph, None if dog_ids is None else ancestor_closure(graph, dog_ids))
+        sires, dams = number_pedigree(graph, order)
+        self.number = {graph.ids[i]: n for n, i in enumerate(order, start=1)}
+        self.sires = np.array(sires, dtype=np.int64)
+        self.dams = np.array(dams, dtype=np.int64)
+
+        # Mendelian sampling variances, with F[0] = -1 standing in for unknown parents
+        known = {self.number[dog_id]: F for dog_id, F in (known_inbreeding or {}).items() if dog_id in self.number}
+        F = np.array(meuwissen_luo(sires, dams, known))
+        self.inbreeding = F
+        self.variances = 0.5 - 0.25 * (F[self.sires] + F[self.dams])
+        self.variances[0] = 0.0
+
+        level = [-1] * len(sires)
+        for n in range(1, len(sires)):
+            level[n] = 1 + max(level[sires[n]], level[dams[n]])
+        self.levels = level
+        levels = np.array(level[1:], dtype=np.int64)
+        numbers = np.argsort(levels, kind="stable") + 1
+        bounds = np.flatnonzero(np.diff(levels[numbers - 1])) + 1
+        self.layers: List[np.ndarray] = np.split(numbers, bounds) if len(numbers) else []
+
+    def __len__(self) -> int:
+        return len(self.sires) - 1
+
+    def with_new_dogs(self, graph: ParentGraph, dog_ids: List[int],
+                      known_inbreeding: Optional[Dict[int, float]] = None) -> "KinshipPedigree":
+        """
+        A copy extended with dogs added to the graph since this pedigree was built, given
+        parents-first (the order they were added in). Each new dog is numbered last; its F
+        is the kinship of its parents, read from one relationship column, so nothing
+        already numbered is recomputed. The original is left untouched for concurrent readers.
+        """
+        extended = copy.copy(self)
+        extended.number = dict(self.number)
+        extended.levels = list(self.levels)
+        extended.layers = list(self.layers)
+        known_inbreeding = known_inbreeding or {}
+        for dog_id in dog_ids:
+            sire_id, dam_id = graph.parents(dog_id)
+            s = extended.number.get(sire_id, 0)
+            d = extended.number.get(dam_id, 0)
+            if dog_id in known_inbreeding:
+                F = known_inbreeding[dog_id]
+            elif s and d:
+                F = 0.5 * extended.relationship_columns([sire_id])[d, 0]
+            else:
+                F = 0.0
+
+            n = len(extended.sires)
+            extended.number[dog_id] = n
+            extended.sires = np.append(extended.sires, s)
+            extended.dams = np.append(extended.dams, d)
+            extended.inbreeding = np.append(extended.inbreeding, F)
+            extended.variances = np.append(
+                extended.variances, 0.5 - 0.25 * (extended.inbreeding[s] + extended.inbreeding[d])
+            )
+            level = 1 + max(extended.levels[s], extended.levels[d])
+            extended.levels.append(level)
+            if level < len(extended.layers):
+                extended.layers[level] = np.append(extended.layers[level], n)
+            else:
+                extended.layers.append(np.array([n], dtype=np.int64))
+        return extended
+
+    def relationship_columns(self, column_ids: List[int]) -> np.ndarray:
+        """A[:, column_ids] as an (n + 1) x len(column_ids) array indexed by pedigree number (row 0 unused)"""
+        columns = np.zeros((len(self.sires), len(column_ids)))
+        columns[[self.number[dog_id] for dog_id in column_ids], np.arange(len(column_ids))] = 1.0
+
+        # T' solve, offspring before parents: each dog passes half of its value to both parents
+        for layer in reversed(self.layers):
+            half = 0.5 * columns[layer]
+            np.add.at(columns, self.sires[layer], half)
+            np.add.at(columns, self.dams[layer], half)
+            columns[0] = 0.0
+
+        columns *= self.variances[:, None]
+
+        # T solve, parents before offspring: each dog adds the mean of its parents' values
+        for layer in self.layers:
+            columns[layer] += 0.5 * (columns[self.sires[layer]] + columns[self.dams[layer]])
+
+        return columns
+
+    def inbreeding_of(self, dog_ids: Iterable[int]) -> Dict[int, float]:
+        """F of the given dogs that are numbered in this pedigree"""
+        return {dog_id: float(self.inbreeding[self.number[dog_id]]) for dog_id in dog_ids if dog_id in self.number}
+
+    def offspring_coi_with(self, dog_id: int, partner_ids: List[int]) -> np.ndarray:
+        """COI (as fractions) of offspring of one dog with each partner, from a single column pass"""
+        column = self.relationship_columns([dog_id])[:, 0]
+        return 0.5 * column[[self.number[partner_id] for partner_id in partner_ids]]
+
+
+# (graph, lineage_version, stored COI version, graph slots covered, pedigree)
+_registry_pedigree: Optional[Tuple[ParentGraph, int, int, int, KinshipPedigree]] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry_pedigree(db: Session) -> KinshipPedigree:
+    """
+    KinshipPedigree of the whole registry, seeded with the stored COIs. Built once and
+    rebuilt when parent links of existing dogs change or the stored COIs are rewritten
+    (e.g. by the propagate-parent-change job that follows a parent edit); dogs added
+    since are appended to it (KinshipPedigree.with_new_dogs).
+    """
+    global _registry_pedigree
+    graph = get_parent_graph(db)
+    with _registry_lock:
+        cached = _registry_pedigree
+        coi_version = stored_coi_version()
+        if (cached is not None and cached[0] is graph and cached[1] == graph.lineage_version
+                and cached[2] == coi_version):
+            _, version, _, size, pedigree = cached
+            if size == len(graph.ids):
+                return pedigree
+            new_ids = [dog_id for dog_id in graph.ids[size:] if dog_id in graph and dog_id not in pedigree.number]
+            size = len(graph.ids)
+            pedigree = pedigree.with_new_dogs(graph, new_ids, get_stored_coi(db, new_ids))
+        else:
+            version = graph.lineage_version
+            size = len(graph.ids)
+            pedigree = KinshipPedigree(graph, known_inbreeding=get_stored_coi(db))
+        _registry_pedigree = (graph, version, coi_version, size, pedigree)
+        return pedigree
+
+
+def pairwise_offspring_coi(graph: ParentGraph, sire_ids: List[int], dam_ids: List[int],
+                           known_inbreeding: Optional[Dict[int, float]] = None) -> Tuple[List[int], List[int], np.ndarray]:
+    """
+    COI (as fractions) of the offspring of every sire x dam pairing.
+    Dogs missing from the parent graph are dropped; returns (sire_ids, dam_ids, matrix)
+    with matrix[i, j] for sire_ids[i] x dam_ids[j].
+    """
+    sire_ids = [dog_id for dog_id in dict.fromkeys(sire_ids) if dog_id in graph]
+    dam_ids = [dog_id for dog_id in dict.fromkeys(dam_ids) if dog_id in graph]
+    if not sire_ids or not dam_ids:
+        return sire_ids, dam_ids, np.zeros((len(sire_ids), len(dam_ids)))
+
+    pedigree = KinshipPedigree(graph, sire_ids + dam_ids, known_inbreeding)
+    # A is symmetric, so solve for the shorter list and read the other from the rows
+    if len(dam_ids) <= len(sire_ids):
+        columns = pedigree.relationship_columns(dam_ids)
+        matrix = columns[[pedigree.number[dog_id] for dog_id in sire_ids]]
+    else:
+        columns = pedigree.relationship_columns(sire_ids)
+        matrix = columns[[pedigree.number[dog_id] for dog_id in dam_ids]].T
+
+    return sire_ids, dam_ids, 0.5 * matrix
+
+
+
+def get_coi_matrix(db: Session, sire_ids: List[int], dam_ids: List[int]) -> Dict[str, Any]:
+    """
+    Offspring COI percentages for every sire x dam pairing, with the dogs listed in matrix order.
+    Ancestors with a stored COI (maintenance.py recompute-coi) are not recomputed.
+    Ids that are not in the registry are reported under missing_ids.
+    """
+    graph = get_parent_graph(db)
+    ancestry = [graph.ids[i] for i in ancestor_closure(graph, list(sire_ids) + list(dam_ids))]
+    found_sire_ids, found_dam_ids, matrix = pairwise_offspring_coi(graph, sire_ids, dam_ids, get_stored_coi(db, ancestry))
+    dogs = {
+        dog.id: {"id": dog.id, "name": dog.name, "registration_number": dog.registration_number}
+        for dog in db.query(Dog).filter(Dog.id.in_(set(found_sire_ids) | set(found_dam_ids))).all()
+    }
+    found = set(found_sire_ids) | set(found_dam_ids)
+    return {
+        "sires": [dogs.get(dog_id, {"id": dog_id}) for dog_id in found_sire_ids],
+        "dams": [dogs.get(dog_id, {"id": dog_id}) for dog_id in found_dam_ids],
+        "coi_percentage": np.round(matrix * 100, 4).tolist(),
+        "missing_ids": sorted((set(sire_ids) | set(dam_ids)) - found)
+    }
+
+
+def get_trial_mating_coi(db: Session, sire_id: int, dam_id: int, generations: int = 5) -> Dict[str, Any]:
+    """
+    COI of a hypothetical litter of sire x dam: the kinship of the parents over all known
+    generations, read from one relationship column of the registry pedigree like
+    get_mate_suggestions. Wright's per-ancestor terms are listed separately under
+    wright_breakdown, over paths of at most ``generations`` generations above each parent
+    (so their sum can fall short of the full COI); each parent's paths are cached, so
+    scoring many sires against one dam walks the dam's side once.
+    """
+    from utils import WRIGHT_MAX_PATHS, _interpret_coi, common_ancestor_details, parent_paths, wright_terms
+
+    graph = get_parent_graph(db)
+    pedigree = get_registry_pedigree(db)
+    if sire_id in pedigree.number and dam_id in pedigree.number:
+        coi = float(pedigree.offspring_coi_with(dam_id, [sire_id])[0])
+    else:
+        coi = 0.0
+
+    breakdown = {
+        "label": f"Wright's formula over {generations} generations (common ancestors and their contributions)",
+        "generations_analyzed": generations
+    }
+    sire_paths = parent_paths(graph, sire_id, generations)
+    dam_paths = parent_paths(graph, dam_id, generations)
+    if sire_paths is None or dam_paths is None:
+        breakdown.update(coi_percentage=None, common_ancestors=[], common_ancestor_count=0,
+                         message=f"More than {WRIGHT_MAX_PATHS} paths per parent; common ancestors are not broken down")
+    else:
+        inbreeding = pedigree.inbreeding_of(sire_paths.keys() & dam_paths.keys())
+        contributions = wright_terms(sire_paths, dam_paths, inbreeding)
+        common_ancestors = common_ancestor_details(db, contributions, inbreeding)
+        breakdown.update(
+            coi_percentage=round(sum(terms["contribution"] for terms in contributions.values()) * 100, 4),
+            common_ancestors=common_ancestors,
+            common_ancestor_count=len(common_ancestors)
+        )
+        if not contributions:
+            breakdown["message"] = "No common ancestors found within specified generations"
+
+    return {
+        "coi_percentage": round(coi * 100, 4),
+        "coi_decimal": round(coi, 6),
+        "interpretation": _interpret_coi(coi * 100),
+        "wright_breakdown": breakdown
+    }
+
+
+def get_mate_suggestions(db: Session, dog: Dog, k: int = 20, breed: Optional[str] = None,
+                         min_birth_year: Optional[int] = None, max_birth_year: Optional[int] = None,
+                         has_health_tests: bool = False) -> Dict[str, Any]:
+    """
+    Rank every opposite-sex dog (of the dog's breed unless another is given) by the
+    expected COI of their offspring with this dog, lowest first. The whole candidate
+    list is scored by one kinship column of the registry pedigree.
+    """
+    query = db.query(Dog.id).filter(
+        Dog.sex == ("Female" if dog.sex == "Male" else "Male"),
+        Dog.breed == (breed or dog.breed),
+        Dog.id != dog.id
+    )
+    if min_birth_year is not None:
+        query = query.filter(Dog.date_of_birth >= date(min_birth_year, 1, 1))
+    if max_birth_year is not None:
+        query = query.filter(Dog.date_of_birth <= date(max_birth_year, 12, 31))
+    if has_health_tests:
+        query = query.filter(Dog.health_tests.any())
+
+    pedigree = get_registry_pedigree(db)
+    candidate_ids = [row.id for row in query.all() if row.id in pedigree.number]
+    if not candidate_ids or dog.id not in pedigree.number:
+        return {"candidates_considered": len(candidate_ids), "suggestions": []}
+
+    coi = pedigree.offspring_coi_with(dog.id, candidate_ids)
+    top = np.lexsort((np.array(candidate_ids), coi))[:k]
+    top_ids = [candidate_ids[i] for i in top]
+    partners = {partner.id: partner for partner in db.query(Dog).filter(Dog.id.in_(top_ids)).all()}
+
+    return {
+        "candidates_considered": len(candidate_ids),
+        "suggestions": [
+            {
+                "id": partner_id,
+                "name": partners[partner_id].name,
+                "registration_number": partners[partner_id].registration_number,
+                "sex": partners[partner_id].sex,
+                "breed": partners[partner_id].breed,
+                "date_of_birth": partners[partner_id].date_of_birth,
+                "kennel_name": partners[partner_id].kennel_name,
+                "expected_coi_percentage": round(float(coi[i]) * 100, 4)
+            }
+            for i, partner_id in zip(top, top_ids)
+            if partner_id in partners
+        ]
+    }
@@ -3,8 +3,15 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import FileResponse
 from sqlalchemy import create_engine
-from database import engine, Base
-from routers import dogs, health
+from database import engine, Base, SessionLocal, dispose_async_engine
+from pedigree_graph import load_parent_graph
+from search_index import load_search_index
+from fuzzy_index import load_fuzzy_index
+from autocomplete import load_autocomplete_index
+from facets import load_facet_index
+from jobs import start_job_worker, stop_job_worker
+from compute_pool import shutdown_compute_pool
+from routers import dogs, health, jobs
 import os
 
 # Create tables
@@ -15,9 +22,42 @@ app = FastAPI(title="PedigreeDatabase", description="Dog Pedigree Management Sys
 # Static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Load the in-memory parent graph and search indexes once so pedigree/COI code does not walk
+# the ORM and searches do not scan the dogs table
+@app.on_event("startup")
+def load_pedigree_graph():
+    db = SessionLocal()
+    try:
+        load_parent_graph(db)
+        load_search_index(db)
+        load_fuzzy_index(db)
+        load_autocomplete_index(db)
+        load_facet_index(db)
+    finally:
+        db.close()
+
+# Background worker for queued recomputations (see jobs.py)
+@app.on_event("startup")
+def start_jobs():
+    start_job_worker()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    stop_job_worker()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await dispose_async_engine()
+
+# Worker processes for COI work offloaded by the async pedigree handlers (see compute_pool.py)
+@app.on_event("shutdown")
+def stop_compute_pool():
+    shutdown_compute_pool()
+
 # Include routers
 app.include_router(dogs.router)
 app.include_router(health.router)
+app.include_router(jobs.router)
 
 # Health check endpoint
 @app.get("/health")
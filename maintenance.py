@@ -0,0 +1,157 @@
+"""
+Maintenance commands for PedigreeDatabase
+
+Usage:
+    python maintenance.py rebuild-ancestry
+    python maintenance.py recompute-coi
+    python maintenance.py recompute-pedigree-stats
+    python maintenance.py coi-matrix --sires 12,15,31 --dams 40,41 --output matings.csv
+    python maintenance.py run-jobs
+    python maintenance.py backfill-identifier-keys
+
+The closure depth comes from the ANCESTRY_MAX_DEPTH environment variable (default 9)
+and must match the value the application runs with.
+
+The bulk importers in data_import/importers/ write parent links directly and queue
+the matching recomputation jobs (see jobs.py) for the app's worker; run-jobs runs
+whatever is queued when the app is not running.
+
+backfill-identifier-keys adds the normalized registration/microchip/tattoo key
+columns to a dogs table created before they existed and fills them (see identifiers.py).
+"""
+import argparse
+import csv
+import sys
+import time
+from database import SessionLocal, engine, Base
+import models  # noqa: F401 - register all tables before create_all
+
+
+def rebuild_ancestry_command(args) -> int:
+    from ancestry import rebuild_ancestry, ANCESTRY_MAX_DEPTH
+    db = SessionLocal()
+    try:
+        started = time.time()
+        rows = rebuild_ancestry(db)
+        print(f"✅ dog_ancestry rebuilt: {rows} rows (max depth {ANCESTRY_MAX_DEPTH}) in {time.time() - started:.1f}s")
+    finally:
+        db.close()
+    return 0
+
+
+def recompute_coi_command(args) -> int:
+    from inbreeding import recompute_population_coi
+    db = SessionLocal()
+    try:
+        started = time.time()
+        dogs = recompute_population_coi(db)
+        print(f"✅ dog_coi recomputed for {dogs} dogs in {time.time() - started:.1f}s")
+    finally:
+        db.close()
+    return 0
+
+
+def recompute_pedigree_stats_command(args) -> int:
+    from pedigree_stats import recompute_pedigree_stats
+    db = SessionLocal()
+    try:
+        started = time.time()
+        dogs = recompute_pedigree_stats(db)
+        print(f"✅ dog_pedigree_stats recomputed for {dogs} dogs in {time.time() - started:.1f}s")
+    finally:
+        db.close()
+    return 0
+
+
+def parse_ids(value: str):
+    """Comma separated dog ids, or @path to a file with one id per line"""
+    if value.startswith("@"):
+        with open(value[1:], encoding="utf-8") as f:
+            value = ",".join(line.strip() for line in f)
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def coi_matrix_command(args) -> int:
+    from kinship import get_coi_matrix
+    db = SessionLocal()
+    try:
+        started = time.time()
+        result = get_coi_matrix(db, args.sires, args.dams)
+    finally:
+        db.close()
+
+    output = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(["sire_id", "sire_name"] + [f"{dam['id']} {dam.get('name') or ''}".strip() for dam in result["dams"]])
+        for sire, row in zip(result["sires"], result["coi_percentage"]):
+            writer.writerow([sire["id"], sire.get("name") or ""] + row)
+    finally:
+        if args.output:
+            output.close()
+
+    if result["missing_ids"]:
+        print(f"⚠️  Unknown dog ids skipped: {', '.join(map(str, result['missing_ids']))}", file=sys.stderr)
+    print(f"✅ COI matrix {len(result['sires'])} x {len(result['dams'])} computed in {time.time() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+def run_jobs_command(args) -> int:
+    from jobs import run_pending_jobs
+    db = SessionLocal()
+    try:
+        started = time.time()
+        count = run_pending_jobs(db)
+        print(f"✅ {count} queued jobs run in {time.time() - started:.1f}s")
+    finally:
+        db.close()
+    return 0
+
+
+def backfill_identifier_keys_command(args) -> int:
+    from identifiers import add_identifier_key_columns, backfill_identifier_keys
+    added = add_identifier_key_columns(engine)
+    if added:
+        print(f"Added columns: {', '.join(added)}")
+    db = SessionLocal()
+    try:
+        started = time.time()
+        count = backfill_identifier_keys(db)
+        print(f"✅ Identifier keys updated for {count} dogs in {time.time() - started:.1f}s")
+    finally:
+        db.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PedigreeDatabase maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ancestry_parser = subparsers.add_parser("rebuild-ancestry", help="Rebuild the dog_ancestry closure table")
+    ancestry_parser.set_defaults(handler=rebuild_ancestry_command)
+
+    coi_parser = subparsers.add_parser("recompute-coi", help="Recompute the stored COI of every dog (Meuwissen & Luo)")
+    coi_parser.set_defaults(handler=recompute_coi_command)
+
+    stats_parser = subparsers.add_parser("recompute-pedigree-stats", help="Recompute stored pedigree completeness and depth metrics")
+    stats_parser.set_defaults(handler=recompute_pedigree_stats_command)
+
+    matrix_parser = subparsers.add_parser("coi-matrix", help="Export the offspring COI (%%) of every sire x dam pairing as CSV")
+    matrix_parser.add_argument("--sires", type=parse_ids, required=True, help="Sire ids: 1,2,3 or @file")
+    matrix_parser.add_argument("--dams", type=parse_ids, required=True, help="Dam ids: 1,2,3 or @file")
+    matrix_parser.add_argument("--output", help="CSV file to write (default: stdout)")
+    matrix_parser.set_defaults(handler=coi_matrix_command)
+
+    jobs_parser = subparsers.add_parser("run-jobs", help="Run the queued background jobs and exit")
+    jobs_parser.set_defaults(handler=run_jobs_command)
+
+    keys_parser = subparsers.add_parser("backfill-identifier-keys", help="Add and fill the normalized registration/microchip/tattoo key columns")
+    keys_parser.set_defaults(handler=backfill_identifier_keys_command)
+
+    args = parser.parse_args(argv)
+    Base.metadata.create_all(bind=engine)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, DateTime, Text, Index, Float, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from database import Base
 from datetime import datetime
+from identifiers import fill_identifier_keys
 
 class HealthTestType(Base):
     __tablename__ = "health_test_types"
@@ -30,6 +31,11 @@ class Dog(Base):
     breeder = Column(String(100), nullable=True)
     url_org = Column(String(255), nullable=True)  # URL to original registry record
     
+    # Normalized registration_number / microchip / tatoo_no for lookups (see identifiers.py)
+    registration_key = Column(String(200), nullable=True, index=True)
+    microchip_key = Column(String(50), nullable=True, index=True)
+    tatoo_key = Column(String(50), nullable=True, index=True)
+    
     # Self-referencing relationships for pedigree
     sire_id = Column(Integer, ForeignKey("dogs.id"), nullable=True)
     dam_id = Column(Integer, ForeignKey("dogs.id"), nullable=True)
@@ -43,6 +49,11 @@ class Dog(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+@event.listens_for(Dog, "before_insert")
+@event.listens_for(Dog, "before_update")
+def _fill_dog_identifier_keys(mapper, connection, dog):
+    fill_identifier_keys(dog)
+
 class HealthTest(Base):
     __tablename__ = "health_tests"
     
@@ -59,3 +70,56 @@ class HealthTest(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Materialized ancestor closure: one row per (dog, Ahnentafel position) up to a configured depth
+class DogAncestry(Base):
+    __tablename__ = "dog_ancestry"
+    
+    dog_id = Column(Integer, ForeignKey("dogs.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)  # Ahnentafel index: 1 = dog itself, 2/3 = sire/dam, 4-7 = grandparents...
+    ancestor_id = Column(Integer, ForeignKey("dogs.id"), nullable=False)
+    depth = Column(Integer, nullable=False)  # 0 = dog itself, 1 = parents, 2 = grandparents...
+    
+    __table_args__ = (
+        Index("ix_dog_ancestry_dog_depth", "dog_id", "depth"),
+        Index("ix_dog_ancestry_ancestor_depth", "ancestor_id", "depth"),
+    )
+
+# Stored coefficient of inbreeding per dog, computed for the whole registry (see inbreeding.py)
+class DogCoi(Base):
+    __tablename__ = "dog_coi"
+    
+    dog_id = Column(Integer, ForeignKey("dogs.id"), primary_key=True)
+    coi = Column(Float, nullable=False)  # Fraction, e.g. 0.0625 = 6.25%
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+# Stored pedigree completeness metrics per dog, kept current on parent changes (see pedigree_stats.py)
+class DogPedigreeStats(Base):
+    __tablename__ = "dog_pedigree_stats"
+    
+    dog_id = Column(Integer, ForeignKey("dogs.id"), primary_key=True)
+    completeness_3 = Column(Float, nullable=False, index=True)  # % of the 2^(g+1)-1 positions known, dog included
+    completeness_5 = Column(Float, nullable=False, index=True)
+    completeness_10 = Column(Float, nullable=False, index=True)
+    max_depth = Column(Integer, nullable=False, index=True)  # Generations to the most distant known ancestor
+    equivalent_generations = Column(Float, nullable=False, index=True)  # Sum of (1/2)^depth over known ancestors
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+# Background recomputation jobs, queued by crud/importers and run by the in-app worker (see jobs.py)
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)  # One of jobs.JOB_HANDLERS
+    payload = Column(Text, nullable=True)  # JSON arguments, e.g. {"dog_ids": [...]}
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done, failed
+    progress = Column(Float, nullable=False, default=0.0)  # 0..1
+    result = Column(Text, nullable=True)  # JSON summary written by the handler
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_jobs_status_id", "status", "id"),
+    )
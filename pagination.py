@@ -0,0 +1,109 @@
+"""
+Keyset pagination helpers for PedigreeDatabase
+
+OFFSET paging makes the database (or the search index) walk past every earlier row,
+so page 500 costs 500 times page 1, and each page also ran a second COUNT scan.
+Lists and search results are instead paged from an opaque cursor holding the sort
+key of the last (or first) row shown: the next page starts right after it through
+the index on that key. Totals come from a short-lived count cache, so they may lag
+a bulk import by up to COUNT_CACHE_TTL seconds.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "60"))  # seconds
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "256"))
+
+
+class Page(NamedTuple):
+    """One page of a keyset-paginated listing"""
+    items: List[Any]
+    total: int
+    offset: Optional[int]  # Position of the first item, when known
+    prev_cursor: Optional[str]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    """Opaque, URL-safe cursor for a sort key"""
+    data = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[tuple]) -> Tuple[Any, ...]:
+    """
+    Sort key of a cursor made by encode_cursor, checked against the expected type of
+    each element (a tuple of accepted types). Raises ValueError for anything else.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, accepted in zip(key, types):
+        # bool is an int subclass but never part of a sort key
+        if isinstance(value, bool) or not isinstance(value, accepted):
+            raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+class CountCache:
+    """Small LRU + TTL cache of result counts keyed by normalized query/filters"""
+
+    def __init__(self, max_entries: int = COUNT_CACHE_SIZE, ttl_seconds: float = COUNT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, count: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, count)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], int]) -> int:
+        count = self.get(key)
+        if count is None:
+            count = compute()
+            self.put(key, count)
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+count_cache = CountCache()
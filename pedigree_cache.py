@@ -0,0 +1,182 @@
+"""
+Pedigree result cache for PedigreeDatabase
+
+Keeps recently built pedigrees keyed by (dog_id, generations) so popular dogs
+are not rebuilt on every request. A reverse index from ancestor id to cached
+roots lets a write to one dog drop exactly the pedigrees that display it.
+
+Also keeps per-dog results derived from the parent graph for COI work (ancestor
+path histograms for common-ancestor highlighting, and the generation-limited COIs
+shown next to pedigree entries), validated against the parent graph's lineage version.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+PEDIGREE_CACHE_SIZE = int(os.getenv("PEDIGREE_CACHE_SIZE", "1024"))
+PEDIGREE_CACHE_TTL = float(os.getenv("PEDIGREE_CACHE_TTL", "600"))  # seconds
+ANCESTOR_PATH_CACHE_SIZE = int(os.getenv("ANCESTOR_PATH_CACHE_SIZE", "4096"))
+ANCESTOR_COI_CACHE_SIZE = int(os.getenv("ANCESTOR_COI_CACHE_SIZE", "65536"))
+PARENT_PATH_CACHE_SIZE = int(os.getenv("PARENT_PATH_CACHE_SIZE", "1024"))
+
+CacheKey = Tuple[int, int]
+
+
+def copy_ahnentafel(slots: List[Optional[dict]]) -> List[Optional[dict]]:
+    """Copy an Ahnentafel array, giving every node a fresh dict and relinking sire/dam"""
+    copied = [dict(node) if node is not None else None for node in slots]
+    for k in range(1, len(copied) // 2):
+        node = copied[k]
+        if node is not None:
+            node["sire"] = copied[2 * k]
+            node["dam"] = copied[2 * k + 1]
+    return copied
+
+
+class PedigreeCache:
+    """
+    LRU + TTL cache of Ahnentafel pedigree arrays.
+
+    Callers receive copies, so they can annotate the nodes (COI, highlighting)
+    without touching the cached payload.
+    """
+
+    def __init__(self, max_entries: int = PEDIGREE_CACHE_SIZE, ttl_seconds: float = PEDIGREE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, List[Optional[dict]], Set[int]]]" = OrderedDict()
+        self._roots_by_ancestor: Dict[int, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, dog_id: int, generations: int) -> Optional[List[Optional[dict]]]:
+        key = (dog_id, generations)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            slots = entry[1]
+        return copy_ahnentafel(slots)
+
+    def put(self, dog_id: int, generations: int, slots: List[Optional[dict]]):
+        key = (dog_id, generations)
+        slots = copy_ahnentafel(slots)
+        ancestor_ids = {node["id"] for node in slots if node is not None}
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, slots, ancestor_ids)
+            for ancestor_id in ancestor_ids:
+                self._roots_by_ancestor.setdefault(ancestor_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_dog(self, dog_id: int) -> int:
+        """Drop every cached pedigree that contains the dog; returns the number dropped"""
+        with self._lock:
+            keys = list(self._roots_by_ancestor.get(dog_id, ()))
+            for key in keys:
+                self._discard(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._roots_by_ancestor.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+    def _discard(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for ancestor_id in entry[2]:
+            roots = self._roots_by_ancestor.get(ancestor_id)
+            if roots is not None:
+                roots.discard(key)
+                if not roots:
+                    del self._roots_by_ancestor[ancestor_id]
+
+
+pedigree_cache = PedigreeCache()
+
+
+class GraphDerivedCache:
+    """
+    LRU cache of per-dog values derived from the parent graph, keyed by (dog_id, generations).
+
+    Every entry remembers the parent graph and its lineage_version when the value was
+    derived, and is ignored once parent links of existing dogs change, so parent edits
+    need no explicit invalidation. Adding dogs keeps the entries: a new dog is nobody's
+    ancestor yet. Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[object, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, graph, dog_id: int, generations: int) -> Optional[Any]:
+        key = (dog_id, generations)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not graph or entry[1] != graph.lineage_version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, graph, version: int, dog_id: int, generations: int, value: Any):
+        """Store a value derived from ``graph`` at lineage ``version`` (read before deriving it)"""
+        key = (dog_id, generations)
+        with self._lock:
+            self._entries[key] = (graph, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# {ancestor_id: {path_length: paths}} histograms
+ancestor_path_cache = GraphDerivedCache(ANCESTOR_PATH_CACHE_SIZE)
+# COI fractions of dogs over their pedigree cut to a number of generations (utils.coi_fractions)
+ancestor_coi_cache = GraphDerivedCache(ANCESTOR_COI_CACHE_SIZE)
+# Paths from a parent up to each ancestor, for Wright's breakdown of trial matings (utils.parent_paths)
+parent_path_cache = GraphDerivedCache(PARENT_PATH_CACHE_SIZE)
@@ -0,0 +1,207 @@
+"""
+In-memory parent graph for PedigreeDatabase
+
+Holds the sire/dam links of every dog in compact parallel arrays so pedigree
+and COI code can walk ancestry without issuing SQL per ancestor.
+"""
+import threading
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from models import Dog
+
+NO_PARENT = -1
+
+
+class ParentGraph:
+    """
+    Compact parent graph of the whole registry.
+
+    Every dog gets a dense index. ``ids[i]`` is the dog id at index ``i`` and
+    ``sires[i]`` / ``dams[i]`` are the indexes of its parents (NO_PARENT when unknown).
+    ``index`` maps dog id -> index. Removed dogs keep their slot with ``ids[i] == 0``.
+    """
+
+    def __init__(self):
+        self.ids = array('i')
+        self.sires = array('i')
+        self.dams = array('i')
+        self.index: Dict[int, int] = {}
+        self.children: Dict[int, List[int]] = {}  # parent index -> child indexes
+        self.version = 0  # Incremented on every change, lets callers detect stale derived data
+        # Incremented only when links between existing dogs change (not when a dog is added),
+        # so data derived from a dog's ancestry stays valid while new dogs come in
+        self.lineage_version = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_db(cls, db: Session) -> "ParentGraph":
+        """Build the graph with a single SELECT id, sire_id, dam_id FROM dogs"""
+        rows = db.query(Dog.id, Dog.sire_id, Dog.dam_id).all()
+        return cls.from_parents({dog_id: (sire_id, dam_id) for dog_id, sire_id, dam_id in rows})
+
+    @classmethod
+    def from_parents(cls, parents: Dict[int, Tuple[Optional[int], Optional[int]]]) -> "ParentGraph":
+        """Build a graph from a {dog_id: (sire_id, dam_id)} mapping; parents missing from it are unknown"""
+        graph = cls()
+
+        # Assign indexes first so parents can be resolved regardless of order
+        for dog_id in parents:
+            graph.index[dog_id] = len(graph.ids)
+            graph.ids.append(dog_id)
+
+        graph.sires = array('i', [NO_PARENT]) * len(parents)
+        graph.dams = array('i', [NO_PARENT]) * len(parents)
+        for dog_id, (sire_id, dam_id) in parents.items():
+            graph._link(graph.index[dog_id], sire_id, dam_id)
+
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, dog_id: int) -> bool:
+        return dog_id in self.index
+
+    def _link(self, i: int, sire_id: Optional[int], dam_id: Optional[int]):
+        sire_index = self.index.get(sire_id, NO_PARENT) if sire_id else NO_PARENT
+        dam_index = self.index.get(dam_id, NO_PARENT) if dam_id else NO_PARENT
+        self.sires[i] = sire_index
+        self.dams[i] = dam_index
+        for parent_index in (sire_index, dam_index):
+            if parent_index != NO_PARENT:
+                self.children.setdefault(parent_index, []).append(i)
+
+    def _unlink(self, i: int):
+        for parent_index in (self.sires[i], self.dams[i]):
+            if parent_index != NO_PARENT:
+                siblings = self.children.get(parent_index)
+                if siblings and i in siblings:
+                    siblings.remove(i)
+                    if not siblings:
+                        del self.children[parent_index]
+        self.sires[i] = NO_PARENT
+        self.dams[i] = NO_PARENT
+
+    def set_parents(self, dog_id: int, sire_id: Optional[int], dam_id: Optional[int]):
+        """Add a dog or update its parent links (no-op when they are unchanged)"""
+        with self._lock:
+            i = self.index.get(dog_id)
+            if i is None:
+                i = len(self.ids)
+                self.index[dog_id] = i
+                self.ids.append(dog_id)
+                self.sires.append(NO_PARENT)
+                self.dams.append(NO_PARENT)
+            else:
+                if self.parents(dog_id) == (sire_id or None, dam_id or None):
+                    return
+                self._unlink(i)
+                self.lineage_version += 1
+            self._link(i, sire_id, dam_id)
+            self.version += 1
+
+    def remove(self, dog_id: int):
+        """Remove a dog; its offspring lose the link to it"""
+        with self._lock:
+            i = self.index.pop(dog_id, None)
+            if i is None:
+                return
+            self._unlink(i)
+            offspring = self.children.pop(i, [])
+            for child_index in offspring:
+                if self.sires[child_index] == i:
+                    self.sires[child_index] = NO_PARENT
+                if self.dams[child_index] == i:
+                    self.dams[child_index] = NO_PARENT
+            self.ids[i] = 0
+            self.version += 1
+            if offspring:
+                self.lineage_version += 1
+
+    def parents(self, dog_id: int) -> Tuple[Optional[int], Optional[int]]:
+        """Return (sire_id, dam_id) for a dog, None for unknown parents"""
+        i = self.index.get(dog_id)
+        if i is None:
+            return None, None
+        sire_index, dam_index = self.sires[i], self.dams[i]
+        return (
+            self.ids[sire_index] if sire_index != NO_PARENT else None,
+            self.ids[dam_index] if dam_index != NO_PARENT else None
+        )
+
+    def get(self, dog_id: int, default=None) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        """Mapping-style access: (sire_id, dam_id) for known dogs, default otherwise"""
+        if dog_id not in self.index:
+            return default
+        return self.parents(dog_id)
+
+    def ancestor_ids(self, dog_id: int, max_generations: int) -> Set[int]:
+        """Return the dog and all of its ancestors up to max_generations levels"""
+        start = self.index.get(dog_id)
+        if start is None:
+            return set()
+
+        seen = {start}
+        frontier = [start]
+        for _ in range(max_generations):
+            next_frontier = []
+            for i in frontier:
+                for parent_index in (self.sires[i], self.dams[i]):
+                    if parent_index != NO_PARENT and parent_index not in seen:
+                        seen.add(parent_index)
+                        next_frontier.append(parent_index)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+
+        return {self.ids[i] for i in seen}
+
+    def offspring(self, dog_id: int) -> List[int]:
+        """Return the ids of all dogs that have this dog as sire or dam"""
+        i = self.index.get(dog_id)
+        if i is None:
+            return []
+        return [self.ids[child_index] for child_index in self.children.get(i, [])]
+
+
+_graph: Optional[ParentGraph] = None
+_graph_lock = threading.Lock()
+
+
+def load_parent_graph(db: Session) -> ParentGraph:
+    """(Re)load the process-wide parent graph from the database"""
+    global _graph
+    graph = ParentGraph.from_db(db)
+    with _graph_lock:
+        _graph = graph
+    return graph
+
+
+def get_parent_graph(db: Session) -> ParentGraph:
+    """Return the process-wide parent graph, loading it on first use"""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = ParentGraph.from_db(db)
+    return _graph
+
+
+def refresh_dog(dog_id: int, sire_id: Optional[int], dam_id: Optional[int]):
+    """Apply a created or updated dog to the loaded graph (no-op if not loaded yet)"""
+    if _graph is not None:
+        _graph.set_parents(dog_id, sire_id, dam_id)
+
+
+def remove_dog(dog_id: int):
+    """Apply a deleted dog to the loaded graph (no-op if not loaded yet)"""
+    if _graph is not None:
+        _graph.remove(dog_id)
+
+
+def reset_parent_graph():
+    """Drop the loaded graph so the next caller reloads it (e.g. after bulk imports)"""
+    global _graph
+    with _graph_lock:
+        _graph = None
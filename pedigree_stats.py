@@ -0,0 +1,133 @@
+"""
+Stored pedigree completeness metrics for PedigreeDatabase
+
+Completeness for 3, 5 and 10 generations, maximum known depth and equivalent
+complete generations follow from a dog's parents' figures, so the whole registry
+is computed in one parents-first pass over the parent graph and stored in
+dog_pedigree_stats. A parent change only needs the dog and its descendants redone
+(see propagation.py).
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy.orm import Session
+from models import DogPedigreeStats
+from inbreeding import ancestor_closure, topological_order
+from pedigree_graph import NO_PARENT, ParentGraph, load_parent_graph
+
+COMPLETENESS_GENERATIONS = (3, 5, 10)
+INSERT_BATCH_SIZE = 5000
+
+_COUNTED_DEPTH = max(COMPLETENESS_GENERATIONS)
+
+
+def compute_pedigree_stats(graph: ParentGraph, dog_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+    """
+    Pedigree metrics keyed by dog id, for the whole registry or only ``dog_ids``
+    (their ancestors are computed along the way but not returned).
+    """
+    wanted = None if dog_ids is None else set(dog_ids)
+    indexes = None if wanted is None else ancestor_closure(graph, wanted)
+    known: Dict[int, List[int]] = {}  # Known positions per depth 0.._COUNTED_DEPTH
+    max_depth: Dict[int, int] = {}
+    equivalent: Dict[int, float] = {}
+    stats = {}
+
+    for i in topological_order(graph, indexes):
+        counts = [1] + [0] * _COUNTED_DEPTH
+        depth = 0
+        generations = 0.0
+        for parent_index in (graph.sires[i], graph.dams[i]):
+            # A parent not seen yet can only come from a parent cycle; treat it as unknown
+            if parent_index == NO_PARENT or parent_index not in known:
+                continue
+            parent_counts = known[parent_index]
+            for k in range(_COUNTED_DEPTH):
+                counts[k + 1] += parent_counts[k]
+            depth = max(depth, max_depth[parent_index] + 1)
+            generations += 0.5 * (1.0 + equivalent[parent_index])
+        known[i] = counts
+        max_depth[i] = depth
+        equivalent[i] = generations
+
+        dog_id = graph.ids[i]
+        if wanted is None or dog_id in wanted:
+            row = {
+                f"completeness_{g}": round(sum(counts[:g + 1]) / (2 ** (g + 1) - 1) * 100, 2)
+                for g in COMPLETENESS_GENERATIONS
+            }
+            row["max_depth"] = depth
+            row["equivalent_generations"] = round(generations, 4)
+            stats[dog_id] = row
+
+    return stats
+
+
+def descendant_ids(graph: ParentGraph, dog_ids: Iterable[int]) -> Set[int]:
+    """All descendants of the given dogs (any depth), from the parent graph"""
+    seen = set()
+    stack = list(dog_ids)
+    while stack:
+        for child_id in graph.offspring(stack.pop()):
+            if child_id not in seen:
+                seen.add(child_id)
+                stack.append(child_id)
+    return seen
+
+
+def _write_stats(db: Session, stats: Dict[int, dict]):
+    computed_at = datetime.utcnow()
+    batch = []
+    for dog_id, row in stats.items():
+        batch.append({"dog_id": dog_id, **row, "computed_at": computed_at})
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.execute(DogPedigreeStats.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.execute(DogPedigreeStats.__table__.insert(), batch)
+
+
+def recompute_pedigree_stats(db: Session) -> int:
+    """Recompute and store the metrics of every dog; returns the number of dogs written"""
+    graph = load_parent_graph(db)
+    stats = compute_pedigree_stats(graph)
+    db.query(DogPedigreeStats).delete(synchronize_session=False)
+    _write_stats(db, stats)
+    db.commit()
+    return len(stats)
+
+
+def refresh_pedigree_stats(db: Session, graph: ParentGraph, dog_ids: Iterable[int]) -> int:
+    """
+    Recompute the stored metrics of exactly the given dogs, e.g. a dog whose parents
+    changed plus all of its descendants. Returns the number of dogs written.
+    """
+    dog_ids = {dog_id for dog_id in dog_ids if dog_id in graph}
+    if not dog_ids:
+        return 0
+    stats = compute_pedigree_stats(graph, dog_ids)
+    db.query(DogPedigreeStats).filter(DogPedigreeStats.dog_id.in_(dog_ids)).delete(synchronize_session=False)
+    _write_stats(db, stats)
+    db.commit()
+    return len(dog_ids)
+
+
+def remove_pedigree_stats(db: Session, dog_id: int):
+    """Delete the row of a dog that is being deleted (caller commits)"""
+    db.query(DogPedigreeStats).filter(DogPedigreeStats.dog_id == dog_id).delete(synchronize_session=False)
+
+
+def get_pedigree_stats(db: Session, dog_ids: Iterable[int]) -> Dict[int, dict]:
+    """Stored metrics for the given dogs; dogs without a stored row are omitted"""
+    dog_ids = list(set(dog_ids))
+    if not dog_ids:
+        return {}
+    rows = db.query(DogPedigreeStats).filter(DogPedigreeStats.dog_id.in_(dog_ids)).all()
+    return {
+        row.dog_id: {
+            **{f"completeness_{g}": getattr(row, f"completeness_{g}") for g in COMPLETENESS_GENERATIONS},
+            "max_depth": row.max_depth,
+            "equivalent_generations": row.equivalent_generations,
+            "computed_at": row.computed_at
+        }
+        for row in rows
+    }
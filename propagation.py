@@ -0,0 +1,43 @@
+"""
+Change propagation for PedigreeDatabase
+
+A new or changed sire/dam link can only alter the COI and pedigree completeness of
+the dog itself and of its descendants. propagate_parent_change finds that set by
+following the offspring edges (sired_offspring / dam_offspring) in the parent graph
+and recomputes the stored dog_coi and dog_pedigree_stats rows for it alone, parents
+first, seeded with the stored values of every other ancestor. The dog_ancestry closure
+rows of the changed dogs and of descendants within ANCESTRY_MAX_DEPTH are rewritten first.
+
+crud.py and the importers queue it as a "propagate-parent-change" job (see jobs.py),
+so the request that edited the dog does not wait for it.
+"""
+import time
+from typing import Any, Dict, Iterable
+from sqlalchemy.orm import Session
+from ancestry import refresh_ancestry
+from inbreeding import refresh_coi
+from pedigree_graph import get_parent_graph
+from pedigree_stats import descendant_ids, refresh_pedigree_stats
+
+
+def propagate_parent_change(db: Session, dog_ids: Iterable[int]) -> Dict[str, Any]:
+    """
+    Rewrite the closure rows and recompute the stored COI and pedigree metrics of the
+    given dogs (created, or whose parents changed) and their descendants. Expects the
+    parent graph to already reflect the change. Returns a report with the number of dogs touched and the time taken.
+    """
+    started = time.perf_counter()
+    dog_ids = sorted(set(dog_ids))
+    graph = get_parent_graph(db)
+    changed = {dog_id for dog_id in dog_ids if dog_id in graph}
+    affected = changed | descendant_ids(graph, changed)
+
+    refresh_ancestry(db, graph, changed)
+    refresh_coi(db, graph, affected)
+    refresh_pedigree_stats(db, graph, affected)
+
+    return {
+        "dog_ids": dog_ids,
+        "dogs_touched": len(affected),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
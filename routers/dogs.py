@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import logging
 import crud
 import schemas
-from database import get_db
-from models import Dog
+from database import get_async_db, get_db
+from facets import parse_facet_filters
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
+LOOKUP_MAX_IDENTIFIERS = 1000
+
+logger = logging.getLogger(__name__)
+
 # HTML Routes
 @router.get("/", response_class=HTMLResponse)
 async def read_dogs_homepage(request: Request, db: Session = Depends(get_db)):
@@ -26,23 +33,76 @@ async def read_dogs_homepage(request: Request, db: Session = Depends(get_db)):
         "stats": stats
     })
 
+def _facet_sidebar(request: Request, facets: dict, counts: dict) -> dict:
+    """Facet groups for the render_facets macro: each value with its count and the URL toggling it"""
+    from facets import FACETS, FACET_LABELS
+    url = request.url.remove_query_params(["page", "skip", "after", "before"])
+    groups = []
+    for facet in FACETS:
+        params = ("year_from", "year_to") if facet == "year" else (facet,)
+        selected = facets.get(facet)
+        values = []
+        for value, count in counts.get(facet, []):
+            if isinstance(value, bool):
+                param_value, label = ("true" if value else "false"), ("Yes" if value else "No")
+            else:
+                param_value, label = str(value), str(value)
+            is_selected = selected == ((value, value) if facet == "year" else value)
+            if is_selected:
+                href = url.remove_query_params(params)
+            else:
+                href = url.include_query_params(**{param: param_value for param in params})
+            values.append({"label": label, "count": count, "url": str(href), "selected": is_selected})
+        groups.append({
+            "name": facet,
+            "label": FACET_LABELS[facet],
+            "options": values,
+            "clear_url": str(url.remove_query_params(params)) if selected is not None else None
+        })
+    # The year range form resubmits every other parameter
+    year_hidden = [(key, value) for key, value in request.query_params.multi_items()
+                   if key not in ("page", "skip", "after", "before", "year_from", "year_to")]
+    return {"groups": groups, "year_range": facets.get("year", (None, None)), "year_hidden": year_hidden}
+
+def _filter_query(request: Request) -> str:
+    """The facet parameters of the request, for pagination links"""
+    from urllib.parse import urlencode
+    from facets import FACET_PARAMS
+    return urlencode([(key, value) for key, value in request.query_params.multi_items() if key in FACET_PARAMS])
+
 @router.get("/search", response_class=HTMLResponse)
-async def search_dogs_page(request: Request, q: str = "", page: int = 1, db: Session = Depends(get_db)):
+async def search_dogs_page(request: Request, q: str = "", page: int = 1, after: Optional[str] = None,
+                           before: Optional[str] = None, facets: dict = Depends(parse_facet_filters),
+                           db: AsyncSession = Depends(get_async_db)):
     from fastapi.responses import RedirectResponse
     dogs = []
     total_results = 0
     total_pages = 0
     limit = 20
+    first_result = 1
+    prev_cursor = next_cursor = None
+    facet_sidebar = None
 
     if q and len(q.strip()) >= 2:
-        skip = (page - 1) * limit
-        dogs = crud.search_dogs(db, query=q.strip(), skip=skip, limit=limit)
-        total_results = crud.count_search_dogs(db, query=q.strip())
+        # Previous/Next links carry a cursor; numbered page links still use ?page=
+        try:
+            result = await crud.search_dogs_page_async(db, query=q.strip(), limit=limit, after=after,
+                                                       before=before, skip=(max(page, 1) - 1) * limit,
+                                                       facets=facets)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        dogs = result.items
+        total_results = result.total
         total_pages = (total_results + limit - 1) // limit  # Ceiling division
+        page = result.offset // limit + 1
+        first_result = result.offset + 1
+        prev_cursor, next_cursor = result.prev_cursor, result.next_cursor
 
-        # If only one result, redirect to dog detail page
-        if total_results == 1 and dogs:
+        # If only one result, redirect to dog detail page (unless it was narrowed down by filters)
+        if total_results == 1 and dogs and not facets:
             return RedirectResponse(url=f"/dogs/{dogs[0].id}")
+        counts = await crud.facet_counts_async(db, facets, query=q.strip())
+        facet_sidebar = _facet_sidebar(request, facets, counts)
 
     return templates.TemplateResponse("search_results.html", {
         "request": request, 
@@ -51,45 +111,73 @@ async def search_dogs_page(request: Request, q: str = "", page: int = 1, db: Ses
         "current_page": page,
         "total_pages": total_pages,
         "total_results": total_results,
-        "has_prev": page > 1,
-        "has_next": page < total_pages,
-        "prev_page": page - 1 if page > 1 else None,
-        "next_page": page + 1 if page < total_pages else None
+        "first_result": first_result,
+        "has_prev": prev_cursor is not None,
+        "has_next": next_cursor is not None,
+        "prev_cursor": prev_cursor,
+        "next_cursor": next_cursor,
+        "facets": facet_sidebar,
+        "filter_query": _filter_query(request)
     })
 
 @router.get("/dogs", response_class=HTMLResponse)
-async def list_dogs_page(request: Request, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    dogs = crud.get_dogs(db, skip=skip, limit=limit)
-    return templates.TemplateResponse("dogs_list.html", {"request": request, "dogs": dogs})
+async def list_dogs_page(request: Request, skip: int = 0, limit: int = 20, after: Optional[str] = None,
+                         before: Optional[str] = None, facets: dict = Depends(parse_facet_filters),
+                         db: AsyncSession = Depends(get_async_db)):
+    try:
+        result = await crud.get_dogs_page_async(db, limit=limit, after=after, before=before, skip=skip,
+                                                facets=facets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    counts = await crud.facet_counts_async(db, facets)
+    return templates.TemplateResponse("dogs_list.html", {
+        "request": request,
+        "dogs": result.items,
+        "total_dogs": result.total,
+        "limit": limit,
+        "prev_cursor": result.prev_cursor,
+        "next_cursor": result.next_cursor,
+        "facets": _facet_sidebar(request, facets, counts),
+        "filter_query": _filter_query(request)
+    })
 
 from fastapi import Query
 
+# Registered before /dogs/{dog_id} so "add" is not taken for a dog id
+@router.get("/dogs/add", response_class=HTMLResponse)
+async def add_dog_form(request: Request):
+    # Sire and dam are picked through /api/dogs/autocomplete
+    return templates.TemplateResponse("dog_form.html", {"request": request})
+
 @router.get("/dogs/{dog_id}", response_class=HTMLResponse)
 async def read_dog_page(request: Request, dog_id: int, db: Session = Depends(get_db)):
+    # Database and pedigree work runs in the threadpool so it does not block the event loop
+    context = await run_in_threadpool(_dog_page_context, db, dog_id)
+    return templates.TemplateResponse("dog_detail.html", {"request": request, **context})
+
+def _dog_page_context(db: Session, dog_id: int) -> dict:
     # Default generation count
     default_generations = 4
     show_gen_int = default_generations
 
-    dog = crud.get_dog(db, dog_id=dog_id)
-    if dog is None:
-        raise HTTPException(status_code=404, detail="Dog not found")
-
     # Get pedigree information for the requested number of generations
-    pedigree_dog = crud.get_dog_pedigree(db, dog_id=dog_id, generations=show_gen_int)
-    health_tests = crud.get_dog_health_tests(db, dog_id=dog_id)# Get additional information
-    from utils import get_health_summary, search_related_dogs, calculate_age_from_birth_date, get_pedigree_completeness, detect_pedigree_inbreeding
+    from utils import PedigreeAnalysis, get_health_summary, search_related_dogs, calculate_age_from_birth_date
+    analysis = PedigreeAnalysis.load(db, dog_id=dog_id, generations=show_gen_int, offload=True)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    dog = analysis.dog
     
+    health_tests = crud.get_dog_health_tests(db, dog_id=dog_id)# Get additional information
     health_summary = get_health_summary(dog)
     related_dogs = search_related_dogs(dog, db, "siblings")[:5]  # Limit to 5 for display
     age_str = calculate_age_from_birth_date(dog.date_of_birth)
-    pedigree_completeness = get_pedigree_completeness(dog, db, show_gen_int)    # Detect inbreeding in 4 generations for highlighting
-    inbreeding_data = detect_pedigree_inbreeding(pedigree_dog, generations=4)
+    pedigree_completeness = analysis.completeness()    # Detect inbreeding in 4 generations for highlighting
+    inbreeding_data = analysis.inbreeding_highlights(generations=4)
 
-    return templates.TemplateResponse("dog_detail.html", {
-        "request": request,
-        "dog": pedigree_dog,
-        "pedigree": getattr(pedigree_dog, 'pedigree_data', None),
-        "ancestor_matrix": getattr(pedigree_dog, 'ancestor_matrix', {}),
+    return {
+        "dog": dog,
+        "pedigree": analysis.pedigree_data,
+        "ancestor_matrix": analysis.ancestor_matrix,
         "health_tests": health_tests,
         "health_summary": health_summary,
         "related_dogs": related_dogs,
@@ -97,12 +185,7 @@ async def read_dog_page(request: Request, dog_id: int, db: Session = Depends(get
         "pedigree_completeness": pedigree_completeness,
         "inbreeding_data": inbreeding_data,
         "show_gen": show_gen_int
-    })
-
-@router.get("/dogs/add", response_class=HTMLResponse)
-async def add_dog_form(request: Request, db: Session = Depends(get_db)):
-    dogs = crud.get_dogs(db, limit=1000)  # For parent selection
-    return templates.TemplateResponse("dog_form.html", {"request": request, "dogs": dogs})
+    }
 
 @router.post("/dogs/add", response_class=HTMLResponse)
 async def create_dog_form(
@@ -141,92 +224,51 @@ async def create_dog_form(
         dog = crud.create_dog(db=db, dog=dog_create)
         return templates.TemplateResponse("dog_success.html", {"request": request, "dog": dog})
     except Exception as e:
-        dogs = crud.get_dogs(db, limit=1000)
         return templates.TemplateResponse("dog_form.html", {
             "request": request, 
-            "dogs": dogs,
             "error": str(e)
         })
 
 @router.get("/dogs/{dog_id}/pedigree", response_class=HTMLResponse)
-async def read_dog_pedigree_page(request: Request, dog_id: int, db: Session = Depends(get_db)):
-    dog = crud.get_dog_pedigree(db, dog_id=dog_id)
-    if dog is None:
+async def read_dog_pedigree_page(request: Request, dog_id: int, generations: int = 4, db: Session = Depends(get_db)):
+    # Validate generations parameter
+    if generations < 1 or generations > 9:
+        raise HTTPException(status_code=400, detail="Generations must be between 1 and 9")
+    
+    # Loading and analysis share one session in the threadpool, keeping the event loop free
+    context = await run_in_threadpool(_pedigree_page_context, db, dog_id, generations)
+    if context is None:
         raise HTTPException(status_code=404, detail="Dog not found")
+    return templates.TemplateResponse("pedigree_horizontal.html", {"request": request, **context})
+
+def _pedigree_page_context(db: Session, dog_id: int, generations: int) -> Optional[dict]:
+    from utils import PedigreeAnalysis
+    analysis = PedigreeAnalysis.load(db, dog_id, generations, offload=True)
+    if analysis is None:
+        return None
     
     # Simplified - no siblings for now due to SQLAlchemy issues
     siblings = []
     
     # Get pedigree completeness and inbreeding data
-    from utils import get_pedigree_completeness, detect_pedigree_inbreeding, calculate_inbreeding_coefficient
-    pedigree_completeness = get_pedigree_completeness(dog, db, 4)  # 4 generations
-    inbreeding_data = detect_pedigree_inbreeding(dog, generations=4)
-    
-    # Add inbreeding levels to each dog in the pedigree
-    def add_inbreeding_info(dog_obj):
-        if dog_obj:
-            try:
-                coi_data = calculate_inbreeding_coefficient(dog_obj, db, generations=4)
-                coi_percentage = coi_data.get('coi_percentage', 0.0)
-                
-                # Determine inbreeding level based on COI percentage
-                if coi_percentage == 0.0:
-                    inbred_level = None  # No highlighting
-                elif coi_percentage < 3.125:
-                    inbred_level = 'low'  # Green
-                elif coi_percentage < 6.25:
-                    inbred_level = 'moderate'  # Yellow
-                elif coi_percentage < 12.5:
-                    inbred_level = 'high'  # Orange
-                else:
-                    inbred_level = 'very-high'  # Red
-                
-                dog_obj.coi_percentage = coi_percentage
-                dog_obj.inbred_level = inbred_level
-            except Exception as e:
-                # If COI calculation fails, don't highlight
-                dog_obj.coi_percentage = 0.0
-                dog_obj.inbred_level = None
-        return dog_obj
+    pedigree_completeness = analysis.completeness()
+    inbreeding_data = analysis.inbreeding_highlights()
     
-    # Process all dogs in the pedigree tree
-    add_inbreeding_info(dog)
-    if hasattr(dog, 'sire') and dog.sire:
-        add_inbreeding_info(dog.sire)
-        if hasattr(dog.sire, 'sire') and dog.sire.sire:
-            add_inbreeding_info(dog.sire.sire)
-            if hasattr(dog.sire.sire, 'sire') and dog.sire.sire.sire:
-                add_inbreeding_info(dog.sire.sire.sire)
-            if hasattr(dog.sire.sire, 'dam') and dog.sire.sire.dam:
-                add_inbreeding_info(dog.sire.sire.dam)
-        if hasattr(dog.sire, 'dam') and dog.sire.dam:
-            add_inbreeding_info(dog.sire.dam)
-            if hasattr(dog.sire.dam, 'sire') and dog.sire.dam.sire:
-                add_inbreeding_info(dog.sire.dam.sire)
-            if hasattr(dog.sire.dam, 'dam') and dog.sire.dam.dam:
-                add_inbreeding_info(dog.sire.dam.dam)
-    if hasattr(dog, 'dam') and dog.dam:
-        add_inbreeding_info(dog.dam)
-        if hasattr(dog.dam, 'sire') and dog.dam.sire:
-            add_inbreeding_info(dog.dam.sire)
-            if hasattr(dog.dam.sire, 'sire') and dog.dam.sire.sire:
-                add_inbreeding_info(dog.dam.sire.sire)
-            if hasattr(dog.dam.sire, 'dam') and dog.dam.sire.dam:
-                add_inbreeding_info(dog.dam.sire.dam)
-        if hasattr(dog.dam, 'dam') and dog.dam.dam:
-            add_inbreeding_info(dog.dam.dam)
-            if hasattr(dog.dam.dam, 'sire') and dog.dam.dam.sire:
-                add_inbreeding_info(dog.dam.dam.sire)
-            if hasattr(dog.dam.dam, 'dam') and dog.dam.dam.dam:
-                add_inbreeding_info(dog.dam.dam.dam)
+    # Add inbreeding levels to every dog in the pedigree, whatever its depth
+    try:
+        analysis.annotate_inbreeding()
+    except Exception:
+        # If COI calculation fails (or times out in the compute pool), don't highlight
+        logger.exception("Error calculating pedigree COI for dog %s", dog_id)
     
-    return templates.TemplateResponse("pedigree_horizontal.html", {
-        "request": request, 
-        "dog": dog,
+    return {
+        "dog": analysis.dog,
+        "ahnentafel": analysis.ahnentafel,
+        "generations": generations,
         "siblings": siblings,
         "pedigree_completeness": pedigree_completeness,
         "inbreeding_data": inbreeding_data
-    })
+    }
 
 # API endpoint for getting pedigree data with specific generation count
 @router.get("/api/dogs/{dog_id}/pedigree/{generations}")
@@ -234,35 +276,40 @@ async def get_dog_pedigree_api(dog_id: int, generations: int, db: Session = Depe
     # Validate generations parameter
     if generations < 1 or generations > 9:
         raise HTTPException(status_code=400, detail="Generations must be between 1 and 9")
-      # Get dog and pedigree information for the requested number of generations
-    pedigree_dog = crud.get_dog_pedigree(db, dog_id=dog_id, generations=generations)
-    if pedigree_dog is None:
+    data = await run_in_threadpool(_pedigree_api_data, db, dog_id, generations)
+    if data is None:
         raise HTTPException(status_code=404, detail="Dog not found")
+    return data
+
+def _pedigree_api_data(db: Session, dog_id: int, generations: int) -> Optional[dict]:
+    from utils import PedigreeAnalysis
+    # Get dog and pedigree information for the requested number of generations
+    analysis = PedigreeAnalysis.load(db, dog_id, generations, offload=True)
+    if analysis is None:
+        return None
+    pedigree_dog = analysis.dog
     
     # Get additional information
-    from utils import get_pedigree_completeness, detect_pedigree_inbreeding, calculate_inbreeding_coefficient
-    
-    pedigree_completeness = get_pedigree_completeness(pedigree_dog, db, generations)
+    pedigree_completeness = analysis.completeness()
     # Detect inbreeding in specified generations for highlighting
-    inbreeding_data = detect_pedigree_inbreeding(pedigree_dog, generations=generations)
+    inbreeding_data = analysis.inbreeding_highlights()
     
     def add_coi_data_to_matrix(matrix, db):
         """Add individual COI data to each ancestor in the matrix"""
+        # Stored population COI where available, computed the same way for the rest
+        try:
+            coi_summaries = analysis.coi_summaries()
+        except Exception as e:
+            coi_summaries = {}
+        
         for generation, ancestors in matrix.items():
             for position, ancestor in ancestors.items():
                 if ancestor and isinstance(ancestor, dict) and 'id' in ancestor:
-                    ancestor_id = ancestor['id']
-                    
-                    # Calculate COI for this individual ancestor
-                    try:
-                        ancestor_dog = db.query(Dog).filter(Dog.id == ancestor_id).first()
-                        if ancestor_dog:
-                            coi_data = calculate_inbreeding_coefficient(ancestor_dog, db, generations=5)
-                            matrix[generation][position]['coi_percentage'] = coi_data['coi_percentage']
-                            matrix[generation][position]['coi_interpretation'] = coi_data['interpretation']
-                        else:
-                            matrix[generation][position]['coi_percentage'] = 0.0
-                    except Exception as e:
+                    summary = coi_summaries.get(ancestor['id'])
+                    if summary:
+                        matrix[generation][position]['coi_percentage'] = summary['coi_percentage']
+                        matrix[generation][position]['coi_interpretation'] = summary['interpretation']
+                    else:
                         # If COI calculation fails, set to 0
                         matrix[generation][position]['coi_percentage'] = 0.0
         return matrix
@@ -302,7 +349,7 @@ async def get_dog_pedigree_api(dog_id: int, generations: int, db: Session = Depe
         return matrix
     
     # Add inbreeding highlighting based on common ancestors detected in main dog's pedigree
-    ancestor_matrix = getattr(pedigree_dog, 'ancestor_matrix', {})
+    ancestor_matrix = analysis.ancestor_matrix
     ancestor_matrix_with_inbreeding = add_inbreeding_levels_to_matrix(ancestor_matrix, inbreeding_data)
     ancestor_matrix_with_coi = add_coi_data_to_matrix(ancestor_matrix_with_inbreeding, db)
 
@@ -321,26 +368,179 @@ async def get_dog_pedigree_api(dog_id: int, generations: int, db: Session = Depe
 
     return {
         "dog": dog_dict,
-        "pedigree": getattr(pedigree_dog, 'pedigree_data', None),
+        "pedigree": analysis.pedigree_data,
         "ancestor_matrix": ancestor_matrix_with_coi,
         "pedigree_completeness": pedigree_completeness,
         "inbreeding_data": inbreeding_data,
         "show_gen": generations
     }
 
+@router.get("/api/dogs/{dog_id}/coi")
+def get_dog_coi_api(dog_id: int, db: Session = Depends(get_db)):
+    """COI of a dog over all known generations: the stored population value, computed on the spot when missing"""
+    if crud.get_dog(db, dog_id=dog_id) is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    from utils import get_coi_summaries
+    return {"dog_id": dog_id, **get_coi_summaries(db, [dog_id])[dog_id]}
+
+@router.get("/api/dogs/{dog_id}/pedigree-stats")
+def get_dog_pedigree_stats_api(dog_id: int, db: Session = Depends(get_db)):
+    """Stored completeness (3/5/10 generations), maximum known depth and equivalent complete generations"""
+    if crud.get_dog(db, dog_id=dog_id) is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    from pedigree_stats import get_pedigree_stats
+    stats = get_pedigree_stats(db, [dog_id]).get(dog_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Pedigree stats not computed yet (run maintenance.py recompute-pedigree-stats)")
+    return {"dog_id": dog_id, **stats}
+
+@router.get("/api/matings/coi")
+def get_trial_mating_coi_api(sire_id: int, dam_id: int, generations: int = 5, db: Session = Depends(get_db)):
+    """
+    COI of a hypothetical litter of sire x dam over all known generations (the parents' kinship),
+    plus common ancestors and their Wright contributions over the given number of generations
+    """
+    if generations < 1 or generations > 9:
+        raise HTTPException(status_code=400, detail="Generations must be between 1 and 9")
+    if sire_id == dam_id:
+        raise HTTPException(status_code=400, detail="Sire and dam must be different dogs")
+    sire = crud.get_dog(db, dog_id=sire_id)
+    if sire is None:
+        raise HTTPException(status_code=404, detail="Sire not found")
+    dam = crud.get_dog(db, dog_id=dam_id)
+    if dam is None:
+        raise HTTPException(status_code=404, detail="Dam not found")
+    
+    from kinship import get_trial_mating_coi
+    warnings = []
+    if sire.sex != "Male":
+        warnings.append(f"Sire '{sire.name}' is not marked as Male")
+    if dam.sex != "Female":
+        warnings.append(f"Dam '{dam.name}' is not marked as Female")
+    
+    return {
+        "sire": {"id": sire.id, "name": sire.name, "registration_number": sire.registration_number},
+        "dam": {"id": dam.id, "name": dam.name, "registration_number": dam.registration_number},
+        "warnings": warnings,
+        **get_trial_mating_coi(db, sire_id, dam_id, generations=generations)
+    }
+
+@router.post("/api/matings/coi-matrix")
+def get_mating_coi_matrix_api(request: schemas.MatingMatrixRequest, db: Session = Depends(get_db)):
+    """Offspring COI of every sire x dam pairing (all known generations, ancestor inbreeding included)"""
+    from kinship import get_coi_matrix, MATING_MATRIX_MAX_DOGS
+    if not request.sire_ids or not request.dam_ids:
+        raise HTTPException(status_code=400, detail="Both sire_ids and dam_ids are required")
+    if len(request.sire_ids) > MATING_MATRIX_MAX_DOGS or len(request.dam_ids) > MATING_MATRIX_MAX_DOGS:
+        raise HTTPException(status_code=400, detail=f"At most {MATING_MATRIX_MAX_DOGS} sires and {MATING_MATRIX_MAX_DOGS} dams per request")
+    return get_coi_matrix(db, request.sire_ids, request.dam_ids)
+
+@router.get("/api/dogs/{dog_id}/mate-suggestions")
+def get_mate_suggestions_api(dog_id: int, k: int = 20, breed: Optional[str] = None,
+                             min_birth_year: Optional[int] = None, max_birth_year: Optional[int] = None,
+                             has_health_tests: bool = False, db: Session = Depends(get_db)):
+    """Opposite-sex partners ranked by the expected COI of the litter, lowest first"""
+    if k < 1 or k > 200:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 200")
+    dog = crud.get_dog(db, dog_id=dog_id)
+    if dog is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    
+    from kinship import get_mate_suggestions
+    result = get_mate_suggestions(
+        db, dog, k=k, breed=breed, min_birth_year=min_birth_year,
+        max_birth_year=max_birth_year, has_health_tests=has_health_tests
+    )
+    return {"dog": {"id": dog.id, "name": dog.name, "sex": dog.sex, "breed": breed or dog.breed}, **result}
+
+@router.get("/api/dogs/{dog_id}/descendants")
+def get_dog_descendants_api(dog_id: int, generations: int = 3, db: Session = Depends(get_db)):
+    if generations < 1 or generations > 9:
+        raise HTTPException(status_code=400, detail="Generations must be between 1 and 9")
+    if crud.get_dog(db, dog_id=dog_id) is None:
+        raise HTTPException(status_code=404, detail="Dog not found")
+    return crud.get_descendants(db, dog_id=dog_id, generations=generations)
+
+@router.get("/api/pedigree-cache/stats")
+def pedigree_cache_stats():
+    """Hit/miss counters of the pedigree result cache and the ancestor and parent path caches"""
+    from pedigree_cache import pedigree_cache, ancestor_path_cache, parent_path_cache
+    return {
+        **pedigree_cache.stats(),
+        "ancestor_paths": ancestor_path_cache.stats(),
+        "parent_paths": parent_path_cache.stats()
+    }
+
+@router.get("/api/dogs/autocomplete")
+async def autocomplete_dogs_api(q: str, sex: Optional[str] = None, breed: Optional[str] = None, limit: int = 10,
+                                db: AsyncSession = Depends(get_async_db)):
+    """Dogs whose name, a word of the name, or registration number starts with q"""
+    if limit < 1 or limit > 50:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
+    return await crud.autocomplete_dogs_async(db, query=q, limit=limit, sex=sex, breed=breed)
+
+@router.get("/api/search/fuzzy")
+async def fuzzy_search_api(q: str, limit: int = 20, field: Optional[str] = None,
+                           db: AsyncSession = Depends(get_async_db)):
+    """Dogs ranked by trigram similarity of their name or kennel name to q, across spellings and scripts"""
+    from fuzzy_index import FUZZY_FIELDS
+    if field is not None and field not in FUZZY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"field must be one of: {', '.join(FUZZY_FIELDS)}")
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    fields = (field,) if field else FUZZY_FIELDS
+    return await crud.fuzzy_search_dogs_async(db, query=q, limit=limit, fields=fields)
+
+@router.get("/api/dogs/facets")
+async def dog_facets_api(q: Optional[str] = None, facets: dict = Depends(parse_facet_filters),
+                         db: AsyncSession = Depends(get_async_db)):
+    """Number of dogs (or search results for q) per facet value, each facet under the other filters"""
+    counts = await crud.facet_counts_async(db, facets, query=q.strip() if q and q.strip() else None)
+    return {facet: [{"value": value, "count": count} for value, count in values] for facet, values in counts.items()}
+
 # API Routes
 @router.get("/api/dogs/", response_model=List[schemas.Dog])
-def read_dogs_api(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    dogs = crud.get_dogs(db, skip=skip, limit=limit)
-    return dogs
+async def read_dogs_api(response: Response, skip: int = 0, limit: int = 100, after: Optional[str] = None,
+                        before: Optional[str] = None, min_known_generations: Optional[int] = None,
+                        order_by: Optional[str] = None, facets: dict = Depends(parse_facet_filters),
+                        db: AsyncSession = Depends(get_async_db)):
+    """
+    Pass the X-Next-Cursor (or X-Prev-Cursor) header of a response as ?after= (or ?before=)
+    to get the adjacent page; X-Total-Count may lag recent imports by a minute.
+    """
+    if order_by and order_by not in crud.PEDIGREE_STATS_ORDERING:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of: {', '.join(crud.PEDIGREE_STATS_ORDERING)}")
+    try:
+        result = await crud.get_dogs_page_async(db, limit=limit, after=after, before=before, skip=skip,
+                                                min_known_generations=min_known_generations, order_by=order_by,
+                                                facets=facets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(result.total)
+    if result.next_cursor:
+        response.headers["X-Next-Cursor"] = result.next_cursor
+    if result.prev_cursor:
+        response.headers["X-Prev-Cursor"] = result.prev_cursor
+    return result.items
 
 @router.post("/api/dogs/", response_model=schemas.Dog)
 def create_dog_api(dog: schemas.DogCreate, db: Session = Depends(get_db)):
     return crud.create_dog(db=db, dog=dog)
 
+@router.post("/api/dogs/lookup")
+async def lookup_dogs_api(lookup: schemas.IdentifierLookup, db: AsyncSession = Depends(get_async_db)):
+    """Resolve registration numbers, microchips and tattoo numbers (any spacing, N/NO prefix) to dog ids"""
+    if len(lookup.identifiers) > LOOKUP_MAX_IDENTIFIERS:
+        raise HTTPException(status_code=400, detail=f"At most {LOOKUP_MAX_IDENTIFIERS} identifiers per request")
+    matches = await crud.lookup_dog_ids_async(db, lookup.identifiers)
+    return {
+        "matches": matches,
+        "unmatched": [identifier for identifier in lookup.identifiers if identifier not in matches]
+    }
+
 @router.get("/api/dogs/{dog_id}", response_model=schemas.Dog)
-def read_dog_api(dog_id: int, db: Session = Depends(get_db)):
-    db_dog = crud.get_dog(db, dog_id=dog_id)
+async def read_dog_api(dog_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_dog = await crud.get_dog_async(db, dog_id=dog_id)
     if db_dog is None:
         raise HTTPException(status_code=404, detail="Dog not found")
     return db_dog
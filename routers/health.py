@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import crud
 import schemas
-from database import get_db
+from database import get_async_db, get_db
 import json
 
 router = APIRouter()
@@ -22,13 +23,13 @@ def create_health_test_type(test_type: schemas.HealthTestTypeCreate, db: Session
 
 # Health Tests Routes
 @router.get("/dogs/{dog_id}/health-tests", response_class=HTMLResponse)
-async def dog_health_tests_page(request: Request, dog_id: int, db: Session = Depends(get_db)):
-    dog = crud.get_dog(db, dog_id=dog_id)
+async def dog_health_tests_page(request: Request, dog_id: int, db: AsyncSession = Depends(get_async_db)):
+    dog = await crud.get_dog_async(db, dog_id=dog_id)
     if dog is None:
         raise HTTPException(status_code=404, detail="Dog not found")
     
-    health_tests = crud.get_dog_health_tests(db, dog_id=dog_id)
-    test_types = crud.get_health_test_types(db)
+    health_tests = await crud.get_dog_health_tests_async(db, dog_id=dog_id)
+    test_types = await crud.get_health_test_types_async(db)
     
     return templates.TemplateResponse("health_tests.html", {
         "request": request,
@@ -38,7 +39,7 @@ async def dog_health_tests_page(request: Request, dog_id: int, db: Session = Dep
     })
 
 @router.post("/dogs/{dog_id}/health-tests", response_class=HTMLResponse)
-async def add_health_test(
+def add_health_test(
     request: Request,
     dog_id: int,
     test_type_id: int = Form(...),
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+import schemas
+from database import get_db
+from models import Job
+
+router = APIRouter()
+
+@router.get("/api/jobs")
+def read_jobs(kind: Optional[str] = None, status: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    """Most recent background jobs, optionally filtered by kind and status"""
+    from jobs import get_jobs, job_to_dict
+    return [job_to_dict(job) for job in get_jobs(db, kind=kind, status=status, limit=min(limit, 500))]
+
+@router.get("/api/jobs/{job_id}")
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    """Status, progress (0..1) and result of a background job"""
+    from jobs import job_to_dict
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+@router.post("/api/jobs", status_code=202)
+def create_job(job_request: schemas.JobCreate, db: Session = Depends(get_db)):
+    """Queue a registry-wide recomputation; poll /api/jobs/{id} for its progress"""
+    from jobs import REGISTRY_JOB_KINDS, enqueue_job, job_to_dict
+    if job_request.kind not in REGISTRY_JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(REGISTRY_JOB_KINDS)}")
+    return job_to_dict(enqueue_job(db, job_request.kind))
@@ -96,5 +96,15 @@ class DogPedigree(DogSimple):
     class Config:
         from_attributes = True
 
+class MatingMatrixRequest(BaseModel):
+    sire_ids: List[int]
+    dam_ids: List[int]
+
+class JobCreate(BaseModel):
+    kind: str
+
+class IdentifierLookup(BaseModel):
+    identifiers: List[str]  # Registration numbers, microchips or tattoo numbers, in any spacing
+
 # Enable forward references
 DogPedigree.model_rebuild()
@@ -0,0 +1,249 @@
+"""
+In-memory inverted search index for PedigreeDatabase
+
+crud.search_dogs used to OR six LIKE '%q%' predicates, a full table scan per page and
+another one for the count. This index keeps the searchable fields of every dog as
+tokens (letter runs and digit runs, lowercased, so "NO 17385/06" gives no, 17385, 06)
+with a posting map per token and a sorted vocabulary for prefix lookups. A query
+matches a dog when every query token is a prefix of one of the dog's tokens.
+
+Ranking: an exact registration number or microchip match comes first, then dogs by
+relevance (the field each query token hit, weighted, with a bonus for whole-token
+matches), then name and id. crud write functions keep the index current; bulk
+importers queue a rebuild-search-index (or refresh-registry) job, which reloads it.
+
+The ranked matches of recent queries are kept (keyed by the normalized query and
+checked against the index version), so every page of a result, and its total, is a
+slice of one sorted list; keyset cursors are positions in it (see pagination.py).
+"""
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from identifiers import normalize_identifier
+from models import Dog
+
+SEARCH_FIELDS = ("name", "registration_number", "tatoo_no", "microchip", "kennel_name", "breed")
+# Relevance of a hit in each field; identifiers weigh as much as the name
+FIELD_WEIGHTS = {"name": 4, "registration_number": 4, "tatoo_no": 3, "microchip": 4, "kennel_name": 2, "breed": 1}
+EXACT_TOKEN_BONUS = 2  # Whole-token match over a prefix match
+EXACT_KEY_FIELDS = ("registration_number", "microchip")
+
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "32"))
+
+_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+
+# Sort key of a match: (0 for an exact registration/microchip match else 1, -score, name, dog_id)
+Rank = Tuple[int, int, str, int]
+RANK_TYPES = ((int,), (int,), (str,), (int,))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercased letter runs and digit runs of a field value or query"""
+    return _TOKEN.findall(text.casefold()) if text else []
+
+
+def exact_key(text: Optional[str]) -> Optional[str]:
+    """Registration number / microchip compared whole, normalized like Dog.registration_key"""
+    return normalize_identifier(text)
+
+
+class SearchIndex:
+    """
+    Token -> {dog_id: weight} postings over SEARCH_FIELDS, plus exact registration
+    number / microchip keys. ``version`` is incremented on every change.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.vocabulary: List[str] = []  # Sorted tokens, for prefix ranges
+        self.exact: Dict[str, Set[int]] = {}
+        self.names: Dict[int, str] = {}  # Tie-break order
+        self._entries: Dict[int, Tuple[Dict[str, int], List[str]]] = {}  # dog_id -> (token weights, exact keys)
+        self.version = 0
+        self._lock = threading.RLock()
+        self._ranked: "OrderedDict[tuple, Tuple[int, List[Rank]]]" = OrderedDict()
+
+    @classmethod
+    def from_db(cls, db: Session) -> "SearchIndex":
+        """Build the index with a single SELECT of the searchable columns"""
+        index = cls()
+        columns = [getattr(Dog, field) for field in SEARCH_FIELDS]
+        for row in db.query(Dog.id, *columns).yield_per(5000):
+            index._add(row.id, {field: getattr(row, field) for field in SEARCH_FIELDS})
+        index.vocabulary = sorted(index.postings)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _add(self, dog_id: int, fields: Dict[str, Optional[str]], keep_vocabulary: bool = False):
+        weights: Dict[str, int] = {}
+        for field in SEARCH_FIELDS:
+            for token in tokenize(fields.get(field)):
+                weights[token] = max(weights.get(token, 0), FIELD_WEIGHTS[field])
+        keys = [key for key in (exact_key(fields.get(field)) for field in EXACT_KEY_FIELDS) if key]
+
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if keep_vocabulary:
+                    insort(self.vocabulary, token)
+            posting[dog_id] = weight
+        for key in keys:
+            self.exact.setdefault(key, set()).add(dog_id)
+        self.names[dog_id] = (fields.get("name") or "").casefold()
+        self._entries[dog_id] = (weights, keys)
+
+    def _remove(self, dog_id: int):
+        entry = self._entries.pop(dog_id, None)
+        if entry is None:
+            return
+        weights, keys = entry
+        for token in weights:
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(dog_id, None)
+                if not posting:
+                    del self.postings[token]
+                    i = bisect_left(self.vocabulary, token)
+                    if i < len(self.vocabulary) and self.vocabulary[i] == token:
+                        del self.vocabulary[i]
+        for key in keys:
+            ids = self.exact.get(key)
+            if ids is not None:
+                ids.discard(dog_id)
+                if not ids:
+                    del self.exact[key]
+        self.names.pop(dog_id, None)
+
+    def set_dog(self, dog_id: int, fields: Dict[str, Optional[str]]):
+        """Add a dog or re-index its searchable fields"""
+        with self._lock:
+            self._remove(dog_id)
+            self._add(dog_id, fields, keep_vocabulary=True)
+            self.version += 1
+
+    def remove(self, dog_id: int):
+        with self._lock:
+            self._remove(dog_id)
+            self.version += 1
+
+    def _prefix_scores(self, query_token: str) -> Dict[int, int]:
+        """Best weight per dog over every token starting with query_token"""
+        scores: Dict[int, int] = {}
+        i = bisect_left(self.vocabulary, query_token)
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(query_token):
+            token = self.vocabulary[i]
+            bonus = EXACT_TOKEN_BONUS if token == query_token else 0
+            for dog_id, weight in self.postings[token].items():
+                score = weight + bonus
+                if score > scores.get(dog_id, 0):
+                    scores[dog_id] = score
+            i += 1
+        return scores
+
+    def ranked(self, query: str) -> List[Rank]:
+        """Sort keys of every dog matching the query, best first (kept for recent queries)"""
+        query_tokens = sorted(set(tokenize(query)), key=len, reverse=True)
+        key = exact_key(query)
+        cache_key = (key, tuple(query_tokens))
+        with self._lock:
+            cached = self._ranked.get(cache_key)
+            if cached is not None and cached[0] == self.version:
+                self._ranked.move_to_end(cache_key)
+                return cached[1]
+
+            exact_ids = self.exact.get(key, set()) if key else set()
+            scores: Optional[Dict[int, int]] = None
+            # Longest tokens first: they usually have the fewest matches to intersect with
+            for query_token in query_tokens:
+                token_scores = self._prefix_scores(query_token)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {dog_id: score + token_scores[dog_id] for dog_id, score in scores.items() if dog_id in token_scores}
+                if not scores:
+                    break
+            scores = scores or {}
+
+            names = self.names
+            ranks = [(0, 0, names.get(dog_id, ""), dog_id) for dog_id in exact_ids]
+            ranks.extend((1, -score, names.get(dog_id, ""), dog_id) for dog_id, score in scores.items() if dog_id not in exact_ids)
+            ranks.sort()
+
+            self._ranked[cache_key] = (self.version, ranks)
+            while len(self._ranked) > SEARCH_RESULT_CACHE_SIZE:
+                self._ranked.popitem(last=False)
+            return ranks
+
+    def search(self, query: str, skip: int = 0, limit: Optional[int] = None) -> Tuple[List[int], int]:
+        """One page of matching dog ids, best first, and the total number of matches"""
+        ranks = self.ranked(query)
+        page = ranks[skip:] if limit is None else ranks[skip:skip + limit]
+        return [rank[-1] for rank in page], len(ranks)
+
+    def search_page(self, query: str, limit: int, after: Optional[Rank] = None,
+                    before: Optional[Rank] = None, skip: int = 0,
+                    only: Optional[Set[int]] = None) -> Tuple[List[Rank], int, int]:
+        """
+        The ``limit`` matches right after the ``after`` sort key (or right before
+        ``before``, or from ``skip``), with the offset of the first one and the total
+        number of matches; with ``only``, matches outside that set of dog ids are left out
+        """
+        ranks = self.ranked(query)
+        if only is not None:
+            ranks = [rank for rank in ranks if rank[-1] in only]
+        if before is not None:
+            end = bisect_left(ranks, before)
+            start = max(0, end - limit)
+        else:
+            start = bisect_right(ranks, after) if after is not None else max(0, skip)
+            end = start + limit
+        return ranks[start:end], start, len(ranks)
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_search_index(db: Session) -> SearchIndex:
+    """(Re)build the process-wide search index from the database"""
+    global _index
+    index = SearchIndex.from_db(db)
+    with _index_lock:
+        _index = index
+    return index
+
+
+def get_search_index(db: Session) -> SearchIndex:
+    """Return the process-wide search index, building it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SearchIndex.from_db(db)
+    return _index
+
+
+def index_dog(dog: Dog):
+    """Apply a created or updated dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.set_dog(dog.id, {field: getattr(dog, field) for field in SEARCH_FIELDS})
+
+
+def unindex_dog(dog_id: int):
+    """Apply a deleted dog to the loaded index (no-op if not loaded yet)"""
+    if _index is not None:
+        _index.remove(dog_id)
+
+
+def reset_search_index():
+    """Drop the loaded index so the next search rebuilds it (e.g. after bulk imports)"""
+    global _index
+    with _index_lock:
+        _index = None
@@ -14,6 +14,29 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 300));
     }
 
+    // Search box suggestions: picking one opens the dog
+    document.querySelectorAll('form[action="/search"] input[name="q"]').forEach(input => {
+        setupAutocomplete(input, {}, dog => {
+            window.location.href = `/dogs/${dog.id}`;
+        });
+    });
+
+    // Sire/dam pickers: picking one stores the id in the hidden field named by data-autocomplete-target
+    document.querySelectorAll('input[data-autocomplete-target]').forEach(input => {
+        const target = document.getElementById(input.dataset.autocompleteTarget);
+        const breedInput = document.getElementById(input.dataset.autocompleteBreed || '');
+        const options = () => ({
+            sex: input.dataset.autocompleteSex,
+            breed: breedInput ? breedInput.value.trim() : ''
+        });
+        setupAutocomplete(input, options, dog => {
+            target.value = dog.id;
+            input.value = dogLabel(dog);
+        });
+        // Editing the text drops a previous pick until a new one is made
+        input.addEventListener('input', () => { target.value = ''; });
+    });
+
     // Form validation
     const forms = document.querySelectorAll('.needs-validation');
     forms.forEach(form => {
@@ -61,14 +84,120 @@ function performSearch(query) {
     if (searchResults) {
         searchResults.innerHTML = '<div class="text-center"><div class="loading-spinner"></div> Searching...</div>';
         
-        // Simulate API call (replace with actual fetch when API search is implemented)
-        setTimeout(() => {
-            // This would be replaced with actual search results
-            searchResults.innerHTML = '<div class="text-muted">Search functionality will be implemented with API endpoints.</div>';
-        }, 500);
+        fetchSuggestions(query, { limit: 20 }).then(dogs => {
+            if (!dogs.length) {
+                searchResults.innerHTML = '<div class="text-muted">No dogs found.</div>';
+                return;
+            }
+            searchResults.innerHTML = '';
+            const list = document.createElement('div');
+            list.className = 'list-group';
+            dogs.forEach(dog => {
+                const link = document.createElement('a');
+                link.className = 'list-group-item list-group-item-action';
+                link.href = `/dogs/${dog.id}`;
+                link.textContent = dogLabel(dog);
+                list.appendChild(link);
+            });
+            searchResults.appendChild(list);
+        }).catch(() => {
+            searchResults.innerHTML = '<div class="text-danger">Search failed.</div>';
+        });
     }
 }
 
+// Typeahead suggestions from /api/dogs/autocomplete
+function fetchSuggestions(query, options = {}) {
+    const params = new URLSearchParams({ q: query, limit: options.limit || 10 });
+    if (options.sex) params.set('sex', options.sex);
+    if (options.breed) params.set('breed', options.breed);
+    return fetch(`/api/dogs/autocomplete?${params}`).then(response => {
+        if (!response.ok) {
+            throw new Error(`Autocomplete failed: ${response.status}`);
+        }
+        return response.json();
+    });
+}
+
+function dogLabel(dog) {
+    const details = [dog.registration_number || 'No Reg #'];
+    if (dog.year_of_birth) details.push(dog.year_of_birth);
+    return `${dog.name} (${details.join(', ')})`;
+}
+
+// Attach a suggestion menu to a text input; options is an object or a function returning one
+function setupAutocomplete(input, options, onSelect) {
+    const menu = document.createElement('div');
+    menu.className = 'list-group autocomplete-menu d-none';
+    input.parentNode.classList.add('position-relative');
+    input.parentNode.appendChild(menu);
+    input.setAttribute('autocomplete', 'off');
+
+    let dogs = [];
+    let active = -1;
+    let requested = '';
+
+    const close = () => {
+        menu.classList.add('d-none');
+        active = -1;
+    };
+    const highlight = index => {
+        active = index;
+        Array.from(menu.children).forEach((item, i) => item.classList.toggle('active', i === index));
+    };
+    const choose = index => {
+        if (dogs[index]) {
+            onSelect(dogs[index]);
+            close();
+        }
+    };
+
+    input.addEventListener('input', debounce(function() {
+        const query = input.value.trim();
+        if (query.length < 2) {
+            close();
+            return;
+        }
+        requested = query;
+        const current = typeof options === 'function' ? options() : options;
+        fetchSuggestions(query, current).then(result => {
+            if (requested !== query) return;  // A newer request is on its way
+            dogs = result;
+            menu.innerHTML = '';
+            dogs.forEach((dog, i) => {
+                const item = document.createElement('button');
+                item.type = 'button';
+                item.className = 'list-group-item list-group-item-action';
+                item.textContent = dogLabel(dog);
+                item.addEventListener('mousedown', event => {
+                    event.preventDefault();  // Keep focus so blur does not close the menu first
+                    choose(i);
+                });
+                menu.appendChild(item);
+            });
+            menu.classList.toggle('d-none', dogs.length === 0);
+            active = -1;
+        }).catch(close);
+    }, 150));
+
+    input.addEventListener('keydown', event => {
+        if (menu.classList.contains('d-none')) return;
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            highlight(Math.min(active + 1, dogs.length - 1));
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight(Math.max(active - 1, 0));
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            choose(active);
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+    input.addEventListener('blur', close);
+}
+
 // Update valid results based on test type
 function updateValidResults(testTypeId) {
     const testTypes = window.testTypesData || {};
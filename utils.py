@@ -4,24 +4,41 @@ Utility functions for PedigreeDatabase
 from typing import Dict, List, Optional, Any
 from sqlalchemy.orm import Session
 from models import Dog
+import crud
+from pedigree_graph import ParentGraph, get_parent_graph
+from ancestry import get_ancestors_with_paths as get_materialized_ancestors
+from inbreeding import ancestor_closure, compute_coi, get_stored_coi, stored_coi_version
+from pedigree_cache import ancestor_coi_cache, ancestor_path_cache, parent_path_cache
 import math
+import os
+
+OFFSPRING = -1  # Key of the (possibly hypothetical) offspring in offspring_pedigree mappings
+WRIGHT_MAX_PATHS = int(os.getenv("WRIGHT_MAX_PATHS", "20000"))  # Per parent, for the per-ancestor breakdown
 
 def calculate_inbreeding_coefficient(dog: Dog, db: Session, generations: int = 5) -> Dict[str, Any]:
     """
-    Calculate inbreeding coefficient using Wright's coefficient of inbreeding.
+    Calculate the coefficient of inbreeding over the given number of generations.
     
-    Wright's Formula: F = Σ(1/2)^(n1+n2+1) * (1+FA)
-    Where:
-    - F = inbreeding coefficient
-    - n1 = generations from individual to common ancestor through sire
-    - n2 = generations from individual to common ancestor through dam  
-    - FA = inbreeding coefficient of the common ancestor (simplified to 0)
+    The pedigree is cut ``generations`` generations above the parents (see
+    offspring_pedigree) and the COI of that pedigree is computed exactly with the
+    Meuwissen & Luo algorithm, ancestor inbreeding included. Each common ancestor is
+    listed with its term of Wright's formula, F = Σ(1/2)^(n1+n2+1) * (1+FA), where
+    - n1 = generations from the sire to the common ancestor
+    - n2 = generations from the dam to the common ancestor
+    - FA = inbreeding coefficient of the common ancestor in the same pedigree
+    summed only over path pairs that meet in no other dog, so the terms add up to the COI.
     
     Returns: Dictionary with COI percentage, detailed breakdown, and common ancestors
     """    # Check if both parents exist (get actual integer IDs)
     sire_id = getattr(dog, 'sire_id', None)
     dam_id = getattr(dog, 'dam_id', None)
-    
+    return calculate_mating_coefficient(sire_id, dam_id, db, generations=generations)
+
+def calculate_mating_coefficient(sire_id: Optional[int], dam_id: Optional[int], db: Session, generations: int = 5) -> Dict[str, Any]:
+    """
+    COI of an offspring of the given sire and dam, which need not exist yet
+    (trial matings). Same result shape as calculate_inbreeding_coefficient.
+    """
     if not sire_id or not dam_id:
         return {
             "coi_percentage": 0.0,
@@ -31,109 +48,368 @@ def calculate_inbreeding_coefficient(dog: Dog, db: Session, generations: int = 5
             "error": "Incomplete pedigree - both parents required for COI calculation"
         }
     
-    # Get all ancestors from sire line
-    sire_ancestors = _get_ancestors_with_paths(sire_id, db, generations, "sire")
-    # Get all ancestors from dam line  
-    dam_ancestors = _get_ancestors_with_paths(dam_id, db, generations, "dam")
-    
-    # Find common ancestors between sire and dam lines
-    common_ancestor_ids = set(sire_ancestors.keys()) & set(dam_ancestors.keys())
+    pedigree = offspring_pedigree(get_parent_graph(db), sire_id, dam_id, generations)
+    return coi_from_pedigree(db, pedigree, generations)
+
+def coi_from_pedigree(db: Session, pedigree: Dict[int, tuple], generations: int = 5) -> Dict[str, Any]:
+    """COI and Wright's per-ancestor breakdown for the offspring of an offspring_pedigree mapping"""
+    inbreeding = compute_coi(ParentGraph.from_parents(pedigree))
+    total_coi = inbreeding[OFFSPRING]
+    contributions = wright_contributions(pedigree, inbreeding)
     
-    if not common_ancestor_ids:
+    if not total_coi:
         return {
             "coi_percentage": 0.0,
             "common_ancestors": [],
-            "paths_analyzed": len(sire_ancestors) + len(dam_ancestors),
+            "paths_analyzed": len(pedigree) - 1,
             "generations_analyzed": generations,
             "message": "No common ancestors found within specified generations"
         }
     
-    # Calculate COI contribution from each common ancestor
-    total_coi = 0.0
-    common_ancestors_details = []
+    common_ancestors_details = common_ancestor_details(db, contributions or {}, inbreeding)
     
-    for ancestor_id in common_ancestor_ids:
-        # Get ancestor details
-        ancestor_dog = db.query(Dog).filter(Dog.id == ancestor_id).first()
+    result = {
+        "coi_percentage": round(total_coi * 100, 4),
+        "coi_decimal": round(total_coi, 6),
+        "common_ancestors": common_ancestors_details,
+        "common_ancestor_count": len(common_ancestors_details),
+        "paths_analyzed": len(pedigree) - 1,
+        "generations_analyzed": generations,
+        "interpretation": _interpret_coi(total_coi * 100)
+    }
+    if contributions is None:
+        result["message"] = f"More than {WRIGHT_MAX_PATHS} paths per parent; common ancestors are not broken down"
+    return result
+
+def offspring_pedigree(parents, sire_id: int, dam_id: int, generations: int) -> Dict[int, tuple]:
+    """
+    {dog_id: (sire_id, dam_id)} for an offspring of sire and dam (under the OFFSPRING key,
+    so it need not exist) and every ancestor within ``generations`` generations above the
+    parents, over a parent mapping (the ParentGraph or a plain dict snapshot of it).
+    Ancestors first met at that limit keep no parents: they count as unrelated founders.
+    """
+    pedigree = {OFFSPRING: (sire_id, dam_id)}
+    level = list(dict.fromkeys(dog_id for dog_id in (sire_id, dam_id) if dog_id))
+    seen = set(level)
+    for generation in range(generations + 1):
+        next_level = []
+        for dog_id in level:
+            links = parents.get(dog_id) if generation < generations else None
+            pedigree[dog_id] = links or (None, None)
+            for parent_id in pedigree[dog_id]:
+                if parent_id and parent_id not in seen:
+                    seen.add(parent_id)
+                    next_level.append(parent_id)
+        level = next_level
+    return pedigree
+
+def wright_contributions(pedigree: Dict[int, tuple], inbreeding: Dict[int, float],
+                         max_paths: int = WRIGHT_MAX_PATHS) -> Optional[Dict[int, Dict[str, Any]]]:
+    """
+    Wright's formula term by term for the offspring of an offspring_pedigree mapping:
+    (1/2)^(n1+n2+1) * (1+FA) for every pair of sire-side and dam-side paths to a common
+    ancestor that share no other dog (a pair through a shared intermediate ancestor is
+    already counted at that ancestor). With FA from ``inbreeding`` (exact COIs of the same
+    pedigree) the terms add up to the offspring's COI.
+    Returns {ancestor_id: {"contribution", "path_pairs", "sire_paths", "dam_paths"}}, or
+    None when a parent has more than ``max_paths`` paths to enumerate.
+    """
+    sire_id, dam_id = pedigree[OFFSPRING]
+    sire_paths = _paths_to_ancestors(pedigree, sire_id, max_paths)
+    dam_paths = _paths_to_ancestors(pedigree, dam_id, max_paths)
+    if sire_paths is None or dam_paths is None:
+        return None
+    return wright_terms(sire_paths, dam_paths, inbreeding)
+
+def wright_terms(sire_paths: Dict[int, List[tuple]], dam_paths: Dict[int, List[tuple]],
+                 inbreeding: Dict[int, float]) -> Dict[int, Dict[str, Any]]:
+    """Wright's terms per common ancestor from each parent's _paths_to_ancestors (see wright_contributions)"""
+    contributions = {}
+    for ancestor_id in sire_paths.keys() & dam_paths.keys():
+        weight = 0.0
+        pairs = 0
+        for sire_length, sire_dogs in sire_paths[ancestor_id]:
+            for dam_length, dam_dogs in dam_paths[ancestor_id]:
+                if sire_dogs.isdisjoint(dam_dogs):
+                    weight += 0.5 ** (sire_length + dam_length + 1)
+                    pairs += 1
+        if pairs:
+            contributions[ancestor_id] = {
+                "contribution": weight * (1.0 + inbreeding.get(ancestor_id, 0.0)),
+                "path_pairs": pairs,
+                "sire_paths": len(sire_paths[ancestor_id]),
+                "dam_paths": len(dam_paths[ancestor_id])
+            }
+    return contributions
+
+def common_ancestor_details(db: Session, contributions: Dict[int, Dict[str, Any]],
+                            inbreeding: Dict[int, float]) -> List[Dict[str, Any]]:
+    """wright_terms output as API entries with the ancestors' names, highest contribution first"""
+    common_ancestors_details = []
+    ancestor_dogs = {
+        ancestor_dog.id: ancestor_dog
+        for ancestor_dog in db.query(Dog.id, Dog.name, Dog.registration_number).filter(Dog.id.in_(list(contributions))).all()
+    }
+    for ancestor_id, terms in contributions.items():
+        ancestor_dog = ancestor_dogs.get(ancestor_id)
         if not ancestor_dog:
             continue
         
-        # Get paths to this ancestor from both sides
-        sire_paths = sire_ancestors[ancestor_id]
-        dam_paths = dam_ancestors[ancestor_id]
-        
-        ancestor_coi_contribution = 0.0
-        
-        # Calculate contribution for each path combination
-        for sire_path_length in sire_paths:
-            for dam_path_length in dam_paths:
-                # Wright's formula: (1/2)^(n1+n2+1) * (1+FA)
-                # We assume FA = 0 for simplicity (ancestor not inbred)
-                contribution = (0.5 ** (sire_path_length + dam_path_length + 1)) * 1.0
-                ancestor_coi_contribution += contribution
-        
-        total_coi += ancestor_coi_contribution
-        
         common_ancestors_details.append({
             "ancestor": {
                 "id": ancestor_dog.id,
                 "name": ancestor_dog.name,
                 "registration_number": ancestor_dog.registration_number
             },
-            "coi_contribution": ancestor_coi_contribution,
-            "coi_contribution_percentage": round(ancestor_coi_contribution * 100, 4),
-            "path_combinations": len(sire_paths) * len(dam_paths),
-            "sire_paths": len(sire_paths),
-            "dam_paths": len(dam_paths)
+            "ancestor_coi_percentage": round(inbreeding.get(ancestor_id, 0.0) * 100, 4),
+            "coi_contribution": terms["contribution"],
+            "coi_contribution_percentage": round(terms["contribution"] * 100, 4),
+            "path_combinations": terms["path_pairs"],
+            "sire_paths": terms["sire_paths"],
+            "dam_paths": terms["dam_paths"]
         })
     
     # Sort by contribution (highest first)
     common_ancestors_details.sort(key=lambda x: x["coi_contribution"], reverse=True)
+    return common_ancestors_details
+
+def _paths_to_ancestors(pedigree: Dict[int, tuple], dog_id: int, max_paths: int,
+                        max_length: Optional[int] = None) -> Optional[Dict[int, List[tuple]]]:
+    """
+    Every path from a dog up to each of its ancestors (the dog itself included, at length 0,
+    and none longer than max_length) as {ancestor_id: [(length, dogs on the path before the
+    ancestor)]}; None past max_paths
+    """
+    paths = {}
+    count = 0
+    stack = [(dog_id, 0, frozenset())]
+    while stack:
+        current_dog_id, length, before = stack.pop()
+        paths.setdefault(current_dog_id, []).append((length, before))
+        count += 1
+        if count > max_paths:
+            return None
+        if max_length is not None and length >= max_length:
+            continue
+        on_path = before | {current_dog_id}
+        for parent_id in pedigree.get(current_dog_id, (None, None)):
+            # Skipping dogs already on the path guards against parent cycles in bad data
+            if parent_id and parent_id not in on_path:
+                stack.append((parent_id, length + 1, on_path))
+    return paths
+
+def parent_paths(graph: ParentGraph, dog_id: int, generations: int) -> Optional[Dict[int, List[tuple]]]:
+    """
+    _paths_to_ancestors of a parent over ``generations`` generations, cached per dog
+    (parent_path_cache) so trial matings of one dam with many sires walk her side once.
+    None when the dog has more than WRIGHT_MAX_PATHS paths.
+    """
+    paths = parent_path_cache.get(graph, dog_id, generations)
+    if paths is not None:
+        return paths
+    version = graph.lineage_version
+    paths = _paths_to_ancestors(graph, dog_id, WRIGHT_MAX_PATHS, generations)
+    if paths is not None:
+        parent_path_cache.put(graph, version, dog_id, generations, paths)
+    return paths
+
+
+def get_coi_summaries(db: Session, dog_ids: List[int], offload: bool = False) -> Dict[int, Dict[str, Any]]:
+    """
+    COI percentage and interpretation for each dog, for display next to pedigree entries.
+    Reads the stored population COI (dog_coi) when available; dogs without a stored value
+    (e.g. added since the last refresh) get the same all-generations coefficient computed
+    on the spot by population_coi_fractions, so every value means the same thing.
+    """
+    summaries = {}
+    for dog_id, coi in get_stored_coi(db, dog_ids).items():
+        coi_percentage = round(coi * 100, 4)
+        summaries[dog_id] = {
+            "coi_percentage": coi_percentage,
+            "interpretation": _interpret_coi(coi_percentage),
+            "source": "stored"
+        }
     
-    return {
-        "coi_percentage": round(total_coi * 100, 4),
-        "coi_decimal": round(total_coi, 6),
-        "common_ancestors": common_ancestors_details,
-        "common_ancestor_count": len(common_ancestors_details),
-        "paths_analyzed": len(sire_ancestors) + len(dam_ancestors),
-        "generations_analyzed": generations,
-        "interpretation": _interpret_coi(total_coi * 100)
-    }
+    missing_ids = [dog_id for dog_id in set(dog_ids) if dog_id not in summaries]
+    if missing_ids:
+        for dog_id, coi in population_coi_fractions(db, missing_ids, offload).items():
+            coi_percentage = round(coi * 100, 4)
+            summaries[dog_id] = {
+                "coi_percentage": coi_percentage,
+                "interpretation": _interpret_coi(coi_percentage),
+                "source": "calculated"
+            }
+    
+    return summaries
 
+def population_coi_fractions(db: Session, dog_ids: List[int], offload: bool = False) -> Dict[int, float]:
+    """
+    Exact all-generations COI fractions (inbreeding.compute_coi) of dogs without a stored
+    value, with the stored COIs of their ancestors taken as given. Results are cached
+    across requests (ancestor_coi_cache with generations None, tagged with the stored COI
+    version they were seeded from); with ``offload`` the computation runs in the compute
+    process pool and may raise ComputeTimeout.
+    """
+    graph = get_parent_graph(db)
+    version = graph.lineage_version
+    coi_version = stored_coi_version()
+    fractions = {}
+    missing = []
+    for dog_id in set(dog_ids):
+        if dog_id not in graph:
+            continue
+        cached = ancestor_coi_cache.get(graph, dog_id, None)
+        if cached is None or cached[0] != coi_version:
+            missing.append(dog_id)
+        else:
+            fractions[dog_id] = cached[1]
+    
+    if missing:
+        ancestry = {graph.ids[i] for i in ancestor_closure(graph, missing)} - set(missing)
+        known = get_stored_coi(db, ancestry)
+        if offload:
+            from compute_pool import offload_population_coi
+            computed = offload_population_coi(graph, missing, known)
+        else:
+            coefficients = compute_coi(graph, missing, known)
+            computed = {dog_id: coefficients[dog_id] for dog_id in missing}
+        for dog_id, coi in computed.items():
+            ancestor_coi_cache.put(graph, version, dog_id, None, (coi_version, coi))
+        fractions.update(computed)
+    
+    return fractions
 
-def _get_ancestors_with_paths(dog_id: int, db: Session, max_generations: int, line: str) -> Dict[int, List[int]]:
+def calculate_inbreeding_coefficients(db: Session, dog_ids: List[int], generations: int = 5,
+                                      offload: bool = False) -> Dict[int, float]:
     """
-    Get all ancestors of a dog with their path lengths.
-    Returns dict: {ancestor_id: [list_of_path_lengths_to_reach_ancestor]}
+    COI percentage for many dogs at once, computed as in calculate_inbreeding_coefficient
+    (exact COI of each dog's pedigree cut to ``generations``) without the breakdown.
+    Ancestry comes from the in-memory parent graph and results are cached across requests,
+    so the whole batch costs no per-dog queries. With ``offload`` the uncached part runs in
+    the compute process pool (see compute_pool.py) and may raise ComputeTimeout.
+    Returns: {dog_id: coi_percentage} for every dog known to the graph.
     """
-    ancestors = {}
+    graph = get_parent_graph(db)
+    if offload:
+        from compute_pool import offload_coi_percentages
+        return offload_coi_percentages(graph, dog_ids, generations)
+    return coi_percentages(graph, dog_ids, generations, cache=ancestor_coi_cache)
+
+def coi_percentages(parents, dog_ids: List[int], generations: int = 5, cache=None) -> Dict[int, float]:
+    """
+    Batch COI over a parent mapping (``parents.get(dog_id) -> (sire_id, dam_id)``), such
+    as the ParentGraph or a plain dict snapshot of it. ``cache`` (a GraphDerivedCache, only
+    valid when ``parents`` is the live ParentGraph) keeps the results across requests.
+    """
+    fractions = {}
+    missing = []
+    for dog_id in set(dog_ids):
+        if parents.get(dog_id) is None:
+            continue
+        cached = cache.get(parents, dog_id, generations) if cache is not None else None
+        if cached is None:
+            missing.append(dog_id)
+        else:
+            fractions[dog_id] = cached
+    
+    if missing:
+        if cache is not None:
+            version = parents.lineage_version
+        computed = coi_fractions(parents, missing, generations)
+        if cache is not None:
+            for dog_id, coi in computed.items():
+                cache.put(parents, version, dog_id, generations, coi)
+        fractions.update(computed)
+    
+    return {dog_id: round(coi * 100, 4) for dog_id, coi in fractions.items()}
+
+def coi_fractions(parents, dog_ids: List[int], generations: int = 5) -> Dict[int, float]:
+    """
+    COI fractions of the given dogs over a parent mapping, each computed exactly over its
+    own pedigree cut to ``generations`` generations above its parents (see
+    offspring_pedigree). Used by the compute process pool workers.
+    """
+    fractions = {}
+    for dog_id in set(dog_ids):
+        links = parents.get(dog_id)
+        if links is None:
+            continue
+        sire_id, dam_id = links
+        if sire_id and dam_id:
+            pedigree = offspring_pedigree(parents, sire_id, dam_id, generations)
+            fractions[dog_id] = compute_coi(ParentGraph.from_parents(pedigree))[OFFSPRING]
+        else:
+            fractions[dog_id] = 0.0
+    return fractions
+
+
+def _inbred_level(coi_percentage: float) -> Optional[str]:
+    """Highlight class suffix for a COI percentage (None = no highlighting)"""
+    if coi_percentage == 0.0:
+        return None
+    elif coi_percentage < 3.125:
+        return 'low'  # Green
+    elif coi_percentage < 6.25:
+        return 'moderate'  # Yellow
+    elif coi_percentage < 12.5:
+        return 'high'  # Orange
+    else:
+        return 'very-high'  # Red
+
+def _get_ancestors_with_paths(dog_id: int, db: Session, max_generations: int, line: str) -> Dict[int, Dict[int, int]]:
+    """
+    Get all ancestors of a dog with a histogram of path counts by path length.
+    Returns dict: {ancestor_id: {path_length: number_of_paths}}
     
-    def explore_ancestors(current_dog_id: int, current_generation: int):
-        if current_generation > max_generations:
-            return
-        
-        # Get current dog
-        current_dog = db.query(Dog).filter(Dog.id == current_dog_id).first()
-        if not current_dog:
-            return
-          # Add this dog to ancestors (including generation 0 for parent-level inbreeding)
-        if current_dog_id not in ancestors:
-            ancestors[current_dog_id] = []
-        ancestors[current_dog_id].append(current_generation)
-          # Continue to parents if within generation limit
-        if current_generation < max_generations:
-            sire_id = getattr(current_dog, 'sire_id', None)
-            dam_id = getattr(current_dog, 'dam_id', None)
+    Path counts are propagated one generation at a time over the pedigree DAG, so an
+    ancestor reached along many paths is expanded once per level instead of once per path.
+    """
+    graph = get_parent_graph(db)
+    ancestors = ancestor_path_cache.get(graph, dog_id, max_generations)
+    if ancestors is not None:
+        return ancestors
+    version = graph.lineage_version
+    
+    # Indexed lookup in the dog_ancestry closure table when it covers this depth
+    ancestors = get_materialized_ancestors(db, dog_id, max_generations)
+    if ancestors is None:
+        ancestors = _path_histograms(graph, dog_id, max_generations)
+    
+    ancestor_path_cache.put(graph, version, dog_id, max_generations, ancestors)
+    return ancestors
+
+def _path_histograms(parents, dog_id: int, max_generations: int) -> Dict[int, Dict[int, int]]:
+    """Path-count histograms over a parent mapping (``parents.get(dog_id) -> (sire_id, dam_id)``)"""
+    ancestors = {}
+    if parents.get(dog_id) is None:
+        return ancestors
+    
+    # Generation 0 is the dog itself (for parent-level inbreeding)
+    level = {dog_id: 1}
+    for generation in range(max_generations + 1):
+        next_level = {}
+        for current_dog_id, paths in level.items():
+            links = parents.get(current_dog_id)
+            if links is None:
+                continue
+            ancestors.setdefault(current_dog_id, {})[generation] = paths
             
-            if sire_id:
-                explore_ancestors(sire_id, current_generation + 1)
-            if dam_id:
-                explore_ancestors(dam_id, current_generation + 1)
+            # Continue to parents if within generation limit
+            if generation < max_generations:
+                for parent_id in links:
+                    if parent_id:
+                        next_level[parent_id] = next_level.get(parent_id, 0) + paths
+        
+        if not next_level:
+            break
+        level = next_level
     
-    # Start exploration from the given dog
-    explore_ancestors(dog_id, 0)
     return ancestors
 
+def _path_count(path_histogram: Dict[int, int]) -> int:
+    """Total number of paths in a {path_length: number_of_paths} histogram"""
+    return sum(path_histogram.values())
+
 def _interpret_coi(coi_percentage: float) -> Dict[str, str]:
     """Interpret COI percentage and provide guidance"""
     if coi_percentage == 0.0:
@@ -179,11 +455,12 @@ def _interpret_coi(coi_percentage: float) -> Dict[str, str]:
             "color": "#6f42c1"  # Purple
         }
 
-def detect_pedigree_inbreeding(dog: Dog, generations: int = 4) -> Dict[str, List[Dict]]:
+def detect_pedigree_inbreeding(dog: Dog, generations: int = 4, db: Optional[Session] = None) -> Dict[str, List[Dict]]:
     """
     Detect inbreeding by finding common ancestors in pedigree up to specified generations.
     Uses the same logic as calculate_inbreeding_coefficient to ensure consistency.
     Returns dictionary with inbred dogs and their highlight colors.
+    Pass the caller's session; without one a short-lived session is opened and closed here.
     """
     # Use the same helper function as COI calculation
     sire_id = getattr(dog, 'sire_id', None)
@@ -192,16 +469,24 @@ def detect_pedigree_inbreeding(dog: Dog, generations: int = 4) -> Dict[str, List
     if not sire_id or not dam_id:
         return {}
     
-    # Import here to avoid circular imports
-    from database import get_db
-    db = next(get_db())
+    if db is None:
+        # Import here to avoid circular imports
+        from database import SessionLocal
+        session = SessionLocal()
+        try:
+            return detect_pedigree_inbreeding(dog, generations, session)
+        finally:
+            session.close()
     
     # Get ancestors from both sides using same logic as COI
     sire_ancestors = _get_ancestors_with_paths(sire_id, db, generations, "sire")
     dam_ancestors = _get_ancestors_with_paths(dam_id, db, generations, "dam")
-    
-    # Find common ancestors
-    common_ancestor_ids = set(sire_ancestors.keys()) & set(dam_ancestors.keys())
+    return inbreeding_highlights(db, sire_ancestors, dam_ancestors)
+
+def inbreeding_highlights(db: Session, sire_ancestors: Dict[int, Dict[int, int]], dam_ancestors: Dict[int, Dict[int, int]]) -> Dict[str, Dict]:
+    """Highlight colors for the common ancestors of already loaded sire and dam path histograms"""
+    # Find common ancestors (in id order, so colors are stable between requests)
+    common_ancestor_ids = sorted(set(sire_ancestors.keys()) & set(dam_ancestors.keys()))
     
     if not common_ancestor_ids:
         return {}
@@ -216,19 +501,23 @@ def detect_pedigree_inbreeding(dog: Dog, generations: int = 4) -> Dict[str, List
         '#F0E6FF',  # Light purple
         '#FFFFE6',  # Light yellow
     ]
+    ancestor_dogs = {
+        ancestor_dog.id: ancestor_dog
+        for ancestor_dog in db.query(Dog).filter(Dog.id.in_(common_ancestor_ids)).all()
+    }
     
     color_index = 0
     for ancestor_id in common_ancestor_ids:
         # Get ancestor details
-        ancestor_dog = db.query(Dog).filter(Dog.id == ancestor_id).first()
+        ancestor_dog = ancestor_dogs.get(ancestor_id)
         if not ancestor_dog:
             continue
             
         highlight_color = highlight_colors[color_index % len(highlight_colors)]
         
         # Count total occurrences (sum of paths from both sides)
-        sire_paths_count = len(sire_ancestors[ancestor_id])
-        dam_paths_count = len(dam_ancestors[ancestor_id])
+        sire_paths_count = _path_count(sire_ancestors[ancestor_id])
+        dam_paths_count = _path_count(dam_ancestors[ancestor_id])
         total_occurrences = sire_paths_count + dam_paths_count
         
         inbred_ancestors[str(ancestor_id)] = {  # Convert to string key for template
@@ -245,29 +534,30 @@ def detect_pedigree_inbreeding(dog: Dog, generations: int = 4) -> Dict[str, List
 
 def get_pedigree_completeness(dog: Dog, db: Session, generations: int = 3) -> Dict[str, float]:
     """
-    Calculate pedigree completeness percentage for specified generations
+    Calculate pedigree completeness percentage for specified generations.
+    Counts the dog itself plus every known ancestor against all 2^(g+1)-1 positions.
     """
-    def count_ancestors(current_dog: Dog, current_gen: int, max_gen: int) -> tuple:
-        if current_gen > max_gen or not current_dog:
-            return 0, 0
+    graph = get_parent_graph(db)
+    
+    def count_known(current_dog_id: Optional[int], current_gen: int) -> int:
+        if current_gen > generations or not current_dog_id or current_dog_id not in graph:
+            return 0
         
-        # Count this dog as known
+        # Count this dog as known, then its ancestors
         known = 1
-        total = 1
+        if current_gen < generations:
+            sire_id, dam_id = graph.parents(current_dog_id)
+            known += count_known(sire_id, current_gen + 1) + count_known(dam_id, current_gen + 1)
         
-        if current_gen < max_gen:
-            # Count ancestors
-            sire_known, sire_total = count_ancestors(current_dog.sire, current_gen + 1, max_gen)
-            dam_known, dam_total = count_ancestors(current_dog.dam, current_gen + 1, max_gen)
-            
-            known += sire_known + dam_known
-            total += sire_total + dam_total
-        
-        return known, total
+        return known
     
-    known_ancestors, total_possible = count_ancestors(dog, 0, generations)
+    return completeness_summary(count_known(dog.id, 0), generations)
+
+def completeness_summary(known_ancestors: int, generations: int) -> Dict[str, float]:
+    """Completeness percentage for a count of known pedigree positions (dog included)"""
+    total_possible = 2 ** (generations + 1) - 1
     
-    if total_possible == 0:
+    if known_ancestors == 0:
         return {"percentage": 0.0, "known": 0, "total": 0}
     
     percentage = (known_ancestors / total_possible) * 100
@@ -278,6 +568,84 @@ def get_pedigree_completeness(dog: Dog, db: Session, generations: int = 3) -> Di
         "total": total_possible
     }
 
+class PedigreeAnalysis:
+    """
+    Request-scoped pedigree analysis: loads a dog's pedigree (Ahnentafel + ancestor matrix)
+    and its parents' ancestor path histograms once, on the caller's session, and serves
+    common-ancestor highlighting, completeness, COI and per-ancestor COI for it.
+    """
+    
+    def __init__(self, db: Session, dog: Dog, generations: int = 4, offload: bool = False):
+        self.db = db
+        self.dog = dog
+        self.generations = generations
+        self.offload = offload  # Per-ancestor COI in the compute process pool (async handlers)
+        self._parent_paths = {}
+        self._coi_summaries = None
+    
+    @classmethod
+    def load(cls, db: Session, dog_id: int, generations: int = 4, offload: bool = False) -> Optional["PedigreeAnalysis"]:
+        """Analysis for a dog with its pedigree laid out to the given depth (None if not found)"""
+        dog = crud.get_dog_pedigree(db, dog_id=dog_id, generations=generations)
+        return None if dog is None else cls(db, dog, generations, offload)
+    
+    @property
+    def ahnentafel(self) -> List[Optional[dict]]:
+        return getattr(self.dog, 'ahnentafel', None) or [None] * (2 ** (self.generations + 1))
+    
+    @property
+    def pedigree_data(self) -> Optional[dict]:
+        return getattr(self.dog, 'pedigree_data', None)
+    
+    @property
+    def ancestor_matrix(self) -> Dict:
+        return getattr(self.dog, 'ancestor_matrix', {})
+    
+    def parent_paths(self, generations: int):
+        """(sire, dam) ancestor path histograms, loaded once per depth; None without both parents"""
+        if not self.dog.sire_id or not self.dog.dam_id:
+            return None
+        if generations not in self._parent_paths:
+            self._parent_paths[generations] = (
+                _get_ancestors_with_paths(self.dog.sire_id, self.db, generations, "sire"),
+                _get_ancestors_with_paths(self.dog.dam_id, self.db, generations, "dam")
+            )
+        return self._parent_paths[generations]
+    
+    def coi(self, generations: int = 5) -> Dict[str, Any]:
+        """Same result as calculate_inbreeding_coefficient(dog, db, generations)"""
+        return calculate_mating_coefficient(self.dog.sire_id, self.dog.dam_id, self.db, generations=generations)
+    
+    def inbreeding_highlights(self, generations: Optional[int] = None) -> Dict[str, Dict]:
+        """Same result as detect_pedigree_inbreeding(dog, generations)"""
+        paths = self.parent_paths(self.generations if generations is None else generations)
+        return {} if paths is None else inbreeding_highlights(self.db, paths[0], paths[1])
+    
+    def completeness(self, generations: Optional[int] = None) -> Dict[str, float]:
+        """Same result as get_pedigree_completeness(dog, db, generations), read from the Ahnentafel"""
+        generations = self.generations if generations is None else generations
+        if generations > self.generations:
+            return get_pedigree_completeness(self.dog, self.db, generations)
+        known = sum(1 for node in self.ahnentafel[1:2 ** (generations + 1)] if node is not None)
+        return completeness_summary(known, generations)
+    
+    def coi_summaries(self) -> Dict[int, Dict[str, Any]]:
+        """get_coi_summaries for every dog in the pedigree, fetched once"""
+        if self._coi_summaries is None:
+            dog_ids = [node["id"] for node in self.ahnentafel if node is not None]
+            self._coi_summaries = get_coi_summaries(self.db, dog_ids, offload=self.offload)
+        return self._coi_summaries
+    
+    def annotate_inbreeding(self) -> List[Optional[dict]]:
+        """Add coi_percentage and inbred_level to every node of the Ahnentafel, at any depth"""
+        summaries = self.coi_summaries()
+        for node in self.ahnentafel:
+            if node is not None:
+                coi_percentage = summaries.get(node["id"], {}).get("coi_percentage", 0.0)
+                node["coi_percentage"] = coi_percentage
+                node["inbred_level"] = _inbred_level(coi_percentage)
+        return self.ahnentafel
+
 def get_health_summary(dog: Dog) -> Dict[str, str]:
     """
     Get a summary of health test results for a dog
@@ -307,56 +675,54 @@ def search_related_dogs(dog: Dog, db: Session, relationship_type: str = "all") -
     """
     Find related dogs (siblings, half-siblings, offspring)
     """
-    related_dogs = []
+    graph = get_parent_graph(db)
+    related_ids = []
     
     if relationship_type in ["all", "siblings", "half-siblings"]:
         # Find full siblings (same sire and dam)
         if dog.sire_id and dog.dam_id:
-            full_siblings = db.query(Dog).filter(
-                Dog.sire_id == dog.sire_id,
-                Dog.dam_id == dog.dam_id,
-                Dog.id != dog.id
-            ).all()
-            related_dogs.extend(full_siblings)
+            related_ids.extend(sorted(
+                sibling_id for sibling_id in graph.offspring(dog.sire_id)
+                if sibling_id != dog.id and graph.parents(sibling_id) == (dog.sire_id, dog.dam_id)
+            ))
         
         # Find half-siblings (same sire OR same dam, but not both)
         if relationship_type in ["all", "half-siblings"]:
             if dog.sire_id:
-                paternal_siblings = db.query(Dog).filter(
-                    Dog.sire_id == dog.sire_id,
-                    Dog.dam_id != dog.dam_id,
-                    Dog.id != dog.id
-                ).all()
-                related_dogs.extend(paternal_siblings)
+                related_ids.extend(sorted(
+                    sibling_id for sibling_id in graph.offspring(dog.sire_id)
+                    if sibling_id != dog.id and _is_other_parent(graph.parents(sibling_id)[1], dog.dam_id)
+                    and graph.parents(sibling_id)[0] == dog.sire_id
+                ))
             
             if dog.dam_id:
-                maternal_siblings = db.query(Dog).filter(
-                    Dog.dam_id == dog.dam_id,
-                    Dog.sire_id != dog.sire_id,
-                    Dog.id != dog.id
-                ).all()
-                related_dogs.extend(maternal_siblings)
+                related_ids.extend(sorted(
+                    sibling_id for sibling_id in graph.offspring(dog.dam_id)
+                    if sibling_id != dog.id and _is_other_parent(graph.parents(sibling_id)[0], dog.sire_id)
+                    and graph.parents(sibling_id)[1] == dog.dam_id
+                ))
     
     if relationship_type in ["all", "offspring"]:
-        # Find offspring where this dog is the sire
-        if dog.sex == "Male":
-            offspring_as_sire = db.query(Dog).filter(Dog.sire_id == dog.id).all()
-            related_dogs.extend(offspring_as_sire)
-        
-        # Find offspring where this dog is the dam
-        if dog.sex == "Female":
-            offspring_as_dam = db.query(Dog).filter(Dog.dam_id == dog.id).all()
-            related_dogs.extend(offspring_as_dam)
-    
-    # Remove duplicates
-    unique_dogs = []
-    seen_ids = set()
-    for related_dog in related_dogs:
-        if related_dog.id not in seen_ids:
-            unique_dogs.append(related_dog)
-            seen_ids.add(related_dog.id)
-    
-    return unique_dogs
+        # Find offspring where this dog is the sire / dam
+        parent_slot = {"Male": 0, "Female": 1}.get(dog.sex)
+        if parent_slot is not None:
+            related_ids.extend(sorted(
+                child_id for child_id in graph.offspring(dog.id)
+                if graph.parents(child_id)[parent_slot] == dog.id
+            ))
+    
+    # Remove duplicates, keeping the first occurrence
+    unique_ids = list(dict.fromkeys(related_ids))
+    if not unique_ids:
+        return []
+    
+    # Load all related dogs in one query and keep the order above
+    dogs_by_id = {related_dog.id: related_dog for related_dog in db.query(Dog).filter(Dog.id.in_(unique_ids)).all()}
+    return [dogs_by_id[related_id] for related_id in unique_ids if related_id in dogs_by_id]
+
+def _is_other_parent(parent_id: Optional[int], own_parent_id: Optional[int]) -> bool:
+    """Half-sibling check: the other parent must be known and differ from the dog's own"""
+    return parent_id is not None and parent_id != own_parent_id
 
 def calculate_age_from_birth_date(birth_date) -> Optional[str]:
     """